@@ -0,0 +1,210 @@
+import argparse
+import os
+import re
+import time
+
+import pandas as pd
+
+from columnar_storage import apply_filters
+from derived_columns import calendar_codes
+
+# Default location of the persisted cube
+DEFAULT_CUBE_PATH = 'retail_cube.pkl'
+
+CUBE_DIMENSIONS = ['Year', 'Quarter', 'Month', 'Country', 'CustomerID', 'StockCode']
+
+# Materialised cuboids, each at the grain of its dimensions; queries read the
+# smallest one that holds every dimension they group, filter or count by
+CUBOID_DIMENSIONS = {
+    'customer': ['Year', 'Quarter', 'Month', 'Country', 'CustomerID'],
+    'product': ['Year', 'Quarter', 'Month', 'Country', 'StockCode'],
+    'base': CUBE_DIMENSIONS,
+}
+
+# Distinct (cell, invoice) pairs behind the Unique_Orders count
+INVOICE_DIMENSIONS = ['Year', 'Quarter', 'Month', 'Country', 'CustomerID', 'InvoiceNo']
+
+# Additive measures stored in every cuboid
+CELL_SUMS = {'Revenue': 'Revenue', 'Quantity': 'Quantity', 'Lines': 'InvoiceNo'}
+
+# Query measure name -> (cube column, aggregation)
+CUBE_MEASURES = {
+    'Total_Revenue': ('Revenue', 'sum'),
+    'Total_Quantity': ('Quantity', 'sum'),
+    'Line_Items': ('Lines', 'sum'),
+    'Unique_Orders': ('InvoiceNo', 'nunique'),
+    'Unique_Customers': ('CustomerID', 'nunique'),
+    'Unique_Products': ('StockCode', 'nunique'),
+}
+
+
+def _cube_keys(df):
+    """Dimension and measure columns of the cleaned rows, with calendar fields from InvoiceDate"""
+    codes, calendar = calendar_codes(df['InvoiceDate'])
+    keys = pd.DataFrame({
+        'Year': calendar.year.take(codes),
+        'Quarter': calendar.quarter.take(codes),
+        'Month': calendar.month.take(codes),
+    }, index=df.index)
+    for col in ['Country', 'CustomerID', 'StockCode', 'InvoiceNo', 'Revenue', 'Quantity']:
+        keys[col] = df[col]
+    return keys
+
+
+def _roll_up(cells, dimensions):
+    """Sum a cuboid up to a coarser set of dimensions"""
+    return (cells.groupby(dimensions, sort=False, dropna=False, observed=True)[list(CELL_SUMS)]
+            .sum().reset_index())
+
+
+def build_cube(df):
+    """
+    Build the aggregate cube from cleaned rows (InvoiceDate, Country,
+    CustomerID, StockCode, InvoiceNo, Revenue, Quantity).
+
+    Revenue, quantity and line counts are summed per cell of each cuboid;
+    distinct customers and products are counted from the cuboids' own
+    dimension values and distinct orders from the stored (cell, invoice)
+    pairs, so every measure stays exact and cubes from separate partitions
+    can be merged with merge_cubes.
+    """
+    keys = _cube_keys(df)
+    base = (keys.groupby(CUBE_DIMENSIONS, sort=False, dropna=False, observed=True)
+            .agg(**{name: (col, 'sum' if name != 'Lines' else 'size') for name, col in CELL_SUMS.items()})
+            .reset_index())
+
+    return {
+        'cuboids': {
+            'customer': _roll_up(base, CUBOID_DIMENSIONS['customer']),
+            'product': _roll_up(base, CUBOID_DIMENSIONS['product']),
+            'base': base,
+        },
+        'invoices': keys[INVOICE_DIMENSIONS].drop_duplicates().reset_index(drop=True),
+        'metadata': {
+            'rows': len(df),
+            'first_invoice': str(df['InvoiceDate'].min()),
+            'last_invoice': str(df['InvoiceDate'].max()),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+    }
+
+
+def merge_cubes(cubes):
+    """Merge cubes built from disjoint partitions of the rows"""
+    cubes = list(cubes)
+    return {
+        'cuboids': {name: _roll_up(pd.concat([cube['cuboids'][name] for cube in cubes], ignore_index=True), dims)
+                    for name, dims in CUBOID_DIMENSIONS.items()},
+        'invoices': pd.concat([cube['invoices'] for cube in cubes], ignore_index=True).drop_duplicates()
+                      .reset_index(drop=True),
+        'metadata': {
+            'rows': sum(cube['metadata']['rows'] for cube in cubes),
+            'first_invoice': min(cube['metadata']['first_invoice'] for cube in cubes),
+            'last_invoice': max(cube['metadata']['last_invoice'] for cube in cubes),
+            'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+    }
+
+
+def save_cube(cube, path=DEFAULT_CUBE_PATH):
+    """Persist the cube atomically"""
+    pd.to_pickle(cube, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def load_cube(path=DEFAULT_CUBE_PATH):
+    """Load a persisted cube"""
+    return pd.read_pickle(path)
+
+
+def _aggregate(table, by, spec):
+    """
+    Named aggregation per group of by, or one row of totals when by is empty.
+    Groups with a missing key (anonymous customers) are left out, as in the
+    question tables; the totals still include their rows.
+    """
+    if by:
+        return table.groupby(by, sort=True, dropna=True, observed=True).agg(**spec)
+    return pd.DataFrame({name: [getattr(table[col], func)()] for name, (col, func) in spec.items()})
+
+
+def query_cube(cube, by=None, measures=None, filters=None, sort_by=None, ascending=False, limit=None):
+    """
+    Answer a slice-and-dice question from the cube without the raw rows.
+
+    by lists the dimensions to group on, filters uses read_columnar-style
+    tuples such as [('Year', '==', 2011), ('Country', '!=', 'United Kingdom')],
+    and measures defaults to every measure in CUBE_MEASURES. The result has
+    one row per group, sorted by sort_by when given and cut to limit rows;
+    rows missing a grouped dimension (e.g. CustomerID) form no group.
+    """
+    by = list(by or [])
+    measures = list(CUBE_MEASURES) if measures is None else list(measures)
+    filters = list(filters or [])
+    referenced = set(by) | {col for col, _, _ in filters}
+
+    unknown = sorted(referenced - set(CUBE_DIMENSIONS)) + sorted(set(measures) - set(CUBE_MEASURES))
+    if unknown:
+        raise ValueError(f"Not in the cube: {', '.join(unknown)}")
+
+    tables = []
+    cell_measures = {name: CUBE_MEASURES[name] for name in measures if name != 'Unique_Orders'}
+    if cell_measures:
+        needed = referenced | {col for col, func in cell_measures.values() if func == 'nunique'}
+        candidates = [name for name, dims in CUBOID_DIMENSIONS.items() if needed <= set(dims)]
+        cells = min((cube['cuboids'][name] for name in candidates), key=len)
+        tables.append(_aggregate(apply_filters(cells, filters), by, cell_measures))
+
+    if 'Unique_Orders' in measures:
+        if 'StockCode' in referenced:
+            raise ValueError("Unique_Orders cannot be grouped or filtered by StockCode")
+        invoices = apply_filters(cube['invoices'], filters)
+        tables.append(_aggregate(invoices, by, {'Unique_Orders': CUBE_MEASURES['Unique_Orders']}))
+
+    result = pd.concat(tables, axis=1).fillna(0) if len(tables) > 1 else tables[0]
+    result = result[measures]
+    if by:
+        result = result.reset_index()
+    if sort_by is not None:
+        result = result.sort_values(sort_by, ascending=ascending, kind='stable')
+    if limit is not None:
+        result = result.head(limit)
+    return result.reset_index(drop=True)
+
+
+def _parse_filter(text):
+    """Parse 'Column op value' (e.g. "Quarter == 3") into a filter tuple"""
+    match = re.fullmatch(r"\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(.+?)\s*", text)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"Expected 'Column op value', got {text!r}")
+    col, op, value = match.groups()
+    for cast in (int, float):
+        try:
+            return col, op, cast(value)
+        except ValueError:
+            pass
+    return col, op, value.strip('\'"')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the persisted retail aggregate cube")
+    parser.add_argument('--cube', default=DEFAULT_CUBE_PATH)
+    parser.add_argument('--by', nargs='*', default=[], choices=CUBE_DIMENSIONS)
+    parser.add_argument('--measures', nargs='+', choices=list(CUBE_MEASURES))
+    parser.add_argument('--where', action='append', type=_parse_filter, default=[],
+                        help="filter such as \"Quarter == 3\"; repeat to combine")
+    parser.add_argument('--sort-by')
+    parser.add_argument('--ascending', action='store_true')
+    parser.add_argument('--top', type=int)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    result = query_cube(load_cube(args.cube), args.by, args.measures, args.where,
+                        args.sort_by, args.ascending, args.top)
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import numpy as np
+import pandas as pd
+
+from distinct_sketch import (
+    sketch_precision, hash_registers, reduce_registers, estimate_counts, dense_registers, estimate_dense
+)
+
+# Grouping keys shared by the Q1-Q4 reports, the Power BI datasets and the insights report
+DEFAULT_GROUP_KEYS = ['Country', 'CustomerID', 'YearMonth']
+
+# Output column -> (source column, aggregation); 'sum', 'nunique' and the
+# HyperLogLog 'approx_nunique' (see distinct_sketch.approximate_metrics) are supported
+DEFAULT_METRICS = {
+    'Total_Revenue': ('Revenue', 'sum'),
+    'Total_Quantity': ('Quantity', 'sum'),
+    'Unique_Orders': ('InvoiceNo', 'nunique'),
+    'Unique_Customers': ('CustomerID', 'nunique'),
+    'Unique_Products': ('StockCode', 'nunique'),
+}
+
+# Columns that are constant within a group and carried along with it (first non-null value)
+DEFAULT_ATTRIBUTES = {
+    'CustomerID': ['Country'],
+    'YearMonth': ['Year', 'Month', 'MonthName'],
+}
+
+
+def compute_aggregates(df, group_keys=None, metrics=None, attributes=None, rows=None):
+    """
+    Compute every requested metric for every grouping key in a single scan
+    of the cleaned frame.
+
+    Each key and each distinct-count column is factorized exactly once; sums
+    are then grouped on the integer codes and distinct counts are taken from
+    the unique (group code, value code) pairs, so no per-question filter
+    copies or repeated hash-based groupbys are needed.
+
+    Returns a dict mapping each grouping key to a DataFrame (key column,
+    attribute columns, metric columns, sorted by key like ``groupby``) plus
+    a ``'totals'`` entry holding the same metrics over the whole frame.
+    'approx_nunique' metrics are HyperLogLog estimates from the hashed values.
+
+    rows (a boolean mask or row positions, e.g. from row_subsets.RowSubsets)
+    restricts the aggregation to a subset without copying the frame: rows
+    outside it get no group code, so the result equals aggregating the
+    filtered frame.
+    """
+    group_keys = DEFAULT_GROUP_KEYS if group_keys is None else group_keys
+    metrics = DEFAULT_METRICS if metrics is None else metrics
+    attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+
+    sum_metrics = {name: col for name, (col, func) in metrics.items() if func == 'sum'}
+    distinct_metrics = {name: col for name, (col, func) in metrics.items() if func == 'nunique'}
+    sketch_metrics = {name: (col, sketch_precision(func)) for name, (col, func) in metrics.items()
+                      if sketch_precision(func) is not None}
+    unsupported = [name for name, (col, func) in metrics.items()
+                   if func not in ('sum', 'nunique') and name not in sketch_metrics]
+    if unsupported:
+        raise ValueError(f"Unsupported aggregation for metrics: {unsupported}")
+
+    # Factorize every distinct-count column once; the codes are reused by all keys
+    value_codes = {}
+    for col in set(distinct_metrics.values()):
+        codes, uniques = pd.factorize(df[col], sort=False)
+        value_codes[col] = (codes, len(uniques))
+
+    # Hash every sketched column once per precision; the registers are reused by all keys
+    value_registers = {spec: hash_registers(df[spec[0]], spec[1]) for spec in set(sketch_metrics.values())}
+
+    selected = _row_selection(rows, len(df))
+
+    results = {}
+    for key in group_keys:
+        key_codes, key_values = pd.factorize(df[key], sort=True)
+        if selected is not None:
+            key_codes, key_values = _restrict_codes(key_codes, key_values, selected)
+        n_groups = len(key_values)
+
+        # Rows with a missing key are dropped, matching groupby's default
+        grouper = pd.Categorical.from_codes(key_codes, categories=pd.RangeIndex(n_groups))
+        carried = [col for col in attributes.get(key, []) if col in df.columns and col != key]
+        agg_spec = {col: 'first' for col in carried}
+        agg_spec.update({col: 'sum' for col in sum_metrics.values()})
+
+        grouped = df[list(agg_spec)].groupby(grouper, observed=False).agg(agg_spec)
+
+        table = pd.DataFrame({key: key_values})
+        for col in carried:
+            table[col] = grouped[col].to_numpy()
+        for name, col in sum_metrics.items():
+            table[name] = grouped[col].to_numpy()
+        for name, col in distinct_metrics.items():
+            codes, n_values = value_codes[col]
+            table[name] = _count_distinct_pairs(key_codes, codes, n_groups, n_values)
+        for name, (col, precision) in sketch_metrics.items():
+            registers, ranks, valid = value_registers[(col, precision)]
+            table[name] = _estimate_distinct(key_codes[valid], registers, ranks, n_groups, precision)
+        results[key] = table
+
+    if selected is None:
+        totals = {name: df[col].sum() for name, col in sum_metrics.items()}
+        totals.update({name: value_codes[col][1] for name, col in distinct_metrics.items()})
+        totals.update({name: estimate_dense(dense_registers(df[col], precision))
+                       for name, (col, precision) in sketch_metrics.items()})
+    else:
+        totals = {name: df[col][selected].sum() for name, col in sum_metrics.items()}
+        for name, col in distinct_metrics.items():
+            codes, n_values = value_codes[col]
+            totals[name] = np.count_nonzero(np.bincount(codes[selected & (codes >= 0)], minlength=n_values))
+        totals.update({name: estimate_dense(dense_registers(df[col][selected], precision))
+                       for name, (col, precision) in sketch_metrics.items()})
+    results['totals'] = totals
+
+    return results
+
+
+def _row_selection(rows, n_rows):
+    """Boolean mask of the selected rows, or None when every row is selected"""
+    if rows is None:
+        return None
+    rows = np.asarray(rows)
+    if rows.dtype == bool:
+        return rows
+    selected = np.zeros(n_rows, dtype=bool)
+    selected[rows] = True
+    return selected
+
+
+def _restrict_codes(key_codes, key_values, selected):
+    """
+    Key codes with unselected rows and groups left without rows removed,
+    keeping key order; the codes are rewritten in place, so no row-length
+    temporaries are allocated.
+    """
+    key_codes[~selected] = -1
+    present = np.bincount(key_codes + 1, minlength=len(key_values) + 1)[1:] > 0
+    if present.all():
+        return key_codes, key_values
+    # The trailing -1 entry keeps missing codes missing: take wraps index -1 to it
+    remap = np.append(np.cumsum(present) - 1, -1)
+    np.take(remap, key_codes, out=key_codes, mode='wrap')
+    return key_codes, key_values[present]
+
+
+def _count_distinct_pairs(key_codes, value_codes, n_groups, n_values):
+    """Count distinct non-null values per group from factorized codes"""
+    valid = (key_codes >= 0) & (value_codes >= 0)
+    pairs = key_codes[valid].astype(np.int64) * n_values + value_codes[valid]
+    unique_pairs = pd.unique(pairs)
+    return np.bincount(unique_pairs // max(n_values, 1), minlength=n_groups)
+
+
+def _estimate_distinct(key_codes, registers, ranks, n_groups, precision):
+    """HyperLogLog distinct-count estimate per group from per-row registers"""
+    present = key_codes >= 0
+    codes, _, maxima = reduce_registers(key_codes[present], registers[present], ranks[present], precision)
+    return estimate_counts(codes, maxima, n_groups, precision)
+
+
+def _sketch_pairs(keys, values, precision):
+    """Maximum rank per (key, register) hit by the non-null values, as a frame"""
+    registers, ranks, valid = hash_registers(values, precision)
+    key_codes, key_values = pd.factorize(keys[valid])
+    present = key_codes >= 0
+    codes, registers, maxima = reduce_registers(key_codes[present], registers[present], ranks[present], precision)
+    return pd.DataFrame({keys.name: key_values.take(codes), 'Register': registers, 'Rank': maxima})
+
+
+def exclude_country(table, country='United Kingdom'):
+    """Drop one country from a per-country aggregate table"""
+    return table[table['Country'] != country].reset_index(drop=True)
+
+
+def partial_aggregates(df, group_keys=None, metrics=None, attributes=None):
+    """
+    Build mergeable aggregation state for one chunk or partition.
+
+    Sums and carried attributes are kept per group; distinct counts are kept
+    as the unique (group, value) pairs so that partials from different
+    chunks can be merged exactly before the counts are taken. Approximate
+    distinct counts keep HyperLogLog registers instead (at most 2**precision
+    per group), which merge by taking the maximum rank.
+    """
+    group_keys = DEFAULT_GROUP_KEYS if group_keys is None else group_keys
+    metrics = DEFAULT_METRICS if metrics is None else metrics
+    attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+
+    sum_columns = list(dict.fromkeys(col for col, func in metrics.values() if func == 'sum'))
+    distinct_columns = list(dict.fromkeys(col for col, func in metrics.values() if func == 'nunique'))
+    sketch_columns = list(dict.fromkeys((col, sketch_precision(func)) for col, func in metrics.values()
+                                        if sketch_precision(func) is not None))
+
+    state = {'metrics': metrics, 'attributes': {}, 'keys': {}}
+    for key in group_keys:
+        carried = [col for col in attributes.get(key, []) if col in df.columns and col != key]
+        agg_spec = {col: 'first' for col in carried}
+        agg_spec.update({col: 'sum' for col in sum_columns})
+        sums = df[list(agg_spec)].groupby(df[key], sort=True, observed=True).agg(agg_spec)
+
+        distinct = {}
+        for col in distinct_columns:
+            pairs = df[[key, col]].dropna() if key != col else df[[key]].dropna()
+            distinct[col] = pairs.drop_duplicates().reset_index(drop=True)
+        for col, precision in sketch_columns:
+            distinct[(col, precision)] = _sketch_pairs(df[key], df[col], precision)
+
+        state['attributes'][key] = carried
+        state['keys'][key] = {'sums': sums, 'distinct': distinct}
+
+    state['totals'] = {
+        'sums': {col: df[col].sum() for col in sum_columns},
+        'distinct': {col: pd.unique(df[col].dropna().to_numpy()) for col in distinct_columns},
+    }
+    state['totals']['distinct'].update({spec: dense_registers(df[spec[0]], spec[1]) for spec in sketch_columns})
+    return state
+
+
+def merge_partials(states):
+    """Merge partial aggregation states from several chunks or partitions"""
+    states = list(states)
+    first = states[0]
+    merged = {'metrics': first['metrics'], 'attributes': first['attributes'], 'keys': {}}
+
+    for key, carried in first['attributes'].items():
+        sums = pd.concat([state['keys'][key]['sums'] for state in states])
+        agg_spec = {col: ('first' if col in carried else 'sum') for col in sums.columns}
+        sums = sums.groupby(level=0, sort=True, observed=True).agg(agg_spec)
+
+        distinct = {}
+        for col in first['keys'][key]['distinct']:
+            pairs = pd.concat([state['keys'][key]['distinct'][col] for state in states], ignore_index=True)
+            if isinstance(col, tuple):
+                distinct[col] = (pairs.groupby([key, 'Register'], sort=False, observed=True)['Rank']
+                                 .max().reset_index())
+            else:
+                distinct[col] = pairs.drop_duplicates().reset_index(drop=True)
+
+        merged['keys'][key] = {'sums': sums, 'distinct': distinct}
+
+    merged['totals'] = {
+        'sums': {col: sum(state['totals']['sums'][col] for state in states)
+                 for col in first['totals']['sums']},
+        'distinct': {col: (np.maximum.reduce([state['totals']['distinct'][col] for state in states])
+                           if isinstance(col, tuple) else
+                           pd.unique(np.concatenate([state['totals']['distinct'][col] for state in states])))
+                     for col in first['totals']['distinct']},
+    }
+    return merged
+
+
+def finalize_partials(state):
+    """Turn merged partial state into the same tables compute_aggregates returns"""
+    metrics = state['metrics']
+    results = {}
+    for key, part in state['keys'].items():
+        sums = part['sums']
+        table = pd.DataFrame({key: sums.index})
+        for col in state['attributes'][key]:
+            table[col] = sums[col].to_numpy()
+        for name, (col, func) in metrics.items():
+            precision = sketch_precision(func)
+            if func == 'sum':
+                table[name] = sums[col].to_numpy()
+            elif precision is not None:
+                sketch = part['distinct'][(col, precision)]
+                codes = sums.index.get_indexer(sketch[key])
+                table[name] = estimate_counts(codes, sketch['Rank'].to_numpy(), len(sums), precision)
+            else:
+                pairs = part['distinct'][col]
+                counts = pairs[key].value_counts()
+                table[name] = counts.reindex(sums.index, fill_value=0).to_numpy()
+        results[key] = table
+
+    totals = {}
+    for name, (col, func) in metrics.items():
+        precision = sketch_precision(func)
+        if func == 'sum':
+            totals[name] = state['totals']['sums'][col]
+        elif precision is not None:
+            totals[name] = estimate_dense(state['totals']['distinct'][(col, precision)])
+        else:
+            totals[name] = len(state['totals']['distinct'][col])
+    results['totals'] = totals
+
+    return results
+
+
+def partial_memory_usage(state):
+    """Approximate bytes held by a partial aggregation state"""
+    total = 0
+    for part in state['keys'].values():
+        total += part['sums'].memory_usage(deep=True, index=True).sum()
+        total += sum(pairs.memory_usage(deep=True, index=False).sum() for pairs in part['distinct'].values())
+    total += sum(values.nbytes for values in state['totals']['distinct'].values())
+    return int(total)
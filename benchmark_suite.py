@@ -0,0 +1,454 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+from pipeline_profiler import PipelineProfiler
+from synthetic_data import write_synthetic_source
+
+# Generated sources and per-benchmark working files live here, one directory per size/seed
+BENCHMARK_DIR = '.benchmarks'
+
+# One JSON line per benchmark run, appended so runs can be compared over time
+DEFAULT_RESULTS_PATH = 'benchmark_results.jsonl'
+
+DEFAULT_SIZES = [500_000]
+
+# Raw source name the report scripts read (the workbook name cannot hold more than ~1M rows)
+SOURCE_CSV = 'online_retail_data.csv'
+MASTER_CSV = 'Master_Cleaned_Retail_Data.csv'
+
+# Cleaned frame the memory check's workers start from, pickled next to the synthetic source
+CLEANED_PICKLE = 'cleaned_frame.pkl'
+
+# Peak RSS the question subsets may add, as a fraction of the cleaned frame,
+# beyond aggregating the whole frame; each filtered copy would add up to one frame
+MAX_SUBSET_OVERHEAD = 0.1
+
+# Entry modules whose cold import the startup check times; the plotting stack on its own for reference
+STARTUP_MODULES = ['pandas', 'retail_analysis', 'business_insights', 'retail_cli', 'chart_rendering',
+                   'matplotlib.figure']
+
+
+def _retail_frame(use_cache):
+    """Cleaned frame of retail_analysis.py"""
+    from retail_analysis import load_and_clean_data
+    return load_and_clean_data(use_cache=use_cache)
+
+
+def _prepared_frame(use_cache):
+    """Cleaned frame with derived fields of powerbi_tableau_prep.py, read from the synthetic CSV"""
+    import powerbi_tableau_prep
+    powerbi_tableau_prep.SOURCE_FILE = SOURCE_CSV
+    return powerbi_tableau_prep.prepare_data_for_powerbi_tableau(use_cache=use_cache)
+
+
+def _setup_load_and_clean_data(use_cache):
+    return (lambda: _retail_frame(use_cache)), None
+
+
+def _setup_prepare_data_for_powerbi_tableau(use_cache):
+    return (lambda: _prepared_frame(use_cache)), None
+
+
+def _setup_question(name):
+    def setup(use_cache):
+        import retail_analysis
+        question = getattr(retail_analysis, name)
+        df_clean = _retail_frame(use_cache)
+        return (lambda: question(df_clean, render=False)), len(df_clean)
+    return setup
+
+
+def _setup_create_question_specific_datasets(use_cache):
+    from powerbi_tableau_prep import create_question_specific_datasets
+    df_clean = _prepared_frame(use_cache)
+    return (lambda: create_question_specific_datasets(df_clean)), len(df_clean)
+
+
+def _setup_generate_business_insights(use_cache):
+    from business_insights import generate_business_insights
+    if not os.path.exists(MASTER_CSV):
+        _prepared_frame(use_cache).to_csv(MASTER_CSV, index=False)
+    return generate_business_insights, None
+
+
+def _setup_clean_and_aggregate(workers):
+    """Clean, derive and aggregate the loaded raw frame serially (workers=None) or partitioned"""
+    def setup(use_cache):
+        from aggregation_engine import compute_aggregates
+        from parallel_execution import run_partitioned
+        from powerbi_tableau_prep import add_derived_fields
+        from source_cache import load_source
+        from streaming_ingest import clean_chunk
+        raw, _ = load_source(SOURCE_CSV, use_cache=use_cache)
+        if workers is None:
+            return (lambda: compute_aggregates(add_derived_fields(clean_chunk(raw)))), len(raw)
+        return (lambda: run_partitioned(raw, add_derived_fields, workers=workers)[0]), len(raw)
+    return setup
+
+
+def _setup_lazy_question_plans(use_cache):
+    """Q1-Q4 aggregates collected from the raw source as one optimized batch of query plans"""
+    from query_plan import collect_all
+    from retail_analysis import analysis_plans
+    plans = analysis_plans(SOURCE_CSV, use_cache=use_cache)
+    questions = {name: plans[name] for name in ['q1', 'q2', 'q3', 'q4']}
+    return (lambda: collect_all(questions)), None
+
+
+def _setup_export(engine):
+    """Write the prepared frame as the master CSV plus its 2011 subset with export_csv on one engine"""
+    def setup(use_cache):
+        from csv_export import export_csv
+        df_clean = _prepared_frame(use_cache)
+        targets = {f'export_{engine}.csv': None, f'export_{engine}_2011.csv': (df_clean['Year'] == 2011).to_numpy()}
+        return (lambda: export_csv(df_clean, targets, engine=engine)), len(df_clean)
+    return setup
+
+
+def _setup_top_customers(method):
+    """Top 10 customers by revenue from the cleaned frame: full per-customer table sorted, or top_k_groups"""
+    def setup(use_cache):
+        from aggregation_engine import compute_aggregates
+        from top_k import top_k_groups
+        df_clean = _retail_frame(use_cache)
+        if method == 'sort':
+            return (lambda: compute_aggregates(df_clean, ['CustomerID'])['CustomerID']
+                    .sort_values('Total_Revenue', ascending=False).head(10)), len(df_clean)
+        return (lambda: top_k_groups(df_clean, 'CustomerID', 'Revenue', 10)), len(df_clean)
+    return setup
+
+
+def _setup_customer_analytics(method):
+    """
+    RFM inputs, monthly cohort counts and purchase intervals from the cleaned
+    frame: pandas groupbys per metric, or one CSR customer index shared by all
+    """
+    def setup(use_cache):
+        from customer_analytics import CustomerIndex
+        df_clean = _retail_frame(use_cache)
+        if method == 'index':
+            def indexed():
+                index = CustomerIndex(df_clean)
+                return index.rfm(), index.cohort_retention(), index.purchase_intervals()
+            return indexed, len(df_clean)
+
+        def grouped():
+            rows = df_clean[df_clean['CustomerID'].notna()]
+            customers = rows.groupby('CustomerID')
+            rfm = customers.agg(Last=('InvoiceDate', 'max'), Frequency=('InvoiceNo', 'nunique'),
+                                Monetary=('Revenue', 'sum'))
+            months = rows['InvoiceDate'].dt.to_period('M').astype('int64')
+            cohorts = months.groupby(rows['CustomerID']).transform('min')
+            pairs = pd.DataFrame({'Cohort': cohorts, 'Since': months - cohorts, 'CustomerID': rows['CustomerID']})
+            cohort_counts = pairs.groupby(['Cohort', 'Since'])['CustomerID'].nunique().unstack(fill_value=0)
+            purchases = (rows.groupby(['CustomerID', 'InvoiceNo'])['InvoiceDate'].min().reset_index()
+                         .sort_values(['CustomerID', 'InvoiceDate', 'InvoiceNo']))
+            purchases['Gap'] = purchases.groupby('CustomerID')['InvoiceDate'].diff() / pd.Timedelta(days=1)
+            intervals = purchases.groupby('CustomerID')['Gap'].agg(['mean', 'min', 'max'])
+            return rfm, cohort_counts, intervals
+        return grouped, len(df_clean)
+    return setup
+
+
+# Benchmark name -> setup(use_cache) returning (timed callable, input rows or None for the raw source)
+BENCHMARKS = {
+    'load_and_clean_data': _setup_load_and_clean_data,
+    'prepare_data_for_powerbi_tableau': _setup_prepare_data_for_powerbi_tableau,
+    'question_1_time_series_2011': _setup_question('question_1_time_series_2011'),
+    'question_2_top_countries': _setup_question('question_2_top_countries'),
+    'question_3_top_customers': _setup_question('question_3_top_customers'),
+    'question_4_demand_by_country': _setup_question('question_4_demand_by_country'),
+    'create_question_specific_datasets': _setup_create_question_specific_datasets,
+    'generate_business_insights': _setup_generate_business_insights,
+    'lazy_question_plans': _setup_lazy_question_plans,
+    'export_csv_arrow': _setup_export('arrow'),
+    'export_csv_pandas': _setup_export('pandas'),
+    'clean_and_aggregate_serial': _setup_clean_and_aggregate(None),
+    'run_partitioned_w2': _setup_clean_and_aggregate(2),
+    'run_partitioned_w4': _setup_clean_and_aggregate(4),
+    'run_partitioned_w8': _setup_clean_and_aggregate(8),
+    'top_customers_sort': _setup_top_customers('sort'),
+    'top_customers_top_k': _setup_top_customers('top_k'),
+    'customer_analytics_pandas': _setup_customer_analytics('pandas'),
+    'customer_analytics_index': _setup_customer_analytics('index'),
+}
+
+
+def _run_in_worker(name, data_dir, n_rows, use_cache, trace_allocations):
+    """Set up and time one benchmark inside a fresh worker process"""
+    os.chdir(data_dir)
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        target, rows_in = BENCHMARKS[name](use_cache)
+        profiler = PipelineProfiler(trace_allocations=trace_allocations)
+        with profiler.stage(name, rows_in=n_rows if rows_in is None else rows_in) as record:
+            result = target()
+            if isinstance(result, pd.DataFrame):
+                record['rows_out'] = len(result)
+
+    record['rows_per_second'] = record['rows_in'] / record['wall_seconds'] if record['wall_seconds'] else None
+    record['peak_rss_mb'] = profiler.report()['peak_rss_mb']
+    return record
+
+
+def prepare_benchmark_data(n_rows, seed=0, benchmark_dir=BENCHMARK_DIR):
+    """Directory holding the synthetic source for this size and seed, generated on first use"""
+    data_dir = os.path.abspath(os.path.join(benchmark_dir, f"rows_{n_rows}_seed_{seed}"))
+    source = os.path.join(data_dir, SOURCE_CSV)
+    if not os.path.exists(source):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {n_rows:,} synthetic transactions (seed {seed})...")
+        write_synthetic_source(source + '.tmp', n_rows, seed=seed)
+        os.replace(source + '.tmp', source)
+    return data_dir
+
+
+def _git_commit():
+    """Current commit of the working tree, or None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _environment():
+    """Software and hardware the run was measured on"""
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes=None, names=None, seed=0, use_cache=False, trace_allocations=False,
+                   benchmark_dir=BENCHMARK_DIR, results_path=DEFAULT_RESULTS_PATH, label=None):
+    """
+    Time the pipeline entry points on synthetic data and append the results.
+
+    Each benchmark runs in its own worker process, so its peak RSS covers
+    only its own setup and call. use_cache=False times the cold parse of the
+    raw source; use_cache=True reuses the source cache after its first
+    build. Returns the run record that was appended to results_path.
+    """
+    sizes = DEFAULT_SIZES if sizes is None else sizes
+    names = list(BENCHMARKS) if names is None else names
+    unknown = sorted(set(names) - set(BENCHMARKS))
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    run = {
+        'run_id': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': label,
+        'git_commit': _git_commit(),
+        'environment': _environment(),
+        'seed': seed,
+        'use_cache': use_cache,
+        'trace_allocations': trace_allocations,
+        'results': [],
+    }
+
+    for n_rows in sizes:
+        data_dir = prepare_benchmark_data(n_rows, seed, benchmark_dir)
+        print(f"\n=== {n_rows:,} rows ===")
+        for name in names:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                record = pool.submit(_run_in_worker, name, data_dir, n_rows, use_cache, trace_allocations).result()
+            record['rows'] = n_rows
+            run['results'].append(record)
+            print(f"{name:<36}{record['wall_seconds']:>9.2f} s{record['rows_per_second'] or 0:>14,.0f} rows/s"
+                  f"{record['peak_rss_mb']:>10,.0f} MB")
+
+    with open(results_path, 'a') as f:
+        f.write(json.dumps(run, default=str) + '\n')
+    print(f"\nResults appended to {results_path}")
+    return run
+
+
+def _subset_memory_in_worker(data_dir, mode):
+    """
+    Peak RSS growth of aggregating every question subset in one way, measured
+    in a fresh process that starts from the pickled cleaned frame: 'full'
+    aggregates the whole frame once per subset (the baseline), 'masks' uses
+    shared row masks and 'copies' materialises filtered copies first.
+    """
+    from aggregation_engine import compute_aggregates
+    from memory_schema import memory_footprint_mb
+    from row_subsets import RowSubsets
+
+    os.chdir(data_dir)
+    df_clean = pd.read_pickle(CLEANED_PICKLE)
+    subsets = RowSubsets(df_clean)
+    masks = {name: subsets.mask(name) for name in subsets.definitions}
+    profiler = PipelineProfiler()
+    before = profiler.report()['peak_rss_mb']
+
+    if mode == 'full':
+        results = [compute_aggregates(df_clean) for _ in masks]
+    elif mode == 'masks':
+        results = [compute_aggregates(df_clean, rows=mask) for mask in masks.values()]
+    else:
+        copies = [df_clean[mask].copy() for mask in masks.values()]
+        results = [compute_aggregates(subset) for subset in copies]
+
+    return {
+        'rows': len(df_clean),
+        'frame_mb': memory_footprint_mb(df_clean),
+        'start_rss_mb': before,
+        'growth_mb': profiler.report()['peak_rss_mb'] - before,
+        'tables': len(results),
+    }
+
+
+def _write_cleaned_frame(data_dir):
+    """Pickle the cleaned frame of the synthetic source so memory workers start from one copy of it"""
+    os.chdir(data_dir)
+    if not os.path.exists(CLEANED_PICKLE):
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            _retail_frame(use_cache=True).to_pickle(CLEANED_PICKLE)
+
+
+def check_subset_memory(n_rows, seed=0, benchmark_dir=BENCHMARK_DIR, max_overhead=MAX_SUBSET_OVERHEAD):
+    """
+    Check that the question subsets keep peak RSS close to one copy of the
+    cleaned frame: aggregating every subset through shared row masks may
+    raise the peak by at most max_overhead of the frame size more than
+    aggregating the whole frame does. Filtered copies are measured for
+    comparison. Returns the measurements with a 'passed' flag.
+    """
+    data_dir = prepare_benchmark_data(n_rows, seed, benchmark_dir)
+    result = {}
+    for mode in ['prepare', 'full', 'masks', 'copies']:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            if mode == 'prepare':
+                pool.submit(_write_cleaned_frame, data_dir).result()
+            else:
+                result[mode] = pool.submit(_subset_memory_in_worker, data_dir, mode).result()
+
+    frame_mb = result['full']['frame_mb']
+    overhead = {mode: (result[mode]['growth_mb'] - result['full']['growth_mb']) / frame_mb
+                for mode in ['masks', 'copies']}
+    result.update(rows=result['full']['rows'], frame_mb=frame_mb, masks_overhead=overhead['masks'],
+                  copies_overhead=overhead['copies'], passed=overhead['masks'] <= max_overhead)
+
+    print(f"Cleaned frame: {result['rows']:,} rows, {frame_mb:,.0f} MB "
+          f"(process RSS with the frame loaded {result['full']['start_rss_mb']:,.0f} MB)")
+    for mode, label in [('full', 'Whole frame per subset'), ('masks', 'Shared row masks'),
+                        ('copies', 'Filtered copies')]:
+        print(f"{label:<24} peak RSS +{result[mode]['growth_mb']:>8,.0f} MB")
+    print(f"Extra over whole-frame aggregation: masks {overhead['masks']:.0%}, "
+          f"copies {overhead['copies']:.0%} of the frame")
+    print(f"Memory check {'passed' if result['passed'] else 'FAILED'} (limit {max_overhead:.0%})")
+    return result
+
+
+def check_startup(modules=None, repeats=5):
+    """
+    Cold-start cost of each entry module: wall time of a fresh interpreter
+    that imports it and exits (the median of repeats), and whether the
+    import loads matplotlib. Non-chart jobs should pay for pandas only.
+    """
+    rows = []
+    for module in modules or STARTUP_MODULES:
+        seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', f"import sys, {module}; print('matplotlib' in sys.modules)"],
+                                    capture_output=True, text=True, check=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            seconds.append(time.perf_counter() - start)
+        rows.append({'module': module, 'cold_start_seconds': float(np.median(seconds)),
+                     'loads_matplotlib': output.strip() == 'True'})
+    table = pd.DataFrame(rows)
+    print(table.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    return table
+
+
+def load_results(results_path=DEFAULT_RESULTS_PATH):
+    """All recorded runs, oldest first"""
+    with open(results_path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_runs(results_path=DEFAULT_RESULTS_PATH, baseline=-2, candidate=-1):
+    """
+    Per-benchmark comparison of two recorded runs (by default the last two):
+    wall time, throughput and peak memory with the candidate/baseline ratio.
+    """
+    runs = load_results(results_path) if os.path.exists(results_path) else []
+    if not (-len(runs) <= baseline < len(runs) and -len(runs) <= candidate < len(runs)):
+        raise ValueError(f"{results_path} holds {len(runs)} recorded run(s); "
+                         "record at least two benchmark runs before comparing")
+    base, new = runs[baseline], runs[candidate]
+    base_results = {(r['stage'], r['rows']): r for r in base['results']}
+
+    rows = []
+    for result in new['results']:
+        previous = base_results.get((result['stage'], result['rows']))
+        if previous is None:
+            continue
+        rows.append({
+            'benchmark': result['stage'],
+            'rows': result['rows'],
+            'base_seconds': previous['wall_seconds'],
+            'new_seconds': result['wall_seconds'],
+            'speedup': previous['wall_seconds'] / result['wall_seconds'],
+            'base_peak_mb': previous['peak_rss_mb'],
+            'new_peak_mb': result['peak_rss_mb'],
+        })
+    comparison = pd.DataFrame(rows)
+
+    print(f"Baseline: {base['run_id']} ({base.get('label') or base.get('git_commit')})")
+    print(f"Candidate: {new['run_id']} ({new.get('label') or new.get('git_commit')})")
+    print(comparison.to_string(index=False, float_format=lambda x: f"{x:,.2f}"))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the retail pipelines on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="source sizes to benchmark, e.g. 500000 5000000 50000000")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), help="subset to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--use-cache', action='store_true', help="time loads from the warm source cache")
+    parser.add_argument('--trace-allocations', action='store_true', help="also record tracemalloc peaks")
+    parser.add_argument('--label', help="name stored with the run, e.g. a branch")
+    parser.add_argument('--results', default=DEFAULT_RESULTS_PATH)
+    parser.add_argument('--compare', action='store_true', help="compare the last two recorded runs and exit")
+    parser.add_argument('--memory-check', action='store_true',
+                        help="check the question subsets stay close to one copy of the cleaned frame and exit")
+    parser.add_argument('--startup-check', action='store_true',
+                        help="time cold imports of the entry modules in fresh interpreters and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        try:
+            compare_runs(args.results)
+        except ValueError as error:
+            parser.exit(1, f"{error}\n")
+        return
+    if args.startup_check:
+        check_startup()
+        return
+    if args.memory_check:
+        results = [check_subset_memory(n_rows, args.seed) for n_rows in args.rows]
+        if not all(result['passed'] for result in results):
+            raise SystemExit(1)
+        return
+    run_benchmarks(args.rows, args.benchmarks, args.seed, args.use_cache, args.trace_allocations,
+                   results_path=args.results, label=args.label)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,53 @@
+import os
+
 import pandas as pd
 import numpy as np
 
-def generate_business_insights():
-    """Generate comprehensive business insights for CEO and CMO based on analysis"""
+from aggregation_engine import compute_aggregates, exclude_country, DEFAULT_METRICS
+from distinct_sketch import approximate_metrics
+from columnar_storage import read_cleaned_data
+from top_k import top_k
+from source_cache import source_fingerprint
+from column_cache import open_column_cache
+from derived_columns import add_date_dimensions, DATE_DIMENSIONS
+from result_cache import code_version
+from csv_export import compressed_path, COMPRESSION_SUFFIXES
+from powerbi_tableau_prep import SOURCE_FILE, COLUMN_CACHE_NAME, PREPARATION_MODULES
+
+# Columns the insights actually use; everything else is skipped at read time
+INSIGHT_COLUMNS = [
+    'InvoiceNo', 'StockCode', 'Quantity', 'CustomerID', 'Country',
+    'Revenue', 'Year', 'Month', 'MonthName', 'YearMonth'
+]
+
+# Date dimensions the insights read that the question frame of retail_analysis.py lacks
+INSIGHT_DIMENSIONS = {name: DATE_DIMENSIONS[name] for name in ('MonthName', 'YearMonth')}
+
+# Master datasets powerbi_tableau_prep.py may have written, in any storage format or compression
+MASTER_FILES = (['Master_Cleaned_Retail_Data.parquet'] +
+                [compressed_path('Master_Cleaned_Retail_Data.csv', compression)
+                 for compression in [None] + list(COMPRESSION_SUFFIXES.values())])
+
+def latest_master_file():
+    """The most recently written master dataset, so an older run's other format is never read"""
+    existing = [path for path in MASTER_FILES if os.path.exists(path)]
+    return max(existing, key=os.path.getmtime) if existing else MASTER_FILES[1]
+
+def insights_frame(df_clean):
+    """The INSIGHT_COLUMNS of a retail_analysis.py cleaned frame, deriving the date dimensions it lacks"""
+    columns = [col for col in INSIGHT_COLUMNS if col in df_clean.columns]
+    return add_date_dimensions(df_clean[columns + ['InvoiceDate']], INSIGHT_DIMENSIONS)
+
+def generate_business_insights(data_path=None, distinct_error=None, df=None):
+    """
+    Generate comprehensive business insights for CEO and CMO based on analysis
+
+    distinct_error (e.g. 0.01) reports HyperLogLog estimates instead of exact
+    unique counts. Without data_path the prepared frame is memory-mapped
+    from the shared column cache when powerbi_tableau_prep.py has cached it
+    for the current workbook. df, a cleaned frame already in memory with
+    the INSIGHT_COLUMNS (e.g. held by report_service.py), skips loading.
+    """
     
     print("RETAIL DATA ANALYSIS - BUSINESS INSIGHTS REPORT")
     print("=" * 60)
@@ -10,17 +55,30 @@ def generate_business_insights():
     print("Analysis Period: December 2010 - December 2011")
     print("=" * 60)
     
-    # Load the cleaned data
-    df = pd.read_csv('Master_Cleaned_Retail_Data.csv')
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    # Load the cleaned data: the prep script's memory-mapped columns while its
+    # workbook is unchanged, otherwise the newest columnar or (compressed) CSV master file
+    if df is None and data_path is None:
+        if os.path.exists(SOURCE_FILE):
+            df = open_column_cache(COLUMN_CACHE_NAME, source_fingerprint(SOURCE_FILE),
+                                   columns=INSIGHT_COLUMNS, categorical=True,
+                                   code=code_version(*PREPARATION_MODULES))
+        data_path = latest_master_file()
+    if df is None:
+        df = read_cleaned_data(data_path, columns=INSIGHT_COLUMNS)
+    
+    # Every section below reads from one shared aggregation pass
+    metrics = None if distinct_error is None else approximate_metrics(DEFAULT_METRICS, distinct_error)
+    aggregates = compute_aggregates(df, metrics=metrics)
+    countries = exclude_country(aggregates['Country'])
     
     # Question 1 Insights: 2011 Revenue Trends
     print("\n🔍 QUESTION 1 INSIGHTS: 2011 SEASONAL REVENUE TRENDS")
     print("-" * 50)
     
-    df_2011 = df[df['Year'] == 2011]
-    monthly_revenue = df_2011.groupby(['Month', 'MonthName'])['Revenue'].sum().reset_index()
-    monthly_revenue = monthly_revenue.sort_values('Month')
+    monthly = aggregates['YearMonth']
+    monthly_revenue = monthly[monthly['Year'] == 2011][['Month', 'MonthName', 'Total_Revenue']]
+    monthly_revenue.columns = ['Month', 'MonthName', 'Revenue']
+    monthly_revenue = monthly_revenue.sort_values('Month').reset_index(drop=True)
     
     peak_month = monthly_revenue.loc[monthly_revenue['Revenue'].idxmax()]
     low_month = monthly_revenue.loc[monthly_revenue['Revenue'].idxmin()]
@@ -47,12 +105,9 @@ def generate_business_insights():
     print("\n\n🌍 QUESTION 2 INSIGHTS: INTERNATIONAL MARKET OPPORTUNITIES")
     print("-" * 50)
     
-    intl_data = df[df['Country'] != 'United Kingdom'].groupby('Country').agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'CustomerID': 'nunique'
-    }).reset_index()
-    intl_data = intl_data.sort_values('Revenue', ascending=False).head(10)
+    intl_data = countries[['Country', 'Total_Revenue', 'Total_Quantity', 'Unique_Customers']]
+    intl_data.columns = ['Country', 'Revenue', 'Quantity', 'CustomerID']
+    intl_data = top_k(intl_data, 10, 'Revenue')
     
     print("🏆 TOP 3 INTERNATIONAL MARKETS:")
     for i, row in intl_data.head(3).iterrows():
@@ -75,15 +130,11 @@ def generate_business_insights():
     print("\n\n👥 QUESTION 3 INSIGHTS: HIGH-VALUE CUSTOMER ANALYSIS")
     print("-" * 50)
     
-    customer_data = df[df['CustomerID'].notna()].groupby('CustomerID').agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'InvoiceNo': 'nunique',
-        'Country': 'first'
-    }).reset_index()
-    customer_data = customer_data.sort_values('Revenue', ascending=False)
+    customer_data = aggregates['CustomerID'][['CustomerID', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Country']]
+    customer_data.columns = ['CustomerID', 'Revenue', 'Quantity', 'InvoiceNo', 'Country']
     
-    top_10_customers = customer_data.head(10)
+    # Only the leading customers are ordered; the totals need no ranking
+    top_10_customers = top_k(customer_data, 10, 'Revenue')
     top_10_revenue = top_10_customers['Revenue'].sum()
     total_customer_revenue = customer_data['Revenue'].sum()
     
@@ -92,7 +143,7 @@ def generate_business_insights():
     print(f"🔄 Average orders per top customer: {top_10_customers['InvoiceNo'].mean():.1f}")
     
     # Customer concentration risk
-    top_1_customer = customer_data.iloc[0]
+    top_1_customer = top_10_customers.iloc[0]
     print(f"⚠️  Top customer concentration: {top_1_customer['Revenue']/total_customer_revenue*100:.2f}% of revenue")
     
     print("\n💡 CMO RECOMMENDATIONS:")
@@ -105,18 +156,17 @@ def generate_business_insights():
     print("\n\n🚀 QUESTION 4 INSIGHTS: MARKET EXPANSION STRATEGY")
     print("-" * 50)
     
-    expansion_data = df[df['Country'] != 'United Kingdom'].groupby('Country').agg({
-        'Quantity': 'sum',
-        'Revenue': 'sum',
-        'InvoiceNo': 'nunique',
-        'CustomerID': 'nunique'
-    }).reset_index()
+    expansion_data = countries[['Country', 'Total_Quantity', 'Total_Revenue', 'Unique_Orders', 'Unique_Customers']].rename(columns={
+        'Total_Quantity': 'Quantity',
+        'Total_Revenue': 'Revenue',
+        'Unique_Orders': 'InvoiceNo',
+        'Unique_Customers': 'CustomerID'
+    })
     
     expansion_data['Avg_Order_Value'] = expansion_data['Revenue'] / expansion_data['InvoiceNo']
     expansion_data['Customer_Penetration'] = expansion_data['CustomerID'] / expansion_data['InvoiceNo']
-    expansion_data = expansion_data.sort_values('Quantity', ascending=False)
     
-    high_demand_countries = expansion_data.head(5)
+    high_demand_countries = top_k(expansion_data, 5, 'Quantity')
     
     print("🎯 HIGHEST DEMAND MARKETS (by quantity):")
     for i, row in high_demand_countries.iterrows():
@@ -129,7 +179,7 @@ def generate_business_insights():
         (expansion_data['Avg_Order_Value'] / expansion_data['Avg_Order_Value'].max()) * 0.3
     )
     
-    top_expansion = expansion_data.nlargest(5, 'Expansion_Score')
+    top_expansion = top_k(expansion_data, 5, 'Expansion_Score')
     
     print(f"\n🏅 TOP EXPANSION OPPORTUNITIES (composite score):")
     for i, row in top_expansion.iterrows():
@@ -146,15 +196,15 @@ def generate_business_insights():
     print("\n\n📋 STRATEGIC SUMMARY & ACTION PLAN")
     print("=" * 60)
     
-    total_revenue = df['Revenue'].sum()
-    uk_revenue = df[df['Country'] == 'United Kingdom']['Revenue'].sum()
+    total_revenue = aggregates['totals']['Total_Revenue']
+    uk_revenue = aggregates['Country'].loc[aggregates['Country']['Country'] == 'United Kingdom', 'Total_Revenue'].sum()
     intl_percentage = (1 - uk_revenue/total_revenue) * 100
     
     print(f"📊 Current Business Metrics:")
     print(f"   • Total Revenue: £{total_revenue:,.0f}")
     print(f"   • International Revenue: {intl_percentage:.1f}% of total")
-    print(f"   • Customer Base: {df['CustomerID'].nunique():,} unique customers")
-    print(f"   • Geographic Reach: {df['Country'].nunique()} countries")
+    print(f"   • Customer Base: {aggregates['totals']['Unique_Customers']:,} unique customers")
+    print(f"   • Geographic Reach: {len(aggregates['Country'])} countries")
     
     print(f"\n🎯 IMMEDIATE ACTIONS (Next 90 Days):")
     print("   1. Implement Q4 inventory planning for seasonal surge")
@@ -0,0 +1,240 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# matplotlib is imported inside the renderers, so importing this module for its
+# constants and paths (as every non-chart job does) never loads the plotting stack
+
+DEFAULT_DPI = 300
+DEFAULT_FORMAT = 'png'
+
+# Output file name (without extension) for each question's chart
+CHART_FILES = {
+    'q1': 'Q1_2011_Monthly_Revenue_Trend',
+    'q2': 'Q2_Top_10_Countries_Revenue_Quantity',
+    'q3': 'Q3_Top_10_Customers_Revenue',
+    'q4': 'Q4_Country_Demand_Analysis',
+}
+
+
+def _chart_style():
+    """Preferred seaborn-like matplotlib style available in this installation"""
+    from matplotlib import style
+    for name in ('seaborn-v0_8', 'seaborn'):
+        if name in style.available:
+            return name
+    return 'default'
+
+
+def _new_figure(figsize):
+    """Figure attached to an Agg canvas, independent of pyplot's global state"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _palette(cmap_name, n_colors):
+    """Evenly spaced colours from a colormap, excluding its extremes (as seaborn does)"""
+    from matplotlib import colormaps
+    return colormaps[cmap_name](np.linspace(0, 1, n_colors + 2)[1:-1])
+
+
+def render_monthly_revenue_trend(monthly_revenue, path, dpi=DEFAULT_DPI, year=2011):
+    """Q1 line chart of monthly revenue in year with the peak month annotated"""
+    from matplotlib import style
+    from matplotlib.ticker import FuncFormatter
+
+    with style.context(_chart_style()):
+        fig = _new_figure((14, 8))
+        ax = fig.add_subplot()
+        ax.plot(monthly_revenue['Month_Date'], monthly_revenue['Revenue'],
+                marker='o', linewidth=3, markersize=8, color='#2E86AB')
+
+        ax.set_title(f'Monthly Revenue Trend for {year}\nSeasonal Analysis for CEO Forecasting',
+                     fontsize=16, fontweight='bold', pad=20)
+        ax.set_xlabel('Month', fontsize=12, fontweight='bold')
+        ax.set_ylabel('Revenue (£)', fontsize=12, fontweight='bold')
+
+        # Format y-axis to show values in millions
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
+        ax.tick_params(axis='x', labelrotation=45)
+        ax.grid(True, alpha=0.3)
+
+        # Highlight seasonal trends with annotations
+        max_month = monthly_revenue.loc[monthly_revenue['Revenue'].idxmax()]
+        ax.annotate(f'Peak: {max_month["YearMonth"]}\n£{max_month["Revenue"]/1e6:.1f}M',
+                    xy=(max_month['Month_Date'], max_month['Revenue']),
+                    xytext=(10, 10), textcoords='offset points',
+                    bbox=dict(boxstyle='round,pad=0.5', fc='yellow', alpha=0.7),
+                    arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0'))
+
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def render_top_countries(top_countries, path, dpi=DEFAULT_DPI, top=10, exclude='United Kingdom'):
+    """Q2 dual-axis chart of revenue bars and quantity line for the top countries outside exclude"""
+    from matplotlib import style
+    from matplotlib.ticker import FuncFormatter
+
+    with style.context(_chart_style()):
+        fig = _new_figure((14, 8))
+        ax1 = fig.add_subplot()
+        positions = range(len(top_countries))
+
+        # Revenue bars
+        ax1.bar(positions, top_countries['Revenue'], color='#A23B72', alpha=0.7, label='Revenue')
+        ax1.set_xlabel('Country', fontsize=12, fontweight='bold')
+        ax1.set_ylabel('Revenue (£)', fontsize=12, fontweight='bold', color='#A23B72')
+        ax1.tick_params(axis='y', labelcolor='#A23B72')
+        ax1.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
+
+        # Quantity line on secondary axis
+        ax2 = ax1.twinx()
+        ax2.plot(positions, top_countries['Quantity'],
+                 color='#F18F01', marker='o', linewidth=3, markersize=8, label='Quantity')
+        ax2.set_ylabel('Quantity Sold', fontsize=12, fontweight='bold', color='#F18F01')
+        ax2.tick_params(axis='y', labelcolor='#F18F01')
+
+        ax1.set_xticks(positions)
+        ax1.set_xticklabels(top_countries['Country'], rotation=45, ha='right')
+
+        ax2.set_title(f'Top {top} Countries by Revenue and Quantity Sold\n(Excluding {exclude})',
+                      fontsize=16, fontweight='bold', pad=20)
+        ax1.legend(loc='upper left')
+        ax2.legend(loc='upper right')
+        ax2.grid(True, alpha=0.3)
+
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def render_top_customers(top_customers, path, dpi=DEFAULT_DPI, top=10):
+    """Q3 horizontal bar chart of the top customers (expects ascending revenue)"""
+    from matplotlib import style
+    from matplotlib.ticker import FuncFormatter
+
+    with style.context(_chart_style()):
+        fig = _new_figure((12, 8))
+        ax = fig.add_subplot()
+        positions = range(len(top_customers))
+        ax.barh(positions, top_customers['Revenue'], color=_palette('viridis', len(top_customers)))
+
+        ax.set_xlabel('Revenue (£)', fontsize=12, fontweight='bold')
+        ax.set_ylabel('Customer ID', fontsize=12, fontweight='bold')
+        ax.set_title(f'Top {top} Revenue Generating Customers\n(Highest to Lowest Revenue)',
+                     fontsize=16, fontweight='bold', pad=20)
+
+        ax.set_yticks(positions)
+        ax.set_yticklabels([f'Customer {int(cid)}' for cid in top_customers['CustomerID']])
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, p: f'£{x/1e3:.0f}K'))
+
+        # Add value labels on bars
+        for i, revenue in enumerate(top_customers['Revenue']):
+            ax.text(revenue + 1000, i, f'£{revenue/1e3:.0f}K', va='center', fontweight='bold')
+
+        ax.grid(True, alpha=0.3, axis='x')
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+def render_country_demand(country_demand, path, dpi=DEFAULT_DPI, exclude='United Kingdom'):
+    """Q4 bubble chart of revenue vs quantity outside exclude, bubble size = unique orders"""
+    from matplotlib import style
+    from matplotlib.ticker import FuncFormatter
+
+    country_demand = country_demand.sort_values('Country')
+    with style.context(_chart_style()):
+        fig = _new_figure((16, 10))
+        ax = fig.add_subplot()
+        ax.scatter(country_demand['Total_Revenue'],
+                   country_demand['Total_Quantity'],
+                   s=country_demand['Unique_Orders'] / 10,
+                   alpha=0.7,
+                   c=range(len(country_demand)),
+                   cmap='tab20')
+
+        for country, revenue, quantity in zip(country_demand['Country'],
+                                              country_demand['Total_Revenue'],
+                                              country_demand['Total_Quantity']):
+            ax.annotate(country, (revenue, quantity), xytext=(5, 5), textcoords='offset points',
+                        fontsize=9, fontweight='bold')
+
+        ax.set_xlabel('Total Revenue (£)', fontsize=12, fontweight='bold')
+        ax.set_ylabel('Total Quantity Demanded', fontsize=12, fontweight='bold')
+        ax.set_title('Product Demand Analysis by Country\n(Bubble size represents number of unique orders)\n'
+                     f'Excluding {exclude}', fontsize=16, fontweight='bold', pad=20)
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda x, p: f'{x/1e3:.0f}K'))
+
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    return path
+
+
+CHART_RENDERERS = {
+    'q1': render_monthly_revenue_trend,
+    'q2': render_top_countries,
+    'q3': render_top_customers,
+    'q4': render_country_demand,
+}
+
+
+def chart_path(question, output_dir='.', fmt=DEFAULT_FORMAT):
+    """Output path of a question's chart"""
+    return os.path.join(output_dir, f"{CHART_FILES[question]}.{fmt}")
+
+
+def render_jobs(jobs, workers=None, dpi=DEFAULT_DPI, fmt=DEFAULT_FORMAT, cache=None):
+    """
+    Render (question, table, path, params) jobs, params being the keyword
+    arguments of the question's renderer (e.g. {'year': 2010}).
+
+    Each figure is built with the object-oriented API in its own worker
+    process, so wall time approaches that of the slowest chart; workers=1
+    renders in-process. cache (a result_cache.ResultCache) restores the
+    charts whose table contents, parameters, dpi, format and rendering code
+    are unchanged, and only the others are rendered. Returns the paths.
+    """
+    jobs = list(jobs)
+    pending = list(range(len(jobs)))
+    if cache is not None:
+        from result_cache import code_version, frame_fingerprint
+        code = code_version('chart_rendering')
+        keys = [{'question': question, 'table': frame_fingerprint(table), 'params': params, 'dpi': dpi,
+                 'fmt': fmt, 'path': path, 'code': code}
+                for question, table, path, params in jobs]
+        pending = [i for i in pending if not cache.get('render', keys[i])[0]]
+
+    workers = min(len(pending), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        for i in pending:
+            question, table, path, params = jobs[i]
+            CHART_RENDERERS[question](table, path, dpi, **params)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(CHART_RENDERERS[jobs[i][0]], jobs[i][1], jobs[i][2], dpi, **jobs[i][3])
+                       for i in pending]
+            for future in futures:
+                future.result()
+
+    if cache is not None:
+        for i in pending:
+            cache.put('render', keys[i], files=[jobs[i][2]])
+    return [path for _, _, path, _ in jobs]
+
+
+def render_charts(tables, workers=None, dpi=DEFAULT_DPI, fmt=DEFAULT_FORMAT, output_dir='.', cache=None):
+    """
+    Render the charts for the given precomputed tables ({'q1': df, ...})
+    with the default question parameters, in parallel (see render_jobs)
+    """
+    jobs = [(question, table, chart_path(question, output_dir, fmt), {}) for question, table in tables.items()]
+    return render_jobs(jobs, workers, dpi, fmt, cache)
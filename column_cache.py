@@ -0,0 +1,187 @@
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from source_cache import CACHE_DIR, source_fingerprint
+
+# Cleaned frames are cached column by column under CACHE_DIR/columns/<name>/
+COLUMN_CACHE_SUBDIR = 'columns'
+
+# Bump when the cached layout changes so stale entries are rebuilt (code changes are keyed by code_version)
+COLUMN_CACHE_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+DICTIONARIES_NAME = 'dictionaries.pkl'
+
+# Row-label column for frames whose index is not a plain RangeIndex
+INDEX_COLUMN = '__index__'
+
+
+def column_cache_dir(name, cache_dir=CACHE_DIR):
+    """Directory of one cached frame"""
+    return os.path.join(cache_dir, COLUMN_CACHE_SUBDIR, name)
+
+
+def _codes_dtype(n_categories):
+    """Smallest code type, the one pandas itself uses for that many categories"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def encode_column(series):
+    """
+    Storage kind, arrays to save and dictionary of one column: plain numpy
+    columns are saved as they are, nullable ones as values plus mask, and
+    text, object and categorical columns as integer codes into a sorted
+    dictionary of their distinct values.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        return 'categorical', {'codes': codes.astype(_codes_dtype(len(dtype.categories)))}, dtype
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        return 'array', {'values': series.to_numpy()}, None
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'biuf':
+        values = series.array.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        return 'masked', {'values': values, 'mask': series.isna().to_numpy()}, dtype
+    try:
+        codes, uniques = pd.factorize(series, sort=True)
+    except TypeError:
+        # Mixed int/str values (StockCode from Excel) have no total order
+        codes, uniques = pd.factorize(series)
+    return 'dictionary', {'codes': codes.astype(_codes_dtype(len(uniques)))}, (dtype, uniques)
+
+
+def write_column_cache(df, name, fingerprint, code=None, cache_dir=CACHE_DIR):
+    """
+    Save a cleaned frame as one .npy file per column array, plus the string
+    dictionaries and a manifest holding the source fingerprint, the code
+    version of the modules that built the frame (result_cache.code_version)
+    and the frame's attrs. The directory is built aside and swapped in whole, so
+    processes that still have the previous version mapped are unaffected.
+    """
+    target = column_cache_dir(name, cache_dir)
+    building = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    columns, dictionaries = [], {}
+    frame = df if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1 \
+        else df.assign(**{INDEX_COLUMN: df.index.to_numpy()})
+    for position, col in enumerate(frame.columns):
+        kind, arrays, dictionary = encode_column(frame[col])
+        for part, values in arrays.items():
+            np.save(os.path.join(building, f"{position}.{part}.npy"), np.ascontiguousarray(values))
+        if dictionary is not None:
+            dictionaries[col] = dictionary
+        columns.append({'name': col, 'kind': kind, 'parts': list(arrays)})
+
+    with open(os.path.join(building, DICTIONARIES_NAME), 'wb') as f:
+        pickle.dump(dictionaries, f, protocol=5)
+    manifest = {
+        'fingerprint': fingerprint,
+        'version': COLUMN_CACHE_VERSION,
+        'code': code,
+        'rows': len(df),
+        'columns': columns,
+        'attrs': df.attrs,
+    }
+    with open(os.path.join(building, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    previous = f"{target}.old-{os.getpid()}"
+    if os.path.exists(target):
+        os.replace(target, previous)
+    os.replace(building, target)
+    shutil.rmtree(previous, ignore_errors=True)
+    return target
+
+
+def _read_manifest(directory):
+    """Manifest of a cached frame, or None when missing or unreadable"""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def decode_column(kind, arrays, dictionary, categorical=False):
+    """Column values over the mapped arrays; only dictionary text is materialised when decoded"""
+    if kind == 'array':
+        return arrays['values']
+    if kind == 'masked':
+        return dictionary.construct_array_type()(arrays['values'], arrays['mask'])
+    if kind == 'categorical':
+        # The codes were validated when written; validating again would copy them
+        return pd.Categorical.from_codes(arrays['codes'], dtype=dictionary, validate=False)
+    dtype, uniques = dictionary
+    if categorical and isinstance(dtype, pd.StringDtype):
+        return pd.Categorical.from_codes(arrays['codes'], categories=uniques, validate=False)
+    return pd.api.extensions.take(uniques, arrays['codes'].astype(np.intp), allow_fill=True)
+
+
+def open_column_cache(name, fingerprint, columns=None, categorical=False, code=None, cache_dir=CACHE_DIR):
+    """
+    Open a cached frame read-only, or return None when there is no entry
+    for this source fingerprint, code version and cache version, so a
+    change to the cleaning or derivation code rebuilds the frame.
+
+    Column arrays are memory-mapped rather than read, so nothing is parsed
+    and every process opening the entry shares the same page-cache pages;
+    pandas' copy-on-write copies a column only if it is modified.
+    categorical=True keeps text columns as categoricals over the mapped
+    codes instead of decoding them into strings per process.
+    """
+    directory = column_cache_dir(name, cache_dir)
+    manifest = _read_manifest(directory)
+    if (manifest is None or manifest.get('fingerprint') != fingerprint
+            or manifest.get('version') != COLUMN_CACHE_VERSION or manifest.get('code') != code):
+        return None
+    with open(os.path.join(directory, DICTIONARIES_NAME), 'rb') as f:
+        dictionaries = pickle.load(f)
+
+    wanted = None if columns is None else set(columns)
+    data, index = {}, pd.RangeIndex(manifest['rows'])
+    for position, column in enumerate(manifest['columns']):
+        col = column['name']
+        if wanted is not None and col not in wanted and col != INDEX_COLUMN:
+            continue
+        # Plain ndarray views of the read-only maps, so pandas treats them like any other array
+        arrays = {part: np.load(os.path.join(directory, f"{position}.{part}.npy"), mmap_mode='r').view(np.ndarray)
+                  for part in column['parts']}
+        data[col] = decode_column(column['kind'], arrays, dictionaries.get(col), categorical)
+    if INDEX_COLUMN in data:
+        index = pd.Index(data.pop(INDEX_COLUMN))
+
+    # Series built without copying keep one block per column, each backed by its map
+    df = pd.DataFrame({col: pd.Series(values, index=index, copy=False) for col, values in data.items()},
+                      copy=False)
+    if columns is not None:
+        df = df[list(columns)]
+    df.attrs.update(manifest['attrs'])
+    return df
+
+
+def cached_frame(name, source_path, build, columns=None, categorical=False, use_cache=True,
+                 code=None, cache_dir=CACHE_DIR):
+    """
+    The cleaned frame of source_path: opened from the column cache while the
+    source and the code version are unchanged, otherwise built with build()
+    and cached. Returns (df, hit).
+    """
+    if not use_cache:
+        return build(), False
+    fingerprint = source_fingerprint(source_path)
+    df = open_column_cache(name, fingerprint, columns, categorical, code, cache_dir)
+    if df is not None:
+        return df, True
+    df = build()
+    write_column_cache(df, name, fingerprint, code, cache_dir)
+    return df if columns is None else df[list(columns)], False
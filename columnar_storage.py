@@ -0,0 +1,125 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_datetimes
+
+# Low-cardinality text columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = ['Country', 'StockCode']
+
+# Rows per Parquet row group; smaller groups give finer predicate pushdown
+ROW_GROUP_SIZE = 64_000
+
+# Comparison operators understood by read_cleaned_data filters
+_FILTER_OPS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v,
+    '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v,
+    '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def _require_pyarrow():
+    """Import pyarrow.parquet or explain how to fall back to CSV"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError(
+            "pyarrow is required for columnar storage; install it or use storage_format='csv'"
+        ) from exc
+    return pq
+
+
+def to_storage_schema(df):
+    """
+    Return a copy of the cleaned frame with the typed storage schema:
+    datetime InvoiceDate, categorical Country/StockCode and nullable
+    integer CustomerID
+    """
+    typed = df.copy()
+    if 'InvoiceDate' in typed.columns:
+        typed['InvoiceDate'] = parse_datetimes(typed['InvoiceDate'])
+    for col in CATEGORICAL_COLUMNS:
+        if col in typed.columns and not isinstance(typed[col].dtype, pd.CategoricalDtype):
+            # StockCode mixes ints and strings when read from Excel
+            typed[col] = typed[col].astype(str).astype('category')
+    if 'CustomerID' in typed.columns:
+        typed['CustomerID'] = typed['CustomerID'].astype('Int64')
+    for col in typed.columns:
+        # Mixed object columns (e.g. CustomerID_Clean holds numbers and 'Unknown') are stored as text
+        if typed[col].dtype == object and pd.api.types.infer_dtype(typed[col], skipna=True).startswith('mixed'):
+            typed[col] = typed[col].astype(str)
+    return typed
+
+
+def write_columnar(df, path):
+    """Write the cleaned frame to a typed, column-oriented Parquet file"""
+    pq = _require_pyarrow()
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(to_storage_schema(df), preserve_index=False)
+    pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE, compression='snappy')
+    return path
+
+
+def read_columnar(path, columns=None, filters=None):
+    """
+    Read a Parquet file written by write_columnar.
+
+    Only the requested columns are decoded and filters such as
+    [('Year', '==', 2011), ('Country', '!=', 'United Kingdom')] are pushed
+    down to the reader, so row groups outside the predicate are skipped.
+    """
+    pq = _require_pyarrow()
+    table = pq.read_table(path, columns=columns, filters=filters or None)
+    return table.to_pandas()
+
+
+def filter_mask(df, filters):
+    """Boolean array of the rows of an in-memory frame matching read_columnar-style filter tuples"""
+    mask = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        mask &= _FILTER_OPS[op](df[col], value).to_numpy(dtype=bool, na_value=False)
+    return mask
+
+
+def apply_filters(df, filters):
+    """Apply read_columnar-style filter tuples to an in-memory frame"""
+    if not filters:
+        return df
+    return df[filter_mask(df, filters)]
+
+
+def read_cleaned_data(path, columns=None, filters=None):
+    """
+    Load a cleaned dataset from Parquet or CSV with the same projection and
+    filter interface; CSV inputs get their InvoiceDate parsed. A directory
+    is read as a partitioned dataset, opening only the partitions the
+    filters can match.
+    """
+    if os.path.isdir(path):
+        from partitioned_output import read_partitioned
+        return read_partitioned(path, columns=columns, filters=filters)
+    if path.endswith('.parquet'):
+        return read_columnar(path, columns=columns, filters=filters)
+
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys(list(columns) + [col for col, _, _ in filters or []]))
+    df = pd.read_csv(path, usecols=usecols)
+    if 'InvoiceDate' in df.columns:
+        df['InvoiceDate'] = parse_datetimes(df['InvoiceDate'])
+    df = apply_filters(df, filters)
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
+def columnar_path(csv_path):
+    """Parquet counterpart of a CSV deliverable path"""
+    return os.path.splitext(csv_path)[0] + '.parquet'
@@ -0,0 +1,206 @@
+import csv
+import gzip
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+# Rows encoded per chunk; each chunk's text is a few tens of MB at the deliverables' width
+DEFAULT_CHUNK_ROWS = 200_000
+
+# Compression levels: fast settings, since the files are rewritten on every run
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# File suffix -> compression, as pandas infers it
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+def compressed_path(path, compression):
+    """path with the suffix of compression ('gzip', 'zstd' or None) appended"""
+    suffixes = {name: suffix for suffix, name in COMPRESSION_SUFFIXES.items()}
+    return path + suffixes[compression] if compression else path
+
+
+def _require_pyarrow_compute():
+    """Import pyarrow and pyarrow.compute, or None when pyarrow is not installed"""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return None
+    return pa, pc
+
+
+def _quote(field):
+    """Quote a formatted field the way csv.QUOTE_MINIMAL does for pandas' dialect"""
+    if any(char in field for char in ',"\r\n'):
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+
+def _format_values(values):
+    """Distinct values formatted (not yet quoted) exactly as DataFrame.to_csv writes them"""
+    text = pd.DataFrame({'value': values}).to_csv(index=False, header=False, lineterminator='\n')
+    return [row[0] if row else '' for row in csv.reader(io.StringIO(text))]
+
+
+def encode_column(series):
+    """
+    Code per row plus the CSV text of each distinct value, with a trailing
+    empty entry that missing values (code -1) are pointed at.
+
+    Values are formatted once per distinct value by pandas itself over the
+    whole column, so the text matches to_csv; floats are told apart by their
+    bit pattern so that 0.0 and -0.0 keep their own spelling.
+    """
+    values = series.to_numpy() if series.dtype == np.float64 else series
+    if series.dtype == np.float64:
+        bits = values.view(np.int64).copy()
+        missing = np.isnan(values)
+        bits[missing] = 0
+        codes, unique_bits = pd.factorize(bits)
+        codes[missing] = -1
+        uniques = unique_bits.view(np.float64)
+    else:
+        codes, uniques = pd.factorize(series)
+    encoded = [_quote(field) for field in _format_values(uniques)] + ['']
+    codes = np.where(codes < 0, len(encoded) - 1, codes)
+    return codes, encoded
+
+
+def _header_line(columns):
+    """Header row as to_csv writes it"""
+    return ','.join(_quote(str(col)) for col in columns) + '\n'
+
+
+def _open_output(path, compression):
+    """Binary file object for path, compressed as requested"""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as exc:
+            raise ImportError("zstandard is required for .zst output; install it or use gzip") from exc
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(open(path, 'wb'))
+    return open(path, 'wb')
+
+
+def _compression_for(path, compression):
+    """Explicit compression, or the one implied by the file suffix for 'infer'"""
+    if compression != 'infer':
+        return compression
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def _arrow_chunks(df, chunk_rows, workers, arrow):
+    """
+    Encoded CSV lines of each chunk of rows, in order, as Arrow string
+    arrays. Chunks are encoded on a thread pool: Arrow's take and
+    element-wise join run without the GIL.
+    """
+    pa, pc = arrow
+    columns = []
+    for index, col in enumerate(df.columns):
+        codes, encoded = encode_column(df[col])
+        if index == len(df.columns) - 1:
+            # The last field of every row carries the line terminator
+            encoded = [field + '\n' for field in encoded]
+        columns.append((codes, pa.array(encoded, type=pa.string())))
+
+    def encode(start):
+        fields = [lookup.take(pa.array(codes[start:start + chunk_rows])) for codes, lookup in columns]
+        return start, pc.binary_join_element_wise(*fields, ',')
+
+    # At most two chunks per worker are in flight, so memory stays bounded by chunk size
+    starts = iter(range(0, len(df), chunk_rows))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(encode, start) for start in islice(starts, 2 * workers))
+        while pending:
+            yield pending.popleft().result()
+            for start in islice(starts, 1):
+                pending.append(pool.submit(encode, start))
+
+
+def _lines_bytes(lines):
+    """Concatenated text of an Arrow string array, without copying it"""
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32, count=len(lines) + 1, offset=lines.offset * 4)
+    return memoryview(lines.buffers()[2])[offsets[0]:offsets[-1]] if len(lines) else b''
+
+
+def export_csv(df, targets, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None, compression='infer', engine='auto'):
+    """
+    Write one or more CSV files from df in a single encoding pass.
+
+    targets maps each output path to a boolean row mask (None for every
+    row), e.g. {'all.csv': None, 'all_2011.csv': df['Year'] == 2011}. Every
+    row is encoded once and written to each file that selects it. The text
+    is identical to DataFrame.to_csv(index=False). Paths ending in .gz or
+    .zst are compressed (compression='gzip'/'zstd'/None overrides that).
+
+    engine='arrow' encodes chunks with pyarrow on workers threads;
+    'pandas' falls back to to_csv per file; 'auto' uses Arrow when it is
+    installed. Returns per-path stats: rows, bytes of CSV text, bytes on
+    disk, seconds and bytes per second.
+    """
+    arrow = _require_pyarrow_compute() if engine in ('auto', 'arrow') else None
+    if engine == 'arrow' and arrow is None:
+        raise ImportError("pyarrow is required for the Arrow CSV engine; install it or use engine='pandas'")
+    workers = workers or min(4, os.cpu_count() or 1)
+    masks = {path: None if mask is None else np.asarray(mask, dtype=bool) for path, mask in targets.items()}
+
+    start = time.perf_counter()
+    if arrow is None:
+        for path, mask in masks.items():
+            subset = df if mask is None else df[mask]
+            subset.to_csv(path, index=False, compression=_compression_for(path, compression))
+        text_bytes = dict.fromkeys(masks)
+        rows = {path: len(df) if mask is None else int(mask.sum()) for path, mask in masks.items()}
+    else:
+        pa = arrow[0]
+        files = {path: _open_output(path, _compression_for(path, compression)) for path in masks}
+        header = _header_line(df.columns).encode()
+        text_bytes = dict.fromkeys(masks, len(header))
+        rows = dict.fromkeys(masks, 0)
+        try:
+            for f in files.values():
+                f.write(header)
+            for chunk_start, lines in _arrow_chunks(df, chunk_rows, workers, arrow):
+                for path, mask in masks.items():
+                    selected = lines if mask is None else lines.filter(
+                        pa.array(mask[chunk_start:chunk_start + len(lines)]))
+                    data = _lines_bytes(selected)
+                    files[path].write(data)
+                    text_bytes[path] += len(data)
+                    rows[path] += len(selected)
+        finally:
+            for f in files.values():
+                f.close()
+    seconds = time.perf_counter() - start
+
+    stats = {}
+    for path in masks:
+        size = text_bytes[path] if text_bytes[path] is not None else os.path.getsize(path)
+        stats[path] = {
+            'rows': rows[path],
+            'bytes': size,
+            'file_bytes': os.path.getsize(path),
+            'seconds': seconds,
+            'bytes_per_second': size / seconds if seconds else None,
+        }
+    return stats
+
+
+def format_export_stats(path, stats):
+    """One-line summary of an exported file: size and throughput"""
+    rate = stats['bytes_per_second']
+    text = f"{os.path.basename(path)} ({stats['bytes'] / 1024 ** 2:,.1f} MB"
+    if stats['file_bytes'] != stats['bytes']:
+        text += f", {stats['file_bytes'] / 1024 ** 2:,.1f} MB compressed"
+    return text + (f", {rate / 1024 ** 2:,.1f} MB/s)" if rate else ")")
@@ -0,0 +1,209 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Quantile bins of the recency/frequency/monetary scores (1 = worst, RFM_BINS = best)
+RFM_BINS = 5
+
+# Files main() writes
+RFM_FILE = 'Customer_RFM_Scores.csv'
+COHORT_FILE = 'Customer_Cohort_Retention.csv'
+INTERVALS_FILE = 'Customer_Purchase_Intervals.csv'
+
+DAY = np.timedelta64(1, 'D')
+
+
+def _quantile_scores(values, bins=RFM_BINS, ascending=True):
+    """
+    Scores 1..bins by rank (ties broken by position, like
+    rank(method='first')), so every bin holds an equal share of customers;
+    ascending=False gives the smallest values the top score
+    """
+    ranks = np.empty(len(values), dtype=np.int64)
+    order = np.argsort(values if ascending else -values, kind='stable')
+    ranks[order] = np.arange(len(values))
+    return (ranks * bins // max(len(values), 1) + 1).astype(np.int8)
+
+
+def _segment_reduce(ufunc, values, offsets):
+    """ufunc.reduceat over the CSR segments offsets[i]:offsets[i+1]; empty segments give NaN"""
+    result = np.full(len(offsets) - 1, np.nan)
+    starts = offsets[:-1]
+    filled = offsets[1:] > starts
+    if filled.any():
+        # Empty segments have no length, so the filled starts alone bound every filled segment
+        result[filled] = ufunc.reduceat(values, starts[filled])
+    return result
+
+
+class CustomerIndex:
+    """
+    Per-customer index over the rows of a cleaned frame, built once.
+
+    Rows with a CustomerID are ordered by customer, invoice date and
+    invoice with one lexsort, so each customer's rows are the contiguous
+    slice offsets[c]:offsets[c + 1] (CSR layout) and come in purchase
+    order. Purchases (distinct invoices) are the first row of each invoice
+    run, with their own offsets. Every metric below is a segment reduction
+    or a shifted comparison over these arrays; nothing is grouped, merged
+    or looped per customer.
+    """
+
+    def __init__(self, df, customer='CustomerID', date='InvoiceDate', invoice='InvoiceNo', value='Revenue'):
+        codes, self.customers = pd.factorize(df[customer], sort=True)
+        invoice_codes, _ = pd.factorize(df[invoice])
+        dates = df[date].to_numpy()
+
+        # Rows without a customer are left out (code -1), as groupby drops them
+        positions = np.flatnonzero(codes >= 0)
+        order = positions[np.lexsort((invoice_codes[positions], dates[positions], codes[positions]))]
+        self.rows = order
+        self.codes = codes[order]
+        self.dates = dates[order]
+        self.values = df[value].to_numpy(dtype=np.float64)[order]
+        counts = np.bincount(self.codes, minlength=len(self.customers))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        # First row of each (customer, invoice) run
+        invoice_codes = invoice_codes[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (self.codes[1:] != self.codes[:-1]) | (invoice_codes[1:] != invoice_codes[:-1])
+        self.purchase_codes = self.codes[first]
+        self.purchase_dates = self.dates[first]
+        purchases = np.bincount(self.purchase_codes, minlength=len(self.customers))
+        self.purchase_offsets = np.concatenate([[0], np.cumsum(purchases)])
+
+    @property
+    def n_customers(self):
+        return len(self.customers)
+
+    def _customer_ids(self):
+        """Customer IDs as integers when they are whole numbers (the float column the CSV reads)"""
+        ids = np.asarray(self.customers)
+        if ids.dtype.kind == 'f' and np.all(ids == np.round(ids)):
+            return ids.astype(np.int64)
+        return ids
+
+    def rfm(self, reference_date=None, bins=RFM_BINS):
+        """
+        Recency (days from the last purchase to reference_date, by default
+        the day after the last invoice), frequency (distinct invoices) and
+        monetary value (total revenue) per customer, each scored 1..bins by
+        quantile (bins is best: most recent, most frequent, highest value).
+        RFM_Segment concatenates the three scores, e.g. 545.
+        """
+        first_purchase = self.dates[self.offsets[:-1]]
+        last_purchase = self.dates[self.offsets[1:] - 1]
+        if reference_date is None:
+            reference_date = self.dates.max() + DAY
+        recency = (np.datetime64(reference_date) - last_purchase) / DAY
+        frequency = np.diff(self.purchase_offsets)
+        monetary = np.add.reduceat(self.values, self.offsets[:-1]) if self.n_customers else np.zeros(0)
+
+        r_score = _quantile_scores(recency, bins, ascending=False)
+        f_score = _quantile_scores(frequency, bins)
+        m_score = _quantile_scores(monetary, bins)
+        return pd.DataFrame({
+            'CustomerID': self._customer_ids(),
+            'First_Purchase': first_purchase,
+            'Last_Purchase': last_purchase,
+            'Recency_Days': recency,
+            'Frequency': frequency,
+            'Monetary': monetary,
+            'R_Score': r_score,
+            'F_Score': f_score,
+            'M_Score': m_score,
+            'RFM_Segment': r_score.astype(np.int16) * 100 + f_score.astype(np.int16) * 10 + m_score,
+        })
+
+    def cohort_retention(self):
+        """
+        Monthly cohort tables: customers are grouped by the month of their
+        first purchase, and (counts, retention) give, for each cohort and
+        each month since it (0 = the first month), how many of its customers
+        purchased and their share of the cohort. One bincount over the
+        distinct (customer, month) purchase pairs builds the whole matrix.
+        """
+        months = self.purchase_dates.astype('datetime64[M]').astype(np.int64)
+        # Purchases are in date order per customer, so repeats of a month are adjacent
+        active = np.ones(len(months), dtype=bool)
+        active[1:] = (self.purchase_codes[1:] != self.purchase_codes[:-1]) | (months[1:] != months[:-1])
+        customer_cohorts = months[self.purchase_offsets[:-1]]
+
+        cohort_months, cohort_codes = np.unique(customer_cohorts, return_inverse=True)
+        customers = self.purchase_codes[active]
+        since = months[active] - customer_cohorts[customers]
+        n_periods = int(since.max()) + 1 if len(since) else 0
+        counts = np.bincount(cohort_codes[customers] * n_periods + since,
+                             minlength=len(cohort_months) * n_periods).reshape(len(cohort_months), n_periods)
+
+        index = pd.PeriodIndex.from_ordinals(cohort_months, freq='M').rename('Cohort')
+        columns = pd.RangeIndex(n_periods, name='Months_Since_First_Purchase')
+        counts = pd.DataFrame(counts, index=index, columns=columns)
+        retention = counts.div(counts[0], axis=0) if n_periods else counts.astype(np.float64)
+        return counts, retention
+
+    def purchase_intervals(self):
+        """
+        Days between each customer's consecutive purchases, summarised per
+        customer (customers with a single purchase have no interval, NaN).
+        The interval array itself is (codes, days) from purchase_gaps().
+        """
+        codes, days = self.purchase_gaps()
+        # Gaps are in customer order, so per-customer counts give their CSR offsets
+        gaps = np.bincount(codes, minlength=self.n_customers)
+        offsets = np.concatenate([[0], np.cumsum(gaps)])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(codes, weights=days, minlength=self.n_customers) / gaps
+        return pd.DataFrame({
+            'CustomerID': self._customer_ids(),
+            'Purchases': np.diff(self.purchase_offsets),
+            'Mean_Interval_Days': mean,
+            'Min_Interval_Days': _segment_reduce(np.minimum, days, offsets),
+            'Max_Interval_Days': _segment_reduce(np.maximum, days, offsets),
+        })
+
+    def purchase_gaps(self):
+        """(customer code, days since that customer's previous purchase) for every repeat purchase"""
+        repeat = self.purchase_codes[1:] == self.purchase_codes[:-1]
+        days = (self.purchase_dates[1:] - self.purchase_dates[:-1])[repeat] / DAY
+        return self.purchase_codes[1:][repeat], days
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Customer RFM scores, cohort retention and purchase intervals")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild the cleaned frame instead of mapping it")
+    args = parser.parse_args(argv)
+
+    from retail_analysis import load_and_clean_data
+
+    df_clean = load_and_clean_data(use_cache=not args.no_cache)
+    print("\n=== Customer Analytics ===")
+    index = CustomerIndex(df_clean)
+    print(f"Indexed {len(index.rows):,} rows of {index.n_customers:,} customers "
+          f"({len(index.purchase_codes):,} purchases)")
+
+    rfm = index.rfm()
+    rfm.to_csv(RFM_FILE, index=False)
+    print(f"Saved: {RFM_FILE}")
+    counts, retention = index.cohort_retention()
+    retention.round(4).to_csv(COHORT_FILE)
+    print(f"Saved: {COHORT_FILE} ({len(retention)} cohorts x {len(retention.columns)} months)")
+    intervals = index.purchase_intervals()
+    intervals.to_csv(INTERVALS_FILE, index=False)
+    print(f"Saved: {INTERVALS_FILE}")
+
+    _, days = index.purchase_gaps()
+    champions = rfm['RFM_Segment'] == RFM_BINS * 111
+    print(f"\nChampions (RFM {RFM_BINS * 111}): {champions.sum():,} customers, "
+          f"£{rfm.loc[champions, 'Monetary'].sum():,.0f} revenue")
+    if len(days):
+        print(f"Median days between purchases: {np.median(days):.0f}")
+    if len(retention.columns) > 1:
+        # The last cohort has no following month in the data yet
+        print(f"Average month-1 retention: {retention[1].iloc[:-1].mean():.1%}")
+
+
+if __name__ == "__main__":
+    main()
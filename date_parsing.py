@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+# Timestamp layouts tried, in order, when detecting a column's format
+CANDIDATE_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+]
+
+# Distinct values sampled (evenly across the column) to detect the format
+SAMPLE_VALUES = 1000
+
+
+def detect_datetime_format(values, sample_values=SAMPLE_VALUES):
+    """
+    The first candidate format that parses every sampled value, or None
+    when the values are not all text or no candidate fits. Samples are
+    spread over the whole column so that a day above 12 appears for
+    day/month orders that differ.
+    """
+    values = pd.Series(values).dropna()
+    if not len(values):
+        return None
+    sample = values.iloc[np.unique(np.linspace(0, len(values) - 1, min(sample_values, len(values))).astype(int))]
+    if not all(isinstance(value, str) for value in sample):
+        return None
+    for fmt in CANDIDATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all():
+            return fmt
+    return None
+
+
+def parse_datetimes(values, fmt=None):
+    """
+    Parse a column of timestamp strings to datetime64, as pd.to_datetime does.
+
+    Each distinct string is parsed once (invoices share their timestamp
+    across all their lines) with one fixed format, detected from a sample
+    when fmt is not given, and the results are broadcast back by code.
+    Columns that are already datetime64 are returned as they are.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    codes, uniques = pd.factorize(values)
+    fmt = fmt or detect_datetime_format(uniques)
+    parsed = pd.to_datetime(uniques, format=fmt) if fmt else pd.to_datetime(uniques)
+    # Missing values (code -1) take the trailing NaT
+    lookup = np.append(np.asarray(parsed, dtype=parsed.dtype), np.array(['NaT'], dtype=parsed.dtype))
+    return pd.Series(lookup[codes], index=values.index, name=values.name)
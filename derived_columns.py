@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+# Date dimension name -> builder applied to the calendar of distinct invoice days
+DATE_DIMENSIONS = {
+    'Year': lambda days: days.year,
+    'Month': lambda days: days.month,
+    'MonthName': lambda days: days.month_name(),
+    'Quarter': lambda days: days.quarter,
+    'DayOfWeek': lambda days: days.day_name(),
+    'Date': lambda days: days.date,
+    'YearMonth': lambda days: days.to_period('M').astype(str),
+    'WeekOfYear': lambda days: days.isocalendar().week,
+}
+
+
+def calendar_codes(timestamps):
+    """
+    Code per row into the calendar of days the timestamps span.
+
+    Codes are day offsets from the first day, so no hashing is needed; a
+    missing timestamp maps to a trailing NaT entry of the calendar.
+    """
+    days = np.asarray(timestamps).astype('datetime64[D]')
+    missing = np.isnat(days)
+    day_numbers = days.view(np.int64)
+    valid = day_numbers[~missing] if missing.any() else day_numbers
+    first, last = (valid.min(), valid.max()) if len(valid) else (0, -1)
+
+    codes = day_numbers - first
+    calendar = pd.DatetimeIndex(np.arange(first, last + 1).astype('datetime64[D]'))
+    if missing.any():
+        codes[missing] = len(calendar)
+        calendar = calendar.append(pd.DatetimeIndex([pd.NaT]))
+    return codes, calendar
+
+
+def add_date_dimensions(df, dimensions=None, column='InvoiceDate'):
+    """
+    Add date dimension columns, computing each once per distinct day of
+    df[column] and broadcasting it back to the rows by calendar code.
+    """
+    dimensions = DATE_DIMENSIONS if dimensions is None else dimensions
+    codes, calendar = calendar_codes(df[column])
+    for name, build in dimensions.items():
+        df[name] = pd.Index(build(calendar)).take(codes)
+    return df
+
+
+def distinct_values(values):
+    """
+    Integer code per row plus the distinct values as an object Series.
+
+    The lookup carries one trailing missing entry, so indexing it with the
+    codes maps missing values (code -1) to whatever was computed for NA.
+    """
+    codes, uniques = pd.factorize(values)
+    lookup = pd.Series(np.append(np.asarray(uniques, dtype=object), np.nan), dtype=object)
+    return codes, lookup
+
+
+def stock_code_category(stock_codes):
+    """Leading letters of each stock code, or 'Numeric' when it has none"""
+    return stock_codes.str.extract('([A-Za-z]+)', expand=False).fillna('Numeric')
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_datetimes
+from aggregation_engine import (
+    DEFAULT_GROUP_KEYS, DEFAULT_METRICS, DEFAULT_ATTRIBUTES,
+    partial_aggregates, merge_partials, finalize_partials
+)
+from source_cache import load_source
+from streaming_ingest import clean_chunk, normalise_identifiers
+
+# Persisted partial aggregates, one sub-directory per pipeline
+STATE_DIR = '.retail_state'
+
+# Bump when the state layout changes so older state directories are rebuilt
+STATE_VERSION = 2
+
+
+def _config_signature(group_keys, metrics, attributes):
+    """Hash of the aggregation configuration (and state layout) the state was built with"""
+    config = json.dumps([STATE_VERSION, group_keys, metrics, attributes], sort_keys=True, default=str)
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+
+def _load_manifest(state_dir):
+    """Manifest of folded days, or an empty one for a new state directory"""
+    path = os.path.join(state_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return {'config': None, 'days': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(state_dir, manifest):
+    """Write the manifest atomically"""
+    path = os.path.join(state_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def _day_path(state_dir, day):
+    """File holding the partial aggregates of one invoice day"""
+    return os.path.join(state_dir, 'days', f"{day}.pkl")
+
+
+def _rows_path(state_dir, day):
+    """File holding the sorted row hashes already folded into one invoice day"""
+    return os.path.join(state_dir, 'days', f"{day}.rows.npy")
+
+
+def _unseen_rows(raw_day, folded):
+    """
+    Mask of the rows of raw_day not yet folded, and their row hashes.
+
+    Rows are compared as a multiset of content hashes: the k-th copy of a
+    row is new only when fewer than k copies were folded before. This is
+    only sound when raw_day is a complete re-read of the day from the
+    source, where a repeated line that was already folded is the same line;
+    rows from an explicit delta are never checked against it.
+    """
+    hashes = pd.util.hash_pandas_object(raw_day, index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount().to_numpy()
+    folded_count = np.searchsorted(folded, hashes, side='right') - np.searchsorted(folded, hashes, side='left')
+    return occurrence >= folded_count, hashes
+
+
+def select_delta(raw, state_dir):
+    """
+    Rows on or after the last folded day; that day is re-read because it
+    may have been partial when it was folded (its already folded rows are
+    skipped). Rows dated before that day are not looked at: late rows for
+    earlier days have to be passed as an explicit delta.
+    """
+    manifest = _load_manifest(state_dir)
+    if not manifest['days']:
+        return raw
+    watermark = pd.Timestamp(max(manifest['days']))
+    return raw[raw['InvoiceDate'] >= watermark]
+
+
+def refresh_aggregates(raw_delta, derive=None, state_dir=STATE_DIR,
+                       group_keys=None, metrics=None, attributes=None, reread=False):
+    """
+    Fold new invoice rows into the persisted aggregate state.
+
+    The raw delta is split by invoice day. With reread=True the delta is a
+    re-read of the source from the last folded day, and each day's rows are
+    checked against the row hashes already folded into it so rows folded
+    on an earlier run are skipped; otherwise every row is folded as given
+    (exact duplicate lines are common in this data), so replaying the same
+    delta file counts it twice. The new rows are cleaned, derived and reduced to partial aggregates
+    (per-month, per-country and per-customer sums plus mergeable distinct
+    pairs), which are merged into the day's stored partial: a delta may
+    hold a whole day or only late rows for it, dated on any day. Rows are
+    only ever added; a correction that changes or removes a folded row
+    needs the state directory deleted and rebuilt. New days are merged into
+    the running state, and when an already-folded day gains rows the state
+    is rebuilt from the stored day partials. Returns the finalized
+    aggregates and a cumulative summary.
+    """
+    group_keys = DEFAULT_GROUP_KEYS if group_keys is None else group_keys
+    metrics = DEFAULT_METRICS if metrics is None else metrics
+    attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+
+    os.makedirs(os.path.join(state_dir, 'days'), exist_ok=True)
+    manifest = _load_manifest(state_dir)
+    signature = _config_signature(group_keys, metrics, attributes)
+    if manifest['config'] not in (None, signature):
+        raise ValueError(
+            f"Aggregate state in {state_dir} was built with a different configuration; "
+            "delete it to rebuild from the full history"
+        )
+    manifest['config'] = signature
+
+    raw_delta = normalise_identifiers(raw_delta.copy())
+    raw_delta['InvoiceDate'] = parse_datetimes(raw_delta['InvoiceDate'])
+
+    new_partials, extended, folded_records = [], 0, 0
+    for day, raw_day in raw_delta.groupby(raw_delta['InvoiceDate'].dt.normalize(), sort=True):
+        day_key = day.strftime('%Y-%m-%d')
+        previous = manifest['days'].get(day_key)
+        folded = np.load(_rows_path(state_dir, day_key)) if previous is not None else np.empty(0, np.uint64)
+        if reread:
+            unseen, hashes = _unseen_rows(raw_day, folded)
+        else:
+            hashes = pd.util.hash_pandas_object(raw_day, index=False).to_numpy()
+            unseen = np.ones(len(raw_day), dtype=bool)
+        if not unseen.any():
+            continue
+        raw_day = raw_day[unseen]
+
+        day_clean = clean_chunk(raw_day)
+        if derive is not None:
+            day_clean = derive(day_clean)
+        partial = partial_aggregates(day_clean, group_keys, metrics, attributes)
+        if previous is not None:
+            partial = merge_partials([pd.read_pickle(_day_path(state_dir, day_key)), partial])
+        pd.to_pickle(partial, _day_path(state_dir, day_key))
+        np.save(_rows_path(state_dir, day_key), np.sort(np.concatenate([folded, hashes[unseen]])))
+
+        entry = previous or {'raw_records': 0, 'clean_records': 0, 'first_invoice': None, 'last_invoice': None}
+        entry['raw_records'] += len(raw_day)
+        entry['clean_records'] += len(day_clean)
+        if len(day_clean):
+            first, last = str(day_clean['InvoiceDate'].min()), str(day_clean['InvoiceDate'].max())
+            entry['first_invoice'] = min(entry['first_invoice'] or first, first)
+            entry['last_invoice'] = max(entry['last_invoice'] or last, last)
+        manifest['days'][day_key] = entry
+        extended += previous is not None
+        folded_records += len(raw_day)
+        if previous is None:
+            new_partials.append(partial)
+
+    merged_path = os.path.join(state_dir, 'merged.pkl')
+    if extended or not os.path.exists(merged_path):
+        # Rebuild from the stored day partials, in day order so 'first' attributes stay chronological
+        day_partials = [pd.read_pickle(_day_path(state_dir, day)) for day in sorted(manifest['days'])]
+        if not day_partials:
+            raise ValueError("No invoice days to aggregate")
+        merged = merge_partials(day_partials)
+    elif new_partials:
+        merged = merge_partials([pd.read_pickle(merged_path)] + new_partials)
+    else:
+        merged = pd.read_pickle(merged_path)
+
+    pd.to_pickle(merged, merged_path + '.tmp')
+    os.replace(merged_path + '.tmp', merged_path)
+    _save_manifest(state_dir, manifest)
+
+    days = manifest['days'].values()
+    summary = {
+        'days_folded': len(new_partials),
+        'days_extended': extended,
+        'delta_records': len(raw_delta),
+        'folded_records': folded_records,
+        'raw_records': sum(day['raw_records'] for day in days),
+        'clean_records': sum(day['clean_records'] for day in days),
+        'first_invoice': min((day['first_invoice'] for day in days if day['first_invoice']), default=None),
+        'last_invoice': max((day['last_invoice'] for day in days if day['last_invoice']), default=None),
+    }
+    summary['removed_records'] = summary['raw_records'] - summary['clean_records']
+    print(f"Folded {summary['folded_records']:,} of {summary['delta_records']:,} delta records "
+          f"({summary['days_folded']} new days, {summary['days_extended']} extended) into {state_dir}")
+
+    return finalize_partials(merged), summary
+
+
+def refresh_from_source(source_path, derive=None, state_dir=STATE_DIR, delta_path=None,
+                        use_cache=True, **aggregate_options):
+    """
+    Incremental refresh entry point for the report scripts: folds an explicit
+    delta file when given (any days, e.g. late rows for earlier days),
+    otherwise the source rows from the last folded day onwards. Delta rows
+    are folded as given, so each delta file should be passed once.
+    """
+    if delta_path is not None:
+        raw, _ = load_source(delta_path, use_cache=False, parse_dates=['InvoiceDate'])
+        return refresh_aggregates(raw, derive, state_dir, **aggregate_options)
+    raw, _ = load_source(source_path, use_cache=use_cache, parse_dates=['InvoiceDate'])
+    raw['InvoiceDate'] = parse_datetimes(raw['InvoiceDate'])
+    raw = select_delta(raw, state_dir)
+    return refresh_aggregates(raw, derive, state_dir, reread=True, **aggregate_options)
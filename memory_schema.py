@@ -0,0 +1,55 @@
+import pandas as pd
+
+# Text columns with few distinct values relative to the row count
+CATEGORICAL_COLUMNS = [
+    'Country', 'StockCode', 'Description', 'MonthName', 'DayOfWeek', 'YearMonth',
+    'CountryGroup', 'CustomerID_Clean', 'StockCode_Category'
+]
+
+# Integer columns whose value range fits a narrower type
+DOWNCAST_COLUMNS = ['Quantity', 'Year', 'Month', 'Quarter', 'WeekOfYear']
+
+
+def memory_footprint_mb(df):
+    """Deep memory usage of a frame in MB"""
+    return df.memory_usage(deep=True).sum() / 1024 ** 2
+
+
+def to_compact_schema(df, report=True):
+    """
+    Convert the cleaned frame to a memory-optimised schema in place:
+    categoricals for low-cardinality text, downcast integers, nullable Int64
+    CustomerID and datetime64 Date. Groupbys on the categorical keys run on
+    their integer codes.
+    """
+    before = memory_footprint_mb(df) if report else None
+
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns or isinstance(df[col].dtype, (pd.CategoricalDtype, pd.PeriodDtype)):
+            continue
+        values = df[col]
+        if pd.api.types.infer_dtype(values, skipna=True).startswith('mixed'):
+            # StockCode from Excel and CustomerID_Clean mix numbers and text
+            values = values.astype(str)
+        df[col] = values.astype('category')
+
+    for col in DOWNCAST_COLUMNS:
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.api.extensions.ExtensionDtype):
+            df[col] = pd.to_numeric(df[col].astype('Int64'), downcast='unsigned' if df[col].min() >= 0 else 'integer')
+        else:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    if 'CustomerID' in df.columns:
+        df['CustomerID'] = df['CustomerID'].astype('Int64')
+
+    if 'Date' in df.columns and df['Date'].dtype == object:
+        df['Date'] = pd.to_datetime(df['Date'])
+
+    if report:
+        after = memory_footprint_mb(df)
+        print(f"Memory footprint: {before:,.1f} MB -> {after:,.1f} MB "
+              f"({(1 - after / before) * 100:.0f}% smaller)")
+
+    return df
@@ -0,0 +1,324 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_datetimes
+from aggregation_engine import (
+    DEFAULT_GROUP_KEYS, DEFAULT_METRICS, DEFAULT_ATTRIBUTES,
+    compute_aggregates, partial_aggregates, merge_partials, finalize_partials
+)
+from column_cache import encode_column, decode_column
+from streaming_ingest import clean_chunk
+
+PARTITION_SCHEMES = ('month', 'invoice')
+
+# Frames and row positions inherited by forked workers instead of being pickled to them
+_SHARED = {}
+
+# Byte alignment of each array packed into a shared memory block
+_ALIGNMENT = 64
+
+
+def _bucket_codes(values, n_buckets):
+    """
+    Stable hash bucket of every value; equal values land in the same bucket
+    in every partition. Only the distinct values are hashed.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    hashed = pd.util.hash_pandas_object(pd.Series(uniques), index=False).to_numpy()
+    return (hashed % np.uint64(n_buckets)).astype(np.int64)[codes]
+
+
+def _split_positions(codes):
+    """Row positions per code, in source order within each code"""
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes[order])) if len(codes) else np.array([], dtype=np.int64)
+    return np.split(order, bounds[:-1]) if len(bounds) else []
+
+
+def partition_positions(raw, partition_by='month', n_partitions=None):
+    """
+    Row positions of each non-empty partition, in source order within it.
+
+    'month' groups rows by invoice month (parsing InvoiceDate if it is still
+    text); 'invoice' spreads rows over n_partitions by a hash of InvoiceNo,
+    which keeps every invoice whole, balances skewed months and needs no
+    date parsing up front.
+    """
+    if partition_by == 'month':
+        months = parse_datetimes(raw['InvoiceDate']).dt.to_period('M')
+        codes = pd.factorize(months, sort=True)[0]
+    elif partition_by == 'invoice':
+        codes = _bucket_codes(raw['InvoiceNo'].astype(str), n_partitions or os.cpu_count() or 1)
+    else:
+        raise ValueError(f"partition_by must be one of {PARTITION_SCHEMES}")
+    return [part for part in _split_positions(codes) if len(part)]
+
+
+def _shared_rows(source, rows, columns=None):
+    """Rows of a frame inherited from the parent, reading only the given columns"""
+    frame = _SHARED[source]
+    return (frame if columns is None else frame[columns]).take(rows)
+
+
+def _forked_task(func, source, rows, columns, args):
+    """Task of a forked worker: func over row positions of the inherited frame"""
+    return func(_shared_rows(source, rows, columns), *args)
+
+
+def _pack_arrays(arrays):
+    """
+    Copy arrays into one new shared memory block for the parent to read,
+    so they are not pickled back; returns (block name, [(dtype, shape, offset)])
+    """
+    layout, size = [], 0
+    for values in arrays:
+        layout.append((values.dtype.str, values.shape, size))
+        size += -(-values.nbytes // _ALIGNMENT) * _ALIGNMENT
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for values, (dtype, shape, offset) in zip(arrays, layout):
+            np.ndarray(shape, dtype, buffer=block.buf, offset=offset)[...] = values
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    return block.name, layout
+
+
+def _clean_partition(partition, derive, group_keys, n_buckets, metrics, source_dtypes):
+    """
+    Map step: clean and derive one partition, assign every row to a hash
+    bucket per grouping key, and keep the distinct-count state of the totals.
+
+    The cleaned rows are not sent back. The kept row positions, the bucket
+    codes and the columns the partition added or retyped (encoded as plain
+    arrays) go into a shared memory block; the parent takes the unchanged
+    source columns from its own frame.
+    """
+    chunk = clean_chunk(partition)
+    if derive is not None:
+        chunk = derive(chunk)
+
+    arrays = [chunk.index.to_numpy(dtype=np.int64)]
+    arrays += [_bucket_codes(chunk[key], n_buckets) for key in group_keys]
+    handed = []
+    for col in chunk.columns:
+        if col in source_dtypes and chunk[col].dtype == source_dtypes[col]:
+            continue
+        kind, parts, dictionary = encode_column(chunk[col])
+        handed.append((col, kind, list(parts), dictionary))
+        arrays += [np.ascontiguousarray(values) for values in parts.values()]
+
+    totals = partial_aggregates(chunk, group_keys=[], metrics=metrics)
+    return _pack_arrays(arrays), list(chunk.columns), handed, totals
+
+
+def _aggregate_bucket(bucket, key, metrics, attributes):
+    """Reduce step: aggregate every group of one key that hashes to this bucket"""
+    return compute_aggregates(bucket, [key], metrics, attributes)[key]
+
+
+def _run_tasks(func, source, frame, row_sets, extra_args, workers, columns=None):
+    """
+    Run func over row sets of a frame in a process pool. Forked workers read
+    the frame from _SHARED copy-on-write and receive only row positions;
+    without fork each task is sent its rows. columns lists the columns each
+    task reads (None for all), so only those are copied.
+    """
+    columns = columns or [None] * len(row_sets)
+    forked = 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork') if forked else None
+    if forked:
+        _SHARED[source] = frame
+    # Started before the workers, so the shared memory blocks they leave for the parent are
+    # tracked by the parent's tracker instead of one that frees them when the worker exits
+    resource_tracker.ensure_running()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            if forked:
+                futures = [pool.submit(_forked_task, func, source, rows, cols, args)
+                           for rows, args, cols in zip(row_sets, extra_args, columns)]
+            else:
+                futures = [pool.submit(func, (frame if cols is None else frame[cols]).take(rows), *args)
+                           for rows, args, cols in zip(row_sets, extra_args, columns)]
+            return [future.result() for future in futures]
+    finally:
+        _SHARED.pop(source, None)
+
+
+def _same_dictionary(a, b):
+    """Whether two encodings share a dtype, and categoricals their categories in the same order"""
+    if isinstance(a, pd.CategoricalDtype) and isinstance(b, pd.CategoricalDtype):
+        return a.ordered == b.ordered and a.categories.equals(b.categories)
+    return a == b
+
+
+def _combine_column(parts, destinations, n_rows):
+    """
+    One handed-back column in source order from its per-partition encodings
+    ((kind, arrays, dictionary) each): the arrays are scattered to the
+    partitions' destination rows, and dictionary codes are remapped onto the
+    union of the partitions' dictionaries.
+    """
+    kinds = {kind for kind, _, _ in parts}
+    kind, _, first = parts[0]
+    if len(kinds) == 1 and kind == 'dictionary' and all(dictionary[0] == first[0] for _, _, dictionary in parts):
+        uniques = first[1].append([dictionary[1] for _, _, dictionary in parts[1:]]).unique()
+        codes = np.empty(n_rows, dtype=np.int64)
+        for (_, arrays, dictionary), rows in zip(parts, destinations):
+            # The appended -1 keeps missing values (code -1) missing
+            remap = np.append(uniques.get_indexer(dictionary[1]), -1)
+            codes[rows] = remap[arrays['codes']]
+        return decode_column(kind, {'codes': codes}, (first[0], uniques))
+    if len(kinds) == 1 and kind != 'dictionary' and all(
+            _same_dictionary(dictionary, first) and
+            all(values.dtype == parts[0][1][name].dtype for name, values in arrays.items())
+            for _, arrays, dictionary in parts):
+        combined = {name: np.empty(n_rows, dtype=values.dtype) for name, values in parts[0][1].items()}
+        for (_, arrays, _), rows in zip(parts, destinations):
+            for name, values in arrays.items():
+                combined[name][rows] = values
+        return decode_column(kind, combined, first)
+    # Partitions disagreeing on a column's type combine as pd.concat would
+    pieces = [pd.Series(decode_column(*part), index=rows) for part, rows in zip(parts, destinations)]
+    return pd.concat(pieces).sort_index().array
+
+
+def _assemble_clean_frame(raw, mapped, group_keys):
+    """
+    The cleaned frame, in source order, from the map results: the source
+    columns are taken from raw at the kept positions and the handed-back
+    columns are scattered from each partition's shared memory block, whose
+    kept positions place its rows without sorting. Every block is freed.
+    Returns (df_clean, bucket codes per key).
+    """
+    blocks, views = [], []
+    try:
+        for (name, layout), *_ in mapped:
+            block = shared_memory.SharedMemory(name=name)
+            blocks.append(block)
+            views.append([np.ndarray(shape, dtype, buffer=block.buf, offset=offset)
+                          for dtype, shape, offset in layout])
+
+        keep = np.zeros(len(raw), dtype=bool)
+        for arrays in views:
+            keep[arrays[0]] = True
+        kept = np.flatnonzero(keep)
+        rank = np.cumsum(keep) - 1
+        destinations = [rank[arrays[0]] for arrays in views]
+        del rank
+
+        buckets = {}
+        for position, key in enumerate(group_keys, start=1):
+            buckets[key] = np.empty(len(kept), dtype=np.int64)
+            for arrays, rows in zip(views, destinations):
+                buckets[key][rows] = arrays[position]
+
+        # Partitions left empty by cleaning may type their columns differently; they add no rows
+        used = [i for i, arrays in enumerate(views) if len(arrays[0])] or [0]
+        columns, handed = mapped[used[0]][1], {}
+        for i in used:
+            arrays = iter(views[i][1 + len(group_keys):])
+            for col, kind, names, dictionary in mapped[i][2]:
+                handed.setdefault(col, []).append((kind, {name: next(arrays) for name in names}, dictionary))
+        values = {col: _combine_column(parts, [destinations[i] for i in used], len(kept))
+                  for col, parts in handed.items()}
+    finally:
+        views = None
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    source = raw[[col for col in columns if col not in values]].take(kept)
+    df_clean = pd.DataFrame({col: values[col] if col in values else source[col] for col in columns},
+                            index=source.index)
+    return df_clean, buckets
+
+
+def run_partitioned(raw, derive=None, partition_by='month', workers=None,
+                    group_keys=None, metrics=None, attributes=None):
+    """
+    Clean, derive and aggregate the raw frame on several cores.
+
+    The map step cleans and derives each partition (by month or InvoiceNo
+    hash) in a process pool. The cleaned partitions stay in the workers:
+    each returns its partial totals and hands its kept row positions, hash
+    bucket codes and derived columns back through shared memory, and the
+    parent assembles the cleaned frame in source order from those and its
+    own source columns (derive may add or retype columns but must not
+    rewrite a source column in place). The reduce step then aggregates
+    each grouping key in hash buckets of its values, reading only the
+    columns that key needs, so every group is summed over the same rows in
+    the same order as compute_aggregates does serially and the per-bucket
+    tables only need concatenating. The result is identical to the serial
+    path, float sums included; with one worker it is the serial path.
+    Returns (df_clean, aggregates, stats).
+    """
+    group_keys = DEFAULT_GROUP_KEYS if group_keys is None else group_keys
+    metrics = DEFAULT_METRICS if metrics is None else metrics
+    attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+    workers = workers or os.cpu_count() or 1
+
+    if not len(raw):
+        raise ValueError("No records to process")
+    if workers <= 1:
+        # A single worker has nothing to hand off: this is the serial path
+        df_clean = clean_chunk(raw)
+        if derive is not None:
+            df_clean = derive(df_clean)
+        aggregates = compute_aggregates(df_clean, group_keys, metrics, attributes)
+        return df_clean, aggregates, _partition_stats(raw, df_clean, 1, workers)
+
+    if not isinstance(raw.index, pd.RangeIndex) or raw.index.start != 0 or raw.index.step != 1:
+        raw = raw.reset_index(drop=True)
+    if partition_by == 'month':
+        # Parse once here; the workers' parse is then a no-op
+        raw = raw.assign(InvoiceDate=parse_datetimes(raw['InvoiceDate']))
+    partitions = partition_positions(raw, partition_by, workers)
+
+    source_dtypes = raw.dtypes.to_dict()
+    mapped = _run_tasks(_clean_partition, 'raw', raw, partitions,
+                        [(derive, group_keys, workers, metrics, source_dtypes)] * len(partitions), workers)
+    df_clean, buckets = _assemble_clean_frame(raw, mapped, group_keys)
+
+    tasks, task_args, task_columns = [], [], []
+    for key in group_keys:
+        carried = [col for col in attributes.get(key, []) if col in df_clean.columns and col != key]
+        needed = list(dict.fromkeys([key] + carried + [col for col, _ in metrics.values()]))
+        for rows in _split_positions(buckets[key]):
+            if len(rows):
+                tasks.append(rows)
+                task_args.append((key, metrics, attributes))
+                task_columns.append(needed)
+    tables = _run_tasks(_aggregate_bucket, 'df_clean', df_clean, tasks, task_args, workers, task_columns)
+
+    aggregates = {}
+    for key in group_keys:
+        key_tables = [table for table, args in zip(tables, task_args) if args[0] == key]
+        aggregates[key] = pd.concat(key_tables).sort_values(key, kind='stable').reset_index(drop=True)
+
+    # Totals: sums over the whole column as compute_aggregates takes them, distinct counts from merged state
+    totals = finalize_partials(merge_partials(totals for _, _, _, totals in mapped))['totals']
+    totals.update({name: df_clean[col].sum() for name, (col, func) in metrics.items() if func == 'sum'})
+    aggregates['totals'] = {name: totals[name] for name in metrics}
+    return df_clean, aggregates, _partition_stats(raw, df_clean, len(partitions), workers)
+
+
+def _partition_stats(raw, df_clean, partitions, workers):
+    """Record counts and invoice range of a run"""
+    stats = {
+        'raw_records': len(raw),
+        'clean_records': len(df_clean),
+        'partitions': partitions,
+        'workers': workers,
+        'first_invoice': df_clean['InvoiceDate'].min() if len(df_clean) else None,
+        'last_invoice': df_clean['InvoiceDate'].max() if len(df_clean) else None,
+    }
+    stats['removed_records'] = stats['raw_records'] - stats['clean_records']
+    return stats
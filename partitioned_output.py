@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from columnar_storage import write_columnar, read_cleaned_data, _FILTER_OPS
+from csv_export import export_csv, compressed_path
+
+# Default root of the partitioned cleaned dataset
+DEFAULT_PARTITIONED_DIR = 'Cleaned_Retail_Data_Partitioned'
+
+DEFAULT_PARTITION_COLUMNS = ['Year', 'Month']
+
+MANIFEST_NAME = '_manifest.json'
+
+# Directory value of the partition holding rows whose partition column is missing
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+# Columns whose per-partition min/max are kept in the manifest for pruning
+STATS_COLUMNS = ['InvoiceDate', 'Quantity', 'UnitPrice', 'Revenue', 'CustomerID', 'Country']
+
+
+def _json_value(value):
+    """Plain JSON-serialisable form of a partition value or statistic"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(pd.Timestamp(value))
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _partition_dir(keys, values):
+    """Hive-style relative directory of one partition, e.g. Year=2011/Month=3"""
+    return os.path.join(*[f"{key}={NULL_PARTITION if _json_value(value) is None else quote(str(value), safe='')}"
+                          for key, value in zip(keys, values)])
+
+
+def _partition_codes(df, partition_columns):
+    """
+    Partition code of every row and the value tuple of each code, in sorted
+    order; a missing value sorts last and gets a partition of its own
+    """
+    codes, uniques = zip(*[pd.factorize(df[col], sort=True, use_na_sentinel=False) for col in partition_columns])
+    shape = [len(values) for values in uniques]
+    codes, groups = pd.factorize(np.ravel_multi_index(codes, shape), sort=True)
+    keys = [tuple(values[position] for values, position in zip(uniques, group))
+            for group in zip(*np.unravel_index(groups, shape))]
+    return codes, keys
+
+
+def _column_stats(df, positions):
+    """Min/max of the statistics columns over a partition's rows"""
+    stats = {}
+    for col in STATS_COLUMNS:
+        if col in df.columns:
+            values = df[col].take(positions)
+            stats[col] = {'min': _json_value(values.min()), 'max': _json_value(values.max())}
+    return stats
+
+
+def _fingerprint(row_hashes, positions):
+    """Content hash of a partition, from the per-row hashes of its rows in order"""
+    return hashlib.sha256(row_hashes[positions].tobytes()).hexdigest()
+
+
+def read_manifest(root):
+    """Manifest of a partitioned dataset, or None when there is none"""
+    try:
+        with open(os.path.join(root, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(root, manifest):
+    """Write the manifest atomically so readers never see a partial file"""
+    path = os.path.join(root, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def write_partitioned(df, root=DEFAULT_PARTITIONED_DIR, partition_columns=None, storage_format='csv',
+                      compression=None):
+    """
+    Write the cleaned frame as a Hive-style partitioned dataset
+    (root/Year=2011/Month=3/part-0.csv) with a manifest of row counts,
+    content fingerprints and per-partition min/max statistics.
+
+    Partition files keep every column, so each one is a valid extract on
+    its own; rows with a missing partition value go to a
+    Col=__HIVE_DEFAULT_PARTITION__ partition. A partition whose rows are
+    unchanged since the previous write is left as it is and partitions
+    that no longer have rows are removed,
+    so a refresh rewrites only the partitions that changed. CSV partitions
+    are written in a single encoding pass. Returns the new manifest with
+    lists of the written, unchanged and removed partition paths.
+    """
+    partition_columns = list(DEFAULT_PARTITION_COLUMNS if partition_columns is None else partition_columns)
+    extension = compressed_path('.csv', compression) if storage_format == 'csv' else '.parquet'
+    previous = read_manifest(root) or {}
+    same_layout = (previous.get('format') == storage_format and previous.get('extension') == extension
+                   and previous.get('columns') == list(df.columns)
+                   and previous.get('partition_columns') == partition_columns)
+    old_fingerprints = {part['path']: part['fingerprint'] for part in previous.get('partitions', [])} \
+        if same_layout else {}
+
+    codes, keys = _partition_codes(df, partition_columns)
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(keys)))
+    group_positions = np.split(order, bounds[:-1])
+
+    partitions, to_write = [], {}
+    for values, positions in zip(keys, group_positions):
+        path = os.path.join(_partition_dir(partition_columns, values), 'part-0' + extension)
+        part = {
+            'path': path,
+            'values': {key: _json_value(value) for key, value in zip(partition_columns, values)},
+            'rows': len(positions),
+            'fingerprint': _fingerprint(row_hashes, positions),
+            'stats': _column_stats(df, positions),
+        }
+        partitions.append(part)
+        if old_fingerprints.get(path) != part['fingerprint'] or not os.path.exists(os.path.join(root, path)):
+            to_write[path] = positions
+
+    os.makedirs(root, exist_ok=True)
+    for path in to_write:
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+    if storage_format == 'csv' and to_write:
+        # One pass over the frame writes every changed partition; files are swapped in when complete
+        targets = {}
+        for path, positions in to_write.items():
+            mask = np.zeros(len(df), dtype=bool)
+            mask[positions] = True
+            targets[os.path.join(root, path) + '.tmp'] = mask
+        export_csv(df, targets, compression=compression)
+    elif storage_format == 'parquet':
+        for path, positions in to_write.items():
+            write_columnar(df.take(positions), os.path.join(root, path) + '.tmp')
+    elif storage_format != 'csv':
+        raise ValueError("storage_format must be 'csv' or 'parquet'")
+    for path in to_write:
+        os.replace(os.path.join(root, path) + '.tmp', os.path.join(root, path))
+
+    current = {part['path'] for part in partitions}
+    removed = [part['path'] for part in previous.get('partitions', []) if part['path'] not in current]
+    for path in removed:
+        if os.path.exists(os.path.join(root, path)):
+            os.remove(os.path.join(root, path))
+        _remove_empty_dirs(root, os.path.dirname(path))
+
+    manifest = {
+        'format': storage_format,
+        'extension': extension,
+        'partition_columns': partition_columns,
+        'columns': list(df.columns),
+        'rows': len(df),
+        'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'partitions': partitions,
+    }
+    _write_manifest(root, manifest)
+    manifest['written'] = list(to_write)
+    manifest['unchanged'] = sorted(current - set(to_write))
+    manifest['removed'] = removed
+    return manifest
+
+
+def _remove_empty_dirs(root, relative):
+    """Remove a partition directory and its parents up to root while they are empty"""
+    while relative:
+        path = os.path.join(root, relative)
+        if not os.path.isdir(path) or os.listdir(path):
+            return
+        os.rmdir(path)
+        relative = os.path.dirname(relative)
+
+
+def _comparable(stat, value):
+    """A manifest statistic in the type of the filter value it is compared with"""
+    if isinstance(value, (pd.Timestamp, np.datetime64)) or hasattr(value, 'isoformat'):
+        return pd.Timestamp(stat)
+    return stat
+
+
+def _may_match(part, condition):
+    """False only when a partition certainly holds no row matching the condition"""
+    col, op, value = condition
+    if col in part['values']:
+        return bool(_FILTER_OPS[op](pd.Series([part['values'][col]]), value).iloc[0])
+    stats = part['stats'].get(col)
+    if stats is None or stats['min'] is None:
+        return True
+    values = value if op in ('in', 'not in') else [value]
+    low, high = (_comparable(stats['min'], values[0]), _comparable(stats['max'], values[0])) if values else (None, None)
+    if op == '==':
+        return low <= value <= high
+    if op == '!=':
+        return not (low == high == value)
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    if op == 'in':
+        return any(low <= item <= high for item in value)
+    return not (low == high and low in value)
+
+
+def prune_partitions(manifest, filters=None):
+    """Partitions of a manifest that may hold rows matching read_columnar-style filters"""
+    return [part for part in manifest['partitions']
+            if all(_may_match(part, condition) for condition in filters or [])]
+
+
+def read_partitioned(root=DEFAULT_PARTITIONED_DIR, columns=None, filters=None):
+    """
+    Read a partitioned dataset, opening only the partitions the filters can
+    match (by partition value, or by the manifest's min/max statistics) and
+    filtering their rows. Q1's [('Year', '==', 2011)] reads only the 2011
+    partitions; with CountryGroup partitions, ('Country', '!=', 'United
+    Kingdom') skips the UK ones.
+    """
+    manifest = read_manifest(root)
+    if manifest is None:
+        raise FileNotFoundError(f"No {MANIFEST_NAME} in {root}")
+    parts = prune_partitions(manifest, filters)
+    frames = [read_cleaned_data(os.path.join(root, part['path']), columns, filters) for part in parts]
+    if not frames:
+        return read_cleaned_data(os.path.join(root, manifest['partitions'][0]['path']), columns,
+                                 filters).iloc[:0] if manifest['partitions'] else pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def remove_partitioned(root=DEFAULT_PARTITIONED_DIR):
+    """Delete a partitioned dataset written by write_partitioned"""
+    if read_manifest(root) is not None:
+        shutil.rmtree(root)
@@ -0,0 +1,120 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Default location of the JSON stage report
+DEFAULT_PROFILE_PATH = 'pipeline_profile.json'
+
+
+def _peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    if resource is None:
+        return _current_rss_mb() or 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def _current_rss_mb():
+    """Current resident set size in MB, or None without psutil"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+class PipelineProfiler:
+    """
+    Records wall time, CPU time, memory and row counts for named pipeline stages.
+
+    Use ``with profiler.stage('clean', rows_in=len(df)) as record:`` and set
+    ``record['rows_out']`` inside the block. Memory is reported as the growth
+    of the process peak RSS during the stage and, with trace_allocations, as
+    the peak of traced (Python and NumPy) allocations above the stage start.
+    Stages may nest: each record keeps its depth, records are listed in the
+    order their stages started and only top-level stages count towards the
+    totals. A disabled profiler measures nothing, so call sites need no
+    branching.
+    """
+
+    def __init__(self, enabled=True, trace_allocations=False):
+        self.enabled = enabled
+        self.trace_allocations = trace_allocations
+        self.stages = []
+        self.depth = 0
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = {'stage': name, 'depth': self.depth, 'rows_in': rows_in, 'rows_out': None}
+        if not self.enabled:
+            yield record
+            return
+        self.stages.append(record)
+
+        if self.trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        rss_start = _current_rss_mb()
+        peak_start = _peak_rss_mb()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        self.depth += 1
+        try:
+            yield record
+        finally:
+            self.depth -= 1
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            record['peak_rss_delta_mb'] = _peak_rss_mb() - peak_start
+            rss_end = _current_rss_mb()
+            record['rss_delta_mb'] = None if rss_start is None else rss_end - rss_start
+            if self.trace_allocations:
+                record['traced_peak_mb'] = (tracemalloc.get_traced_memory()[1] - traced_start) / 1024 ** 2
+
+    def report(self):
+        """Stage records plus totals over the top-level stages as a JSON-serialisable dict"""
+        top_level = [stage for stage in self.stages if stage['depth'] == 0]
+        return {
+            'stages': self.stages,
+            'total_wall_seconds': sum(stage['wall_seconds'] for stage in top_level),
+            'total_cpu_seconds': sum(stage['cpu_seconds'] for stage in top_level),
+            'peak_rss_mb': _peak_rss_mb(),
+        }
+
+    def write_json(self, path=DEFAULT_PROFILE_PATH):
+        """Write the stage report as JSON"""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+
+    def summary_table(self):
+        """Readable fixed-width table of the recorded stages, nested stages indented under their parent"""
+        header = f"{'Stage':<40}{'Wall s':>9}{'CPU s':>9}{'Peak +MB':>10}{'Rows in':>12}{'Rows out':>12}"
+        lines = [header, '-' * len(header)]
+        for stage in self.stages:
+            rows_in = '' if stage['rows_in'] is None else f"{stage['rows_in']:,}"
+            rows_out = '' if stage['rows_out'] is None else f"{stage['rows_out']:,}"
+            name = '  ' * stage['depth'] + stage['stage']
+            lines.append(f"{name:<40}{stage['wall_seconds']:>9.2f}{stage['cpu_seconds']:>9.2f}"
+                         f"{stage['peak_rss_delta_mb']:>10.1f}{rows_in:>12}{rows_out:>12}")
+        report = self.report()
+        lines.append('-' * len(header))
+        lines.append(f"{'Total':<40}{report['total_wall_seconds']:>9.2f}{report['total_cpu_seconds']:>9.2f}"
+                     f"{'':>10}{'':>12}{'':>12}")
+        lines.append(f"Peak RSS: {report['peak_rss_mb']:,.1f} MB")
+        return '\n'.join(lines)
+
+    def print_summary(self):
+        """Print the summary table"""
+        print("\n=== Pipeline Profile ===")
+        print(self.summary_table())
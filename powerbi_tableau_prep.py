@@ -1,55 +1,176 @@
+import os
+import io
+import contextlib
 import pandas as pd
 import numpy as np
 from datetime import datetime
 
-def prepare_data_for_powerbi_tableau():
+from date_parsing import parse_datetimes
+from aggregation_engine import compute_aggregates, exclude_country, DEFAULT_METRICS
+from distinct_sketch import approximate_metrics
+from columnar_storage import write_columnar
+from streaming_ingest import stream_aggregates, csv_chunk_writer, DEFAULT_CHUNK_ROWS
+from source_cache import load_source, record_source_stats, source_fingerprint
+from column_cache import open_column_cache, write_column_cache
+from incremental_refresh import refresh_from_source, STATE_DIR
+from memory_schema import to_compact_schema
+from derived_columns import add_date_dimensions, distinct_values, stock_code_category
+from aggregate_cube import build_cube, merge_cubes, save_cube
+from parallel_execution import run_partitioned
+from row_subsets import take_rows
+from csv_export import export_csv, format_export_stats, compressed_path
+from partitioned_output import write_partitioned
+from pipeline_profiler import PipelineProfiler, DEFAULT_PROFILE_PATH
+from result_cache import ResultCache, code_version
+
+SOURCE_FILE = 'Online Retail Data Set (1).xlsx'
+
+# Entry of the shared column cache holding the prepared frame
+COLUMN_CACHE_NAME = 'powerbi_tableau_prep'
+
+# Modules whose code the prepared frame and its aggregates depend on, for the column and result cache keys
+PREPARATION_MODULES = [
+    'powerbi_tableau_prep', 'aggregation_engine', 'date_parsing', 'derived_columns', 'distinct_sketch',
+    'memory_schema', 'row_subsets', 'source_cache', 'column_cache'
+]
+
+# Files create_question_specific_datasets writes
+QUESTION_DATASET_FILES = [
+    'Q1_2011_Monthly_Data.csv', 'Q2_Countries_Revenue_Analysis.csv',
+    'Q3_Customer_Revenue_Analysis.csv', 'Q4_Country_Demand_Analysis.csv'
+]
+
+def prepare_data_for_powerbi_tableau(use_cache=True, compact_schema=False, profiler=None):
     """
     Prepare cleaned data specifically formatted for Power BI and Tableau
     with all necessary calculated fields and proper data types
+
+    The workbook is parsed once and reused from the source cache on later
+    runs, and the prepared frame is stored in the shared column cache, which
+    later runs (and business_insights.py) memory-map while the workbook is
+    unchanged; the cleaning statistics are kept in
+    df_clean.attrs['cleaning_stats'].
+    compact_schema=True converts the result to the memory-optimised schema.
+    profiler (a PipelineProfiler) records the load/parse/clean/derive stages.
     """
+    profiler = profiler or PipelineProfiler(enabled=False)
     
     print("Loading and preparing data for Power BI/Tableau...")
     
-    # Load the original data
-    df = pd.read_excel('Online Retail Data Set (1).xlsx')
+    if use_cache:
+        # The prepared columns of an unchanged workbook are memory-mapped instead of rebuilt
+        with profiler.stage('load:column_cache') as stage:
+            code = code_version(*PREPARATION_MODULES)
+            fingerprint = source_fingerprint(SOURCE_FILE)
+            df_clean = open_column_cache(COLUMN_CACHE_NAME, fingerprint, categorical=compact_schema, code=code)
+            stage['rows_out'] = 0 if df_clean is None else len(df_clean)
+        if df_clean is not None:
+            print(f"Using cached columns of {SOURCE_FILE}")
+            print("Applying data quality checks...")
+            report_cleaning_stats(df_clean.attrs['cleaning_stats'])
+            return to_compact_schema(df_clean) if compact_schema else df_clean
+    
+    # Load the original data (converted once, then read from the source cache)
+    with profiler.stage('load') as stage:
+        df, _ = load_source(SOURCE_FILE, use_cache=use_cache, parse_dates=['InvoiceDate'])
+        stage['rows_out'] = len(df)
     
     # Convert InvoiceDate to datetime
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    with profiler.stage('parse_dates', rows_in=len(df)) as stage:
+        df['InvoiceDate'] = parse_datetimes(df['InvoiceDate'])
+        stage['rows_out'] = len(df)
     
     # Data cleaning - remove invalid records
     print("Applying data quality checks...")
     
     # Remove quantity less than 1 and unit price less than or equal to 0
-    df_clean = df[(df['Quantity'] >= 1) & (df['UnitPrice'] > 0)].copy()
-    
-    print(f"Original records: {len(df)}")
-    print(f"Clean records: {len(df_clean)}")
-    print(f"Removed: {len(df) - len(df_clean)} records")
+    with profiler.stage('clean', rows_in=len(df)) as stage:
+        df_clean = take_rows(df, ((df['Quantity'] >= 1) & (df['UnitPrice'] > 0)).to_numpy())
+        stage['rows_out'] = len(df_clean)
+    
+    # Record the cleaning statistics during this pass for the summary report
+    cleaning_stats = {
+        'raw_records': len(df),
+        'clean_records': len(df_clean),
+        'removed_records': len(df) - len(df_clean)
+    }
+    report_cleaning_stats(cleaning_stats)
+    if use_cache:
+        record_source_stats(SOURCE_FILE, **cleaning_stats)
     
     # Calculate derived fields
-    df_clean['Revenue'] = df_clean['Quantity'] * df_clean['UnitPrice']
+    with profiler.stage('derive_columns', rows_in=len(df_clean)) as stage:
+        df_clean['Revenue'] = df_clean['Quantity'] * df_clean['UnitPrice']
+        
+        df_clean = add_derived_fields(df_clean)
+        df_clean.attrs['cleaning_stats'] = cleaning_stats
+        if use_cache:
+            write_column_cache(df_clean, COLUMN_CACHE_NAME, fingerprint, code)
+        if compact_schema:
+            df_clean = to_compact_schema(df_clean)
+        stage['rows_out'] = len(df_clean)
+    
+    return df_clean
+
+def report_cleaning_stats(cleaning_stats):
+    """Print the record counts before and after cleaning"""
+    print(f"Original records: {cleaning_stats['raw_records']}")
+    print(f"Clean records: {cleaning_stats['clean_records']}")
+    print(f"Removed: {cleaning_stats['removed_records']} records")
+
+def prepare_data_in_parallel(workers, partition_by='month', metrics=None, compact_schema=False, profiler=None):
+    """
+    Clean, derive and aggregate the workbook on several processes
+
+    Same cleaned frame and aggregates as prepare_data_for_powerbi_tableau
+    followed by compute_aggregates; see parallel_execution.run_partitioned.
+    Returns (df_clean, aggregates).
+    """
+    profiler = profiler or PipelineProfiler(enabled=False)
+    
+    print(f"Loading and preparing data for Power BI/Tableau on {workers} workers...")
+    with profiler.stage('load') as stage:
+        df, _ = load_source(SOURCE_FILE, parse_dates=['InvoiceDate'])
+        stage['rows_out'] = len(df)
+    
+    with profiler.stage('partitioned_clean_and_aggregate', rows_in=len(df)) as stage:
+        df_clean, aggregates, stats = run_partitioned(df, add_derived_fields, partition_by, workers, metrics=metrics)
+        if compact_schema:
+            df_clean = to_compact_schema(df_clean)
+        stage['rows_out'] = len(df_clean)
+    
+    print(f"Original records: {stats['raw_records']}")
+    print(f"Clean records: {stats['clean_records']}")
+    print(f"Removed: {stats['removed_records']} records ({stats['partitions']} partitions)")
+    
+    df_clean.attrs['cleaning_stats'] = {name: stats[name] for name in
+                                        ['raw_records', 'clean_records', 'removed_records']}
+    return df_clean, aggregates
+
+def add_derived_fields(df_clean):
+    """
+    Add the date, customer, product, country and category fields to cleaned records
+
+    Date, stock code and country fields are computed once per distinct
+    day, code and country and broadcast back to the rows.
+    """
     
     # Date dimensions
-    df_clean['Year'] = df_clean['InvoiceDate'].dt.year
-    df_clean['Month'] = df_clean['InvoiceDate'].dt.month
-    df_clean['MonthName'] = df_clean['InvoiceDate'].dt.month_name()
-    df_clean['Quarter'] = df_clean['InvoiceDate'].dt.quarter
-    df_clean['DayOfWeek'] = df_clean['InvoiceDate'].dt.day_name()
-    df_clean['Date'] = df_clean['InvoiceDate'].dt.date
-    df_clean['YearMonth'] = df_clean['InvoiceDate'].dt.to_period('M').astype(str)
-    df_clean['WeekOfYear'] = df_clean['InvoiceDate'].dt.isocalendar().week
+    df_clean = add_date_dimensions(df_clean)
     
     # Customer analysis fields
     df_clean['HasCustomerID'] = df_clean['CustomerID'].notna()
     df_clean['CustomerID_Clean'] = df_clean['CustomerID'].fillna('Unknown')
     
     # Product categorization
-    df_clean['StockCode_Category'] = df_clean['StockCode'].str.extract('([A-Za-z]+)')
-    df_clean['StockCode_Category'] = df_clean['StockCode_Category'].fillna('Numeric')
+    codes, stock_codes = distinct_values(df_clean['StockCode'])
+    df_clean['StockCode_Category'] = stock_code_category(stock_codes).to_numpy()[codes]
     
     # Country grouping
-    df_clean['IsUK'] = df_clean['Country'] == 'United Kingdom'
-    df_clean['CountryGroup'] = df_clean['Country'].apply(lambda x: 'UK' if x == 'United Kingdom' else 'International')
+    codes, countries = distinct_values(df_clean['Country'])
+    is_uk = (countries == 'United Kingdom').to_numpy()
+    df_clean['IsUK'] = is_uk[codes]
+    df_clean['CountryGroup'] = np.where(is_uk, 'UK', 'International').astype(object)[codes]
     
     # Revenue categories
     df_clean['Revenue_Category'] = pd.cut(df_clean['Revenue'], 
@@ -63,49 +184,34 @@ def prepare_data_for_powerbi_tableau():
     
     return df_clean
 
-def create_question_specific_datasets(df_clean):
+def create_question_specific_datasets(df_clean, aggregates=None):
     """Create specific datasets for each question"""
     
+    # All four datasets read from one shared aggregation pass
+    if aggregates is None:
+        aggregates = compute_aggregates(df_clean)
+    countries = exclude_country(aggregates['Country'])
+    
     # Question 1: 2011 Monthly Revenue Data
     print("Creating Q1 dataset - 2011 Monthly Revenue...")
-    df_2011 = df_clean[df_clean['Year'] == 2011].copy()
-    
-    # Monthly aggregation for Q1
-    q1_monthly = df_2011.groupby(['Year', 'Month', 'MonthName', 'YearMonth']).agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'InvoiceNo': 'nunique',
-        'CustomerID': 'nunique'
-    }).reset_index()
-    q1_monthly.columns = ['Year', 'Month', 'MonthName', 'YearMonth', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Unique_Customers']
+    monthly = aggregates['YearMonth']
+    q1_monthly = monthly[monthly['Year'] == 2011][[
+        'Year', 'Month', 'MonthName', 'YearMonth',
+        'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Unique_Customers'
+    ]].reset_index(drop=True)
     q1_monthly.to_csv('Q1_2011_Monthly_Data.csv', index=False)
     
     # Question 2: Top Countries (excluding UK)
     print("Creating Q2 dataset - Top Countries...")
-    df_no_uk = df_clean[df_clean['Country'] != 'United Kingdom'].copy()
-    
-    q2_countries = df_no_uk.groupby('Country').agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'InvoiceNo': 'nunique',
-        'CustomerID': 'nunique'
-    }).reset_index()
-    q2_countries.columns = ['Country', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Unique_Customers']
+    q2_countries = countries[['Country', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Unique_Customers']]
     q2_countries = q2_countries.sort_values('Total_Revenue', ascending=False)
     q2_countries['Revenue_Rank'] = range(1, len(q2_countries) + 1)
     q2_countries.to_csv('Q2_Countries_Revenue_Analysis.csv', index=False)
     
     # Question 3: Customer Analysis
     print("Creating Q3 dataset - Customer Revenue...")
-    df_customers = df_clean[df_clean['CustomerID'].notna()].copy()
-    
-    q3_customers = df_customers.groupby('CustomerID').agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum',
-        'InvoiceNo': 'nunique',
-        'Country': 'first'
-    }).reset_index()
-    q3_customers.columns = ['CustomerID', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Country']
+    q3_customers = aggregates['CustomerID'][['CustomerID', 'Total_Revenue', 'Total_Quantity', 'Unique_Orders', 'Country']]
+    # The export ranks every customer, so this is the one place that needs a full sort
     q3_customers = q3_customers.sort_values('Total_Revenue', ascending=False)
     q3_customers['Revenue_Rank'] = range(1, len(q3_customers) + 1)
     q3_customers['CustomerID'] = q3_customers['CustomerID'].astype(int)
@@ -113,13 +219,7 @@ def create_question_specific_datasets(df_clean):
     
     # Question 4: Country Demand Analysis (excluding UK)
     print("Creating Q4 dataset - Country Demand...")
-    q4_demand = df_no_uk.groupby('Country').agg({
-        'Quantity': 'sum',
-        'Revenue': 'sum',
-        'InvoiceNo': 'nunique',
-        'CustomerID': 'nunique',
-        'StockCode': 'nunique'
-    }).reset_index()
+    q4_demand = countries[['Country', 'Total_Quantity', 'Total_Revenue', 'Unique_Orders', 'Unique_Customers', 'Unique_Products']]
     q4_demand.columns = ['Country', 'Total_Quantity_Demanded', 'Total_Revenue', 'Unique_Orders', 'Unique_Customers', 'Unique_Products']
     q4_demand = q4_demand.sort_values('Total_Quantity_Demanded', ascending=False)
     q4_demand['Demand_Rank'] = range(1, len(q4_demand) + 1)
@@ -129,6 +229,23 @@ def create_question_specific_datasets(df_clean):
     
     return q1_monthly, q2_countries, q3_customers, q4_demand
 
+def export_master_dataset(df_clean, master_file, storage_format='csv', compression=None, profiler=None):
+    """Write the master dataset as a typed columnar file or a (compressed) CSV"""
+    profiler = profiler or PipelineProfiler(enabled=False)
+    with profiler.stage(f'export:{master_file}', rows_in=len(df_clean)) as stage:
+        if storage_format == 'parquet':
+            write_columnar(df_clean, master_file)
+            print(f"Saved: {master_file}")
+        else:
+            stats = export_csv(df_clean, {master_file: None}, compression=compression)
+            print(f"Saved: {format_export_stats(master_file, stats[master_file])}")
+        stage['rows_out'] = len(df_clean)
+
+def summarise_prepared_data(df_clean):
+    """Record count, invoice date range and removed records of the prepared frame, for the summary report"""
+    return (len(df_clean), df_clean['InvoiceDate'].min(), df_clean['InvoiceDate'].max(),
+            df_clean.attrs['cleaning_stats']['removed_records'])
+
 def create_data_dictionary():
     """Create a data dictionary for Power BI/Tableau users"""
     
@@ -203,24 +320,187 @@ def create_data_dictionary():
     
     return dict_df
 
-def main():
-    """Main execution function"""
+def stream_data_for_powerbi_tableau(master_file, chunk_rows=DEFAULT_CHUNK_ROWS, memory_limit_mb=None,
+                                    cube_parts=None, metrics=None):
+    """
+    Streaming variant of prepare_data_for_powerbi_tableau: cleans, derives and
+    saves the master dataset chunk by chunk while aggregating for Q1-Q4
+
+    When cube_parts is a list, a partial aggregate cube of each chunk is
+    appended to it for merge_cubes.
+    """
+    print("Streaming and preparing data for Power BI/Tableau...")
+    callbacks = [csv_chunk_writer(master_file)]
+    if cube_parts is not None:
+        callbacks.append(lambda chunk: cube_parts.append(build_cube(chunk)))
+    aggregates, stats = stream_aggregates(SOURCE_FILE, derive=add_derived_fields,
+                                          chunk_rows=chunk_rows, memory_limit_mb=memory_limit_mb,
+                                          on_chunk=callbacks, metrics=metrics)
+    
+    print(f"Original records: {stats['raw_records']}")
+    print(f"Clean records: {stats['clean_records']}")
+    print(f"Removed: {stats['removed_records']} records")
+    
+    return aggregates, stats
+
+def main(storage_format='csv', streaming=False, chunk_rows=DEFAULT_CHUNK_ROWS, memory_limit_mb=None,
+         incremental=False, delta_path=None, compact_schema=False,
+         profile=False, profile_path=DEFAULT_PROFILE_PATH, cube_path=None, distinct_error=None,
+         parallel_workers=None, partition_by='month', csv_compression=None,
+         partitioned_dir=None, partition_columns=None, result_cache=True):
+    """
+    Main execution function
+
+    storage_format='parquet' writes the master dataset as a typed columnar
+    file instead of CSV. streaming=True processes the workbook in chunks
+    under an optional memory ceiling (CSV output only). incremental=True
+    folds only invoice rows not folded before (or the rows in delta_path) into
+    persisted aggregates and rewrites the Q1-Q4 datasets; the master dataset
+    is left as it is in that mode. compact_schema=True keeps the cleaned frame
+    in the categorical/downcast schema and reports its memory savings.
+    profile=True records per-stage timing and memory, prints a summary table
+    and writes the JSON report to profile_path. cube_path persists the
+    aggregate cube for ad-hoc queries (full and streaming modes).
+    distinct_error (e.g. 0.01) switches the unique order/customer/product
+    counts to mergeable HyperLogLog estimates with that relative standard
+    error; exact counts are the default. parallel_workers prepares and
+    aggregates the full load on that many processes, partitioned by
+    partition_by ('month' or 'invoice'), with identical results.
+    csv_compression ('gzip' or 'zstd') compresses the master CSV.
+    partitioned_dir also writes the master dataset as Year/Month partitions
+    (partition_columns, e.g. ['Year', 'Month', 'CountryGroup']) with a
+    manifest; a rerun rewrites only the partitions whose rows changed.
+    result_cache=True (full load only) keeps the aggregates, the master
+    dataset, the Q1-Q4 datasets and the data dictionary in a result cache
+    keyed on the workbook's content, the options and the code version:
+    outputs whose inputs are unchanged are restored instead of rebuilt, and
+    the frame is loaded only when a stage has to run.
+    """
     print("=== POWER BI / TABLEAU DATA PREPARATION ===")
     print("Preparing cleaned datasets and documentation...")
     print("=" * 60)
     
-    # Prepare main cleaned dataset
-    df_clean = prepare_data_for_powerbi_tableau()
-    
-    # Save main cleaned dataset
-    df_clean.to_csv('Master_Cleaned_Retail_Data.csv', index=False)
-    print("Saved: Master_Cleaned_Retail_Data.csv")
+    if streaming and incremental:
+        raise ValueError("Choose either streaming or incremental mode")
+    if cube_path is not None and incremental:
+        raise ValueError("The aggregate cube is built in full or streaming mode")
+    if parallel_workers is not None and (streaming or incremental):
+        raise ValueError("Parallel mode applies to the full load only")
+    if csv_compression is not None and (streaming or incremental or storage_format != 'csv'):
+        raise ValueError("CSV compression applies to the full-load CSV export")
+    if partitioned_dir is not None and (streaming or incremental):
+        raise ValueError("Partitioned output is written from the full load")
+    
+    profiler = PipelineProfiler(enabled=profile)
+    metrics = None if distinct_error is None else approximate_metrics(DEFAULT_METRICS, distinct_error)
+    cube_parts = [] if cube_path is not None else None
+    full_load = not (incremental or streaming or parallel_workers is not None)
+    cache = ResultCache() if result_cache and full_load else None
+    
+    if incremental:
+        master_file = 'Master_Cleaned_Retail_Data.csv'
+        print("Refreshing aggregates incrementally...")
+        with profiler.stage('incremental_refresh'):
+            aggregates, summary = refresh_from_source(SOURCE_FILE, derive=add_derived_fields,
+                                                      state_dir=os.path.join(STATE_DIR, 'powerbi_tableau_prep'),
+                                                      delta_path=delta_path, metrics=metrics)
+        df_clean = None
+        n_clean = summary['clean_records']
+        first_invoice, last_invoice = summary['first_invoice'], summary['last_invoice']
+        removed_records = summary['removed_records']
+    elif streaming:
+        if storage_format != 'csv':
+            raise ValueError("Streaming mode exports CSV only")
+        master_file = 'Master_Cleaned_Retail_Data.csv'
+        with profiler.stage('streaming_ingest_and_export'):
+            aggregates, stats = stream_data_for_powerbi_tableau(master_file, chunk_rows, memory_limit_mb,
+                                                                 cube_parts, metrics)
+        print(f"Saved: {master_file}")
+        df_clean = None
+        n_clean = stats['clean_records']
+        first_invoice, last_invoice = stats['first_invoice'], stats['last_invoice']
+        removed_records = stats['removed_records']
+    elif parallel_workers is not None:
+        df_clean, aggregates = prepare_data_in_parallel(parallel_workers, partition_by, metrics,
+                                                        compact_schema, profiler)
+    elif cache is not None:
+        # Prepare and aggregate only when the workbook, the options or the code changed
+        preparation_key = {'source': source_fingerprint(SOURCE_FILE)['sha256'],
+                           'code': code_version(*PREPARATION_MODULES),
+                           'compact_schema': compact_schema, 'distinct_error': distinct_error}
+        loaded = {}
+        
+        def prepare_and_aggregate():
+            loaded['df'] = prepare_data_for_powerbi_tableau(compact_schema=compact_schema, profiler=profiler)
+            with profiler.stage('aggregate', rows_in=len(loaded['df'])):
+                return compute_aggregates(loaded['df'], metrics=metrics), summarise_prepared_data(loaded['df'])
+        
+        def prepared_frame():
+            # Loaded after a cache hit only for the stages that still run; its log was replayed with the hit
+            if 'df' not in loaded:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    loaded['df'] = prepare_data_for_powerbi_tableau(compact_schema=compact_schema, profiler=profiler)
+            return loaded['df']
+        
+        (aggregates, data_summary), _ = cache.run('prepare', preparation_key, prepare_and_aggregate)
+        n_clean, first_invoice, last_invoice, removed_records = data_summary
+        
+        master_file = ('Master_Cleaned_Retail_Data.parquet' if storage_format == 'parquet'
+                       else compressed_path('Master_Cleaned_Retail_Data.csv', csv_compression))
+        export_key = dict(preparation_key, code=code_version(*PREPARATION_MODULES, 'csv_export', 'columnar_storage'),
+                          storage_format=storage_format, compression=csv_compression)
+        cache.run('export', export_key, lambda: export_master_dataset(prepared_frame(), master_file, storage_format,
+                                                                      csv_compression, profiler),
+                  files=[master_file])
+        # The partitioned copy and the cube are built from the rows themselves
+        df_clean = prepared_frame() if partitioned_dir is not None or cube_path is not None else None
+    else:
+        # Prepare main cleaned dataset
+        df_clean = prepare_data_for_powerbi_tableau(compact_schema=compact_schema, profiler=profiler)
+        with profiler.stage('aggregate', rows_in=len(df_clean)):
+            aggregates = compute_aggregates(df_clean, metrics=metrics)
+    
+    # Save main cleaned dataset (streaming mode wrote it chunk by chunk, the cache branch above already did)
+    if df_clean is not None and cache is None:
+        master_file = ('Master_Cleaned_Retail_Data.parquet' if storage_format == 'parquet'
+                       else compressed_path('Master_Cleaned_Retail_Data.csv', csv_compression))
+        export_master_dataset(df_clean, master_file, storage_format, csv_compression, profiler)
+        n_clean, first_invoice, last_invoice, removed_records = summarise_prepared_data(df_clean)
+    
+    # Partitioned copy of the master dataset for readers that need only some months or countries
+    if partitioned_dir is not None:
+        with profiler.stage('export:partitioned', rows_in=len(df_clean)) as stage:
+            manifest = write_partitioned(df_clean, partitioned_dir, partition_columns, storage_format,
+                                         csv_compression)
+            stage['rows_out'] = len(df_clean)
+        print(f"Saved: {partitioned_dir} ({len(manifest['partitions'])} partitions, "
+              f"{len(manifest['written'])} rewritten, {len(manifest['removed'])} removed)")
+    totals = aggregates['totals']
+    
+    # Persist the aggregate cube for ad-hoc slice-and-dice queries
+    if cube_path is not None:
+        with profiler.stage('build_cube'):
+            cube = build_cube(df_clean) if df_clean is not None else merge_cubes(cube_parts)
+            save_cube(cube, cube_path)
+        print(f"Saved: {cube_path}")
     
     # Create question-specific datasets
-    q1_data, q2_data, q3_data, q4_data = create_question_specific_datasets(df_clean)
-    
-    # Create data dictionary
-    data_dict = create_data_dictionary()
+    with profiler.stage('export:question_datasets') as stage:
+        if cache is not None:
+            datasets, _ = cache.run('question_datasets', preparation_key,
+                                    lambda: create_question_specific_datasets(df_clean, aggregates),
+                                    files=QUESTION_DATASET_FILES)
+        else:
+            datasets = create_question_specific_datasets(df_clean, aggregates)
+        q1_data, q2_data, q3_data, q4_data = datasets
+        stage['rows_out'] = len(q1_data) + len(q2_data) + len(q3_data) + len(q4_data)
+    
+    # Create data dictionary (it depends on the code alone)
+    if cache is not None:
+        data_dict, _ = cache.run('data_dictionary', {'code': code_version('powerbi_tableau_prep')},
+                                 create_data_dictionary, files=['Data_Dictionary.csv'])
+    else:
+        data_dict = create_data_dictionary()
     print("Saved: Data_Dictionary.csv")
     
     # Create summary report
@@ -228,17 +508,17 @@ def main():
 DATA PREPARATION SUMMARY
 ========================
 
-Total Records After Cleaning: {len(df_clean):,}
-Date Range: {df_clean['InvoiceDate'].min()} to {df_clean['InvoiceDate'].max()}
-Countries: {df_clean['Country'].nunique()}
-Customers: {df_clean['CustomerID'].nunique()}
-Products: {df_clean['StockCode'].nunique()}
-Total Revenue: £{df_clean['Revenue'].sum():,.2f}
+Total Records After Cleaning: {n_clean:,}
+Date Range: {first_invoice} to {last_invoice}
+Countries: {len(aggregates['Country'])}
+Customers: {totals['Unique_Customers']}
+Products: {totals['Unique_Products']}
+Total Revenue: £{totals['Total_Revenue']:,.2f}
 
 FILES CREATED FOR POWER BI/TABLEAU:
 ===================================
 
-1. Master_Cleaned_Retail_Data.csv
+1. {master_file}
    - Complete cleaned dataset with all derived fields
    - Use this for comprehensive analysis across all questions
 
@@ -280,7 +560,7 @@ TABLEAU IMPORT INSTRUCTIONS:
 
 DATA QUALITY NOTES:
 ===================
-- Removed {len(pd.read_excel('Online Retail Data Set (1).xlsx')) - len(df_clean):,} records with invalid quantity (<1) or price (≤0)
+- Removed {removed_records:,} records with invalid quantity (<1) or price (≤0)
 - Missing CustomerIDs handled with 'Unknown' category
 - All monetary values are in British Pounds (£)
 - Revenue calculated as Quantity × UnitPrice after data cleaning
@@ -293,7 +573,7 @@ DATA QUALITY NOTES:
     print("\n" + "=" * 60)
     print("DATA PREPARATION COMPLETE!")
     print("\nGenerated Files:")
-    print("- Master_Cleaned_Retail_Data.csv")
+    print(f"- {master_file}")
     print("- Q1_2011_Monthly_Data.csv")
     print("- Q2_Countries_Revenue_Analysis.csv") 
     print("- Q3_Customer_Revenue_Analysis.csv")
@@ -301,6 +581,13 @@ DATA QUALITY NOTES:
     print("- Data_Dictionary.csv")
     print("- Data_Preparation_Summary.txt")
     print("\nThese files are ready for import into Power BI or Tableau!")
+    
+    if cache is not None:
+        cache.print_summary()
+    
+    if profile:
+        profiler.print_summary()
+        print(f"Profile report: {profiler.write_json(profile_path)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,380 @@
+from collections import Counter, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_datetimes
+from aggregation_engine import compute_aggregates, DEFAULT_METRICS, DEFAULT_ATTRIBUTES
+from columnar_storage import read_columnar, apply_filters, filter_mask
+from pipeline_profiler import PipelineProfiler
+from source_cache import load_source
+from streaming_ingest import clean_chunk
+
+# Columns the cleaning step reads and the column it adds
+CLEAN_INPUTS = {'Quantity', 'UnitPrice', 'InvoiceDate'}
+CLEAN_OUTPUTS = {'Revenue'}
+
+# One step of a plan. Nodes are plain tuples, so equal subplans compare and
+# hash equal and are run once however many plans contain them
+PlanNode = namedtuple('PlanNode', ['op', 'params', 'input'])
+
+# Result of a filter read only by aggregations: its input frame and the mask of kept rows
+MaskedFrame = namedtuple('MaskedFrame', ['frame', 'rows'])
+
+
+class LazyFrame:
+    """
+    A recorded pipeline over one source. Every method returns a new frame
+    with one more step; nothing is read or computed until collect (or
+    collect_all for several frames that share steps).
+    """
+
+    def __init__(self, node):
+        self.node = node
+
+    def clean(self):
+        """Drop rows with Quantity < 1 or UnitPrice <= 0, parse InvoiceDate and add Revenue"""
+        return LazyFrame(PlanNode('clean', (), self.node))
+
+    def derive(self, func, produces, requires=('InvoiceDate',)):
+        """Add the columns func computes from requires; func adds them to the frame it is given"""
+        return LazyFrame(PlanNode('derive', (func, tuple(produces), tuple(requires)), self.node))
+
+    def filter(self, column, op, value):
+        """Keep rows where column op value holds (read_columnar-style operators)"""
+        if isinstance(value, (list, set)):
+            value = tuple(value)
+        condition = ((column, op, value),)
+        if self.node.op == 'filter':
+            return LazyFrame(self.node._replace(params=self.node.params + condition))
+        return LazyFrame(PlanNode('filter', condition, self.node))
+
+    def select(self, columns):
+        """Keep only these columns"""
+        return LazyFrame(PlanNode('select', tuple(columns), self.node))
+
+    def aggregate(self, group_keys=None, metrics=None, attributes=None):
+        """compute_aggregates over the frame; the result is its dict of tables plus totals"""
+        metrics = DEFAULT_METRICS if metrics is None else metrics
+        attributes = DEFAULT_ATTRIBUTES if attributes is None else attributes
+        params = (tuple(group_keys or []), tuple(metrics.items()),
+                  tuple((key, tuple(cols)) for key, cols in attributes.items()))
+        return LazyFrame(PlanNode('aggregate', params, self.node))
+
+    def explain(self):
+        """Text of the optimized plan"""
+        return explain([self])
+
+    def collect(self, profiler=None):
+        """Optimize and run the plan"""
+        return collect_all([self], profiler)[0]
+
+
+def scan(path, use_cache=True):
+    """Lazy frame over a raw source (through the source cache) or a Parquet file"""
+    return LazyFrame(PlanNode('scan', (path, use_cache, None, ()), None))
+
+
+def _walk(roots):
+    """Every distinct node reachable from roots, each before its input"""
+    order, seen = [], set()
+
+    def visit(node):
+        if node in seen:
+            return
+        seen.add(node)
+        if node.input is not None:
+            visit(node.input)
+        order.append(node)
+
+    for root in roots:
+        visit(root)
+    return order[::-1]
+
+
+def _shared_nodes(roots):
+    """Nodes consumed by more than one plan or step"""
+    references = Counter(roots)
+    for node in _walk(roots):
+        if node.input is not None:
+            references[node.input] += 1
+    return {node for node, count in references.items() if count > 1}
+
+
+def _year_bounds(op, year):
+    """InvoiceDate conditions equivalent to comparing its calendar year with year, or None"""
+    start = pd.Timestamp(year=int(year), month=1, day=1)
+    end = pd.Timestamp(year=int(year) + 1, month=1, day=1)
+    bounds = {
+        '==': [('>=', start), ('<', end)],
+        '>=': [('>=', start)],
+        '>': [('>=', end)],
+        '<': [('<', start)],
+        '<=': [('<', end)],
+    }.get(op)
+    return None if bounds is None else [('InvoiceDate', bound_op, bound) for bound_op, bound in bounds]
+
+
+def _filter_through(condition, node):
+    """Conditions equivalent to condition below node, or None when it depends on node's output"""
+    col, op, value = condition
+    if node.op == 'clean':
+        return None if col in CLEAN_OUTPUTS else [condition]
+    if node.op == 'select':
+        return [condition]
+    if node.op == 'derive':
+        _, produces, requires = node.params
+        if col not in produces:
+            return [condition]
+        # Year is the calendar year of InvoiceDate, so it becomes a date range the reader can apply
+        if col == 'Year' and 'InvoiceDate' in requires and isinstance(value, (int, np.integer)):
+            return _year_bounds(op, value)
+    return None
+
+
+def _sink(conditions, node, shared):
+    """Place filter conditions on node, moving each below every step it does not depend on"""
+    if not conditions:
+        return node
+    if node in shared or node.op == 'aggregate':
+        return PlanNode('filter', tuple(conditions), node)
+    if node.op == 'filter':
+        return _sink(list(node.params) + list(conditions), node.input, shared)
+    if node.op == 'scan':
+        path, use_cache, columns, scan_filters = node.params
+        return node._replace(params=(path, use_cache, columns, scan_filters + tuple(conditions)))
+
+    passing, staying = [], []
+    for condition in conditions:
+        moved = _filter_through(condition, node)
+        if moved is None:
+            staying.append(condition)
+        else:
+            passing.extend(moved)
+    if passing:
+        node = node._replace(input=_sink(passing, node.input, shared))
+    return PlanNode('filter', tuple(staying), node) if staying else node
+
+
+def _push_filters(node, shared, memo):
+    """Rebuild node with its filters as close to the scan as sharing allows"""
+    if node not in memo:
+        child = None if node.input is None else _push_filters(node.input, shared, memo)
+        if node.op == 'filter':
+            result = _sink(list(node.params), child, shared)
+        else:
+            result = node._replace(input=child)
+        memo[node] = result
+        if node in shared:
+            shared.add(result)
+    return memo[node]
+
+
+def _input_columns(node, needed):
+    """Columns node needs from its input to produce needed (None: every column)"""
+    if node.op == 'aggregate':
+        group_keys, metrics, attributes = node.params
+        attributes = dict(attributes)
+        columns = set(group_keys) | {col for _, (col, _) in metrics}
+        return columns | {col for key in group_keys for col in attributes.get(key, ())}
+    if node.op == 'select':
+        # A select bounds its input's columns even when everything it outputs is needed
+        return set(node.params) if needed is None else needed & set(node.params)
+    if needed is None:
+        return None
+    if node.op == 'filter':
+        return needed | {col for col, _, _ in node.params}
+    if node.op == 'derive':
+        _, produces, requires = node.params
+        return (needed - set(produces)) | set(requires) if needed & set(produces) else needed
+    if node.op == 'clean':
+        return (needed - CLEAN_OUTPUTS) | CLEAN_INPUTS
+    return needed
+
+
+def _required_columns(roots):
+    """Columns every node must produce for all of its consumers (None: every column)"""
+    required = {root: None for root in roots}
+    for node in _walk(roots):
+        if node.input is None:
+            continue
+        columns = _input_columns(node, required[node])
+        if node.input not in required:
+            required[node.input] = columns
+        elif required[node.input] is not None:
+            required[node.input] = None if columns is None else required[node.input] | columns
+    return required
+
+
+def _mask_filters(roots):
+    """Filters read only by aggregations; they run as a row mask over their input instead of a copy"""
+    consumers = {}
+    for node in _walk(roots):
+        if node.input is not None:
+            consumers.setdefault(node.input, set()).add(node.op)
+    return {node for node, ops in consumers.items()
+            if node.op == 'filter' and ops == {'aggregate'} and node not in roots}
+
+
+def _project(node, required, memo, masked=frozenset()):
+    """
+    Rebuild node reading only the columns its consumers use: the scan gets a
+    column list, derive steps nobody reads from are dropped and filters that
+    copy rows work on a projection of their input.
+    """
+    if node in memo:
+        return memo[node]
+    needed = required[node]
+    child = None if node.input is None else _project(node.input, required, memo, masked)
+
+    if node.op == 'scan':
+        path, use_cache, _, filters = node.params
+        columns = None if needed is None else tuple(sorted(needed | {col for col, _, _ in filters}))
+        result = node._replace(params=(path, use_cache, columns, filters))
+    elif node.op == 'derive' and needed is not None and not needed & set(node.params[1]):
+        result = child
+    elif (node.op == 'filter' and node not in masked and needed is not None
+          and required[node.input] != _input_columns(node, needed)):
+        result = node._replace(input=PlanNode('select', tuple(sorted(_input_columns(node, needed))), child))
+    else:
+        result = node._replace(input=child)
+    memo[node] = result
+    return result
+
+
+def optimize(roots):
+    """
+    Optimize plan roots together: filters are pushed towards the reader
+    (Year filters become InvoiceDate ranges) unless that would split a step
+    other plans share, then every step is cut to the columns its consumers
+    read and derive steps whose columns are unused are removed.
+    """
+    shared = _shared_nodes(roots)
+    memo = {}
+    pushed = [_push_filters(root, set(shared), memo) for root in roots]
+    required = _required_columns(pushed)
+    masked = _mask_filters(pushed)
+    memo = {}
+    return [_project(root, required, memo, masked) for root in pushed]
+
+
+def _run_scan(path, use_cache, columns, filters):
+    """Read a source with the projection and filters pushed into the scan"""
+    if path.endswith('.parquet'):
+        return read_columnar(path, columns=list(columns) if columns else None, filters=list(filters) or None)
+
+    df, _ = load_source(path, use_cache=use_cache, parse_dates=['InvoiceDate'])
+    if columns is not None:
+        df = df[[col for col in df.columns if col in columns]]
+    if any(col == 'InvoiceDate' for col, _, _ in filters):
+        df = df.assign(InvoiceDate=parse_datetimes(df['InvoiceDate']))
+    return apply_filters(df, list(filters))
+
+
+def _aggregation_groups(nodes):
+    """Group keys of every aggregation over the same input, metrics and attributes, merged into one pass"""
+    groups = {}
+    for node in nodes:
+        if node.op == 'aggregate':
+            group_keys, metrics, attributes = node.params
+            keys = groups.setdefault((node.input, metrics, attributes), [])
+            keys.extend(key for key in group_keys if key not in keys)
+    return groups
+
+
+def _run_step(node, frame, aggregation_groups, merged, masked):
+    """Result of one step given the result of its input"""
+    if node.op == 'scan':
+        return _run_scan(*node.params)
+    if node.op == 'clean':
+        return clean_chunk(frame)
+    if node.op == 'derive':
+        # A shallow copy keeps the input unchanged for its other consumers
+        return node.params[0](frame.copy(deep=False))
+    if node.op == 'filter':
+        if node in masked:
+            return MaskedFrame(frame, filter_mask(frame, list(node.params)))
+        return apply_filters(frame, list(node.params))
+    if node.op == 'select':
+        return frame[[col for col in frame.columns if col in node.params]]
+
+    group_keys, metrics, attributes = node.params
+    spec = (node.input, metrics, attributes)
+    if spec not in merged:
+        frame, rows = frame if isinstance(frame, MaskedFrame) else (frame, None)
+        merged[spec] = compute_aggregates(frame, aggregation_groups[spec], dict(metrics), dict(attributes), rows)
+    result = {key: merged[spec][key] for key in group_keys}
+    result['totals'] = dict(merged[spec]['totals'])
+    return result
+
+
+def collect_all(frames, profiler=None):
+    """
+    Optimize and run several lazy frames together.
+
+    Steps they have in common (the scan, cleaning and derived columns of a
+    source, identical filters) run once, and aggregations over the same
+    input are merged into one compute_aggregates pass. Intermediate results
+    are released as soon as their last consumer has run, and filters read
+    only by aggregations become row masks rather than filtered copies. Accepts a list or
+    a dict of frames and returns the results in the same shape.
+    """
+    profiler = profiler or PipelineProfiler(enabled=False)
+    names = list(frames) if isinstance(frames, dict) else None
+    roots = optimize([frame.node for frame in (frames.values() if names is not None else frames)])
+
+    nodes = _walk(roots)[::-1]
+    consumers = Counter(node.input for node in nodes if node.input is not None)
+    aggregation_groups = _aggregation_groups(nodes)
+    masked = _mask_filters(roots)
+    results, merged = {}, {}
+    for node in nodes:
+        frame = None if node.input is None else results[node.input]
+        rows_in = frame.rows.sum() if isinstance(frame, MaskedFrame) else None if frame is None else len(frame)
+        with profiler.stage(f"plan:{node.op}", rows_in=rows_in) as stage:
+            results[node] = _run_step(node, frame, aggregation_groups, merged, masked)
+            if isinstance(results[node], MaskedFrame):
+                stage['rows_out'] = int(results[node].rows.sum())
+            elif isinstance(results[node], pd.DataFrame):
+                stage['rows_out'] = len(results[node])
+        if node.input is not None:
+            consumers[node.input] -= 1
+            if not consumers[node.input] and node.input not in roots:
+                del results[node.input]
+
+    output = [results[root] for root in roots]
+    return dict(zip(names, output)) if names is not None else output
+
+
+def _describe(node):
+    """One-line description of a plan step"""
+    if node.op == 'scan':
+        path, _, columns, filters = node.params
+        text = f"scan {path} columns={'all' if columns is None else list(columns)}"
+        return text + (f" filters={list(filters)}" if filters else '')
+    if node.op == 'clean':
+        return "clean Quantity >= 1, UnitPrice > 0, +Revenue"
+    if node.op == 'derive':
+        func, produces, _ = node.params
+        return f"derive {getattr(func, '__name__', func)} -> {', '.join(produces)}"
+    if node.op == 'filter':
+        return "filter " + " and ".join(f"{col} {op} {value!r}" for col, op, value in node.params)
+    if node.op == 'select':
+        return f"select {', '.join(node.params)}"
+    group_keys, metrics, _ = node.params
+    return f"aggregate by {list(group_keys)}: {', '.join(name for name, _ in metrics)}"
+
+
+def explain(frames):
+    """Text of the optimized plans; steps run once for several consumers are marked [shared]"""
+    frames = list(frames.values()) if isinstance(frames, dict) else list(frames)
+    roots = optimize([frame.node for frame in frames])
+    shared = _shared_nodes(roots)
+    lines = []
+    for index, root in enumerate(roots):
+        lines.append(f"plan {index}:")
+        node, depth = root, 1
+        while node is not None:
+            lines.append('  ' * depth + _describe(node) + (' [shared]' if node in shared else ''))
+            node, depth = node.input, depth + 1
+    return "\n".join(lines)
@@ -0,0 +1,187 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from aggregation_engine import compute_aggregates
+from chart_rendering import render_jobs, DEFAULT_DPI, DEFAULT_FORMAT
+from result_cache import ResultCache
+from retail_analysis import (
+    load_and_clean_data, question_1_time_series_2011, question_2_top_countries,
+    question_3_top_customers, question_4_demand_by_country
+)
+
+DEFAULT_BATCH_DIR = 'Question_Batch'
+MANIFEST_NAME = 'manifest.json'
+
+# Question -> (table function, the grid parameters it takes, in directory order)
+QUESTIONS = {
+    'q1': (question_1_time_series_2011, ['year']),
+    'q2': (question_2_top_countries, ['exclude', 'top']),
+    'q3': (question_3_top_customers, ['top']),
+    'q4': (question_4_demand_by_country, ['exclude']),
+}
+
+# Grid of the single-run reports; a batch grid overrides some or all of it
+DEFAULT_GRID = {'year': [2011], 'exclude': ['United Kingdom'], 'top': [10]}
+
+# Grid value standing for every year, or every country, in the data
+ALL = 'all'
+
+
+def resolve_grid(grid, aggregates):
+    """The grid with ALL replaced by the years or countries present in the aggregates"""
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    present = {
+        'year': sorted(int(year) for year in aggregates['YearMonth']['Year'].unique()),
+        'exclude': sorted(aggregates['Country']['Country']),
+    }
+    return {name: present[name] if ALL in values else list(dict.fromkeys(values))
+            for name, values in grid.items()}
+
+
+def expand_variants(grid, questions=None):
+    """
+    (question, params) for every combination of the grid values each
+    question takes; a question only varies over its own parameters, so Q3
+    runs once per top value however many years and countries are listed
+    """
+    variants = []
+    for question in questions or QUESTIONS:
+        names = QUESTIONS[question][1]
+        for values in itertools.product(*[grid[name] for name in names]):
+            variants.append((question, dict(zip(names, values))))
+    return variants
+
+
+def variant_dir(output_dir, question, params):
+    """Hive-style directory of one variant, e.g. q2/exclude=Germany/top=5"""
+    return os.path.join(output_dir, question, *[f"{name}={quote(str(value), safe='')}"
+                                                 for name, value in params.items()])
+
+
+def _write_variant(aggregates, question, params, output_dir):
+    """Answer one variant from the shared aggregates and write its table; returns (table, directory)"""
+    table = QUESTIONS[question][0](None, aggregates, render=False, **params)
+    directory = variant_dir(output_dir, question, params)
+    os.makedirs(directory, exist_ok=True)
+    table.to_csv(os.path.join(directory, 'table.csv'), index=False)
+    return table, directory
+
+
+def _remove_stale_outputs(output_dir, variants):
+    """
+    Delete what earlier batches wrote that this one does not: the files in
+    each variant directory that its manifest entry does not list (e.g. a
+    chart left from a --charts run), and the variant directories the
+    previous manifest lists that are no longer in the grid
+    """
+    for variant in variants:
+        directory = os.path.join(output_dir, variant['dir'])
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name not in variant['files']:
+                os.remove(entry.path)
+
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return
+    kept = {variant['dir'] for variant in variants}
+    for variant in previous.get('variants', []):
+        directory = os.path.join(output_dir, variant['dir'])
+        if variant['dir'] not in kept and os.path.isdir(directory):
+            shutil.rmtree(directory)
+            # Parameter directories left empty (e.g. exclude=Germany once all its top=N are gone) go too
+            parent = os.path.dirname(directory)
+            while os.path.normpath(parent) != os.path.normpath(output_dir) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+
+
+def run_batch(aggregates, grid=None, questions=None, output_dir=DEFAULT_BATCH_DIR, charts=False,
+              workers=None, dpi=DEFAULT_DPI, fmt=DEFAULT_FORMAT, cache=None):
+    """
+    Answer every question variant of a parameter grid ({'year': [2010, 2011],
+    'exclude': ['United Kingdom', 'Germany'], 'top': [5, 10]}, ALL for every
+    year or country) from one set of aggregates and write each to its own
+    directory under output_dir, with a manifest listing them.
+
+    All variants read the same grouped tables: a year or an excluded
+    country is a filter on the per-month or per-country aggregates, so no
+    variant rescans the rows. Tables are built and written on workers
+    threads; with charts=True the charts are rendered in that many
+    processes, restored from cache (a ResultCache) when unchanged.
+    """
+    grid = resolve_grid(grid, aggregates)
+    variants = expand_variants(grid, questions)
+
+    # The question functions print their headings; a batch only reports its totals
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_write_variant, aggregates, question, params, output_dir)
+                   for question, params in variants]
+        results = [future.result() for future in futures]
+
+    chart_jobs = []
+    if charts:
+        # A year without sales, or a grid leaving no countries, has nothing to plot
+        chart_jobs = [(question, table, os.path.join(directory, f"chart.{fmt}"), params)
+                      for (question, params), (table, directory) in zip(variants, results) if len(table)]
+        render_jobs(chart_jobs, workers, dpi, fmt, cache)
+    charted = {path for _, _, path, _ in chart_jobs}
+
+    manifest = {'grid': grid, 'variants': []}
+    for (question, params), (table, directory) in zip(variants, results):
+        files = ['table.csv'] + [os.path.basename(path) for path in charted
+                                 if os.path.dirname(path) == directory]
+        manifest['variants'].append({'question': question, 'params': params, 'rows': len(table),
+                                     'dir': os.path.relpath(directory, output_dir), 'files': files})
+    _remove_stale_outputs(output_dir, manifest['variants'])
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return manifest
+
+
+def _grid_value(cast):
+    """argparse type accepting ALL or a value of the given type"""
+    return lambda text: text if text == ALL else cast(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer the retail questions for a grid of parameters in one run")
+    parser.add_argument('--years', nargs='+', type=_grid_value(int), help=f"Q1 years, or '{ALL}'")
+    parser.add_argument('--exclude', nargs='+', help=f"Q2/Q4 excluded home markets, or '{ALL}'")
+    parser.add_argument('--top', nargs='+', type=int, help="Q2/Q3 list lengths")
+    parser.add_argument('--questions', nargs='+', choices=list(QUESTIONS))
+    parser.add_argument('--output', default=DEFAULT_BATCH_DIR)
+    parser.add_argument('--charts', action='store_true', help="also render each variant's chart")
+    parser.add_argument('--workers', type=int, help="threads for the tables, processes for the charts")
+    parser.add_argument('--chart-dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--chart-format', default=DEFAULT_FORMAT)
+    parser.add_argument('--no-cache', action='store_true', help="rebuild the cleaned frame and every chart")
+    args = parser.parse_args(argv)
+
+    grid = {name: values for name, values in [('year', args.years), ('exclude', args.exclude), ('top', args.top)]
+            if values}
+    df_clean = load_and_clean_data(use_cache=not args.no_cache)
+    aggregates = compute_aggregates(df_clean)
+    cache = None if args.no_cache else ResultCache()
+    manifest = run_batch(aggregates, grid, args.questions, args.output, args.charts, args.workers,
+                         args.chart_dpi, args.chart_format, cache)
+
+    counts = {}
+    for variant in manifest['variants']:
+        counts[variant['question']] = counts.get(variant['question'], 0) + 1
+    print(f"\nWrote {len(manifest['variants'])} variants to {args.output}/ "
+          f"({', '.join(f'{question}: {count}' for question, count in counts.items())})")
+    if cache is not None and args.charts:
+        cache.print_summary()
+
+
+if __name__ == "__main__":
+    main()
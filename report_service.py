@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+import pandas as pd
+
+from aggregation_engine import compute_aggregates
+from business_insights import generate_business_insights, insights_frame
+from chart_rendering import CHART_RENDERERS, DEFAULT_DPI
+from source_cache import source_fingerprint
+from retail_analysis import (
+    load_and_clean_data, question_1_time_series_2011, question_2_top_countries,
+    question_3_top_customers, question_4_demand_by_country, SOURCE_CSV
+)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8050
+
+# Seconds between checks of the source file for changes
+DEFAULT_POLL_SECONDS = 2.0
+
+# Responses kept for the current data version; the least recently used are dropped first
+MAX_CACHED_RESPONSES = 256
+
+# Question -> (table function, accepted query parameters and their types)
+QUESTIONS = {
+    'q1': (question_1_time_series_2011, {'year': int}),
+    'q2': (question_2_top_countries, {'top': int, 'exclude': str}),
+    'q3': (question_3_top_customers, {'top': int}),
+    'q4': (question_4_demand_by_country, {'exclude': str}),
+}
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    """A request the service cannot answer, with its HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _quietly(func, *args, **kwargs):
+    """Call func with its console output captured; returns (result, printed text)"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = func(*args, **kwargs)
+    return result, output.getvalue()
+
+
+def _serialise_table(table, fmt):
+    """Body and content type of a question table as JSON records or CSV"""
+    # Periods (YearMonth) have no JSON form; their text is what the CSV exports show
+    table = table.astype({col: str for col in table.columns if isinstance(table[col].dtype, pd.PeriodDtype)})
+    if fmt == 'csv':
+        return table.to_csv(index=False).encode(), 'text/csv; charset=utf-8'
+    return table.to_json(orient='records', date_format='iso').encode(), 'application/json'
+
+
+def _parse_params(params, accepted):
+    """Typed query parameters, rejecting unknown names and malformed values"""
+    unknown = set(params) - set(accepted)
+    if unknown:
+        raise RequestError(400, f"Unknown parameters: {sorted(unknown)}")
+    try:
+        return {name: accepted[name](value) for name, value in params.items()}
+    except ValueError as exc:
+        raise RequestError(400, str(exc)) from exc
+
+
+class ReportService:
+    """
+    Long-running report service over one source file.
+
+    The cleaned frame and its aggregates are loaded once and kept in memory;
+    question tables, charts and the insights report are built from them on
+    a background thread so the event loop keeps answering. Responses are
+    cached by path, parameters and data version (the source's content hash)
+    and the cache is dropped when a poll finds the source file changed,
+    after the new data has been loaded. Identical requests arriving while
+    one is being built wait for that one instead of building it again.
+    """
+
+    def __init__(self, source=SOURCE_CSV, use_cache=True, poll_seconds=DEFAULT_POLL_SECONDS,
+                 max_cached=MAX_CACHED_RESPONSES):
+        self.source = source
+        self.use_cache = use_cache
+        self.poll_seconds = poll_seconds
+        self.max_cached = max_cached
+        self.data = None
+        self.stats = {'hits': 0, 'misses': 0, 'reloads': 0}
+        self._responses = OrderedDict()
+        self._pending = {}
+        # One worker: jobs capture stdout, which is process-wide
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._watcher = None
+
+    def _source_stat(self):
+        """Cheap change marker of the source file"""
+        stat = os.stat(self.source)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _load(self):
+        """Clean and aggregate the source; runs on the worker thread"""
+        start = time.perf_counter()
+        fingerprint = source_fingerprint(self.source)
+        df_clean, _ = _quietly(load_and_clean_data, use_cache=self.use_cache, source=self.source)
+        aggregates = compute_aggregates(df_clean)
+        return {
+            'df': df_clean,
+            'aggregates': aggregates,
+            'insights_frame': insights_frame(df_clean),
+            'version': fingerprint['sha256'][:16],
+            'source_stat': (fingerprint['size'], fingerprint['mtime_ns']),
+            'rows': len(df_clean),
+            'loaded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'load_seconds': time.perf_counter() - start,
+        }
+
+    async def reload(self):
+        """Load the current source and swap it in; cached responses are dropped if its content changed"""
+        data = await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+        if self.data is None or self.data['version'] != data['version']:
+            self._responses.clear()
+        self.data = data
+        self.stats['reloads'] += 1
+        print(f"Loaded {self.source}: {data['rows']:,} rows, version {data['version']} "
+              f"({data['load_seconds']:.1f} s)")
+
+    async def _watch(self):
+        """Reload whenever the source file's size or modification time changes"""
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                if self._source_stat() != self.data['source_stat']:
+                    await self.reload()
+            except Exception as exc:
+                # A half-written or missing source keeps the previous data in service
+                print(f"Reload of {self.source} failed, still serving version {self.data['version']}: {exc}")
+
+    async def start(self):
+        """Load the data and start watching the source"""
+        await self.reload()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Stop watching the source and release the worker thread"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._watcher
+        self._executor.shutdown(wait=False)
+
+    def _route(self, path, params):
+        """Builder for a request path, its parsed parameters and whether the response is cacheable"""
+        parts = [part for part in path.split('/') if part]
+        fmt = params.pop('format', 'json')
+        if parts == ['health']:
+            return self._health, {}, False
+        if parts == ['insights']:
+            _parse_params(params, {})
+            return self._insights, {}, True
+        if len(parts) == 1 and parts[0] in QUESTIONS:
+            if fmt not in ('json', 'csv'):
+                raise RequestError(400, "format must be 'json' or 'csv'")
+            return self._table, dict(question=parts[0], fmt=fmt,
+                                     **_parse_params(params, QUESTIONS[parts[0]][1])), True
+        if len(parts) == 2 and parts[0] == 'charts' and parts[1] in QUESTIONS:
+            accepted = dict(QUESTIONS[parts[1]][1], dpi=int)
+            return self._chart, dict(question=parts[1], **_parse_params(params, accepted)), True
+        raise RequestError(404, f"No report at {path}")
+
+    def _health(self, data):
+        body = {name: data[name] for name in ('version', 'rows', 'loaded_at', 'load_seconds')}
+        body.update(self.stats, cached_responses=len(self._responses))
+        return json.dumps(body).encode(), 'application/json'
+
+    def _question_table(self, data, question, **params):
+        table, _ = _quietly(QUESTIONS[question][0], data['df'], data['aggregates'], render=False, **params)
+        return table
+
+    def _table(self, data, question, fmt, **params):
+        return _serialise_table(self._question_table(data, question, **params), fmt)
+
+    def _chart(self, data, question, dpi=DEFAULT_DPI, **params):
+        table = self._question_table(data, question, **params)
+        if not len(table):
+            # A year without sales, or a filter leaving no countries, has nothing to plot
+            raise RequestError(404, f"No {question} data to chart for {params}")
+        image = io.BytesIO()
+        CHART_RENDERERS[question](table, image, dpi, **params)
+        return image.getvalue(), 'image/png'
+
+    def _insights(self, data):
+        _, text = _quietly(generate_business_insights, df=data['insights_frame'])
+        return text.encode(), 'text/plain; charset=utf-8'
+
+    async def respond(self, path, params):
+        """(body, content type, cache status) for a GET request"""
+        builder, kwargs, cacheable = self._route(path, dict(params))
+        data = self.data
+        if not cacheable:
+            return builder(data, **kwargs) + ('bypass',)
+
+        key = (path, tuple(sorted(params.items())), data['version'])
+        if key in self._responses:
+            self._responses.move_to_end(key)
+            self.stats['hits'] += 1
+            return self._responses[key] + ('hit',)
+        if key in self._pending:
+            self.stats['hits'] += 1
+            return await asyncio.shield(self._pending[key]) + ('shared',)
+
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, lambda: builder(data, **kwargs))
+        self._pending[key] = future
+        try:
+            response = await future
+        finally:
+            del self._pending[key]
+        # A reload while building makes the response stale for the cache, though not for this request
+        if self.data['version'] == data['version']:
+            self._responses[key] = response
+            while len(self._responses) > self.max_cached:
+                self._responses.popitem(last=False)
+        return response + ('miss',)
+
+    async def handle(self, reader, writer):
+        """Answer one HTTP/1.1 request on a connection, then close it"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request_line) != 3:
+                return
+            method, target, _ = request_line
+            start = time.perf_counter()
+            try:
+                if method not in ('GET', 'HEAD'):
+                    raise RequestError(405, "Only GET is supported")
+                url = urlsplit(target)
+                body, content_type, cache_status = await self.respond(url.path, dict(parse_qsl(url.query)))
+                status = 200
+            except RequestError as exc:
+                status, cache_status = exc.status, 'bypass'
+                body, content_type = json.dumps({'error': str(exc)}).encode(), 'application/json'
+            except Exception as exc:
+                status, cache_status = 500, 'bypass'
+                body, content_type = json.dumps({'error': repr(exc)}).encode(), 'application/json'
+            headers = [
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {len(body)}",
+                f"X-Data-Version: {self.data['version']}",
+                f"X-Cache: {cache_status}",
+                f"Server-Timing: total;dur={(time.perf_counter() - start) * 1000:.1f}",
+                "Connection: close",
+            ]
+            writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, **options):
+    """Load the data and serve reports over TCP, or over a Unix socket when unix_path is given"""
+    service = ReportService(**options)
+    await service.start()
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle, path=unix_path)
+        print(f"Serving reports on unix:{unix_path}")
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+        print(f"Serving reports on http://{host}:{port}")
+    print("Endpoints: /q1 /q2 /q3 /q4 (?format=csv), /charts/q1..q4, /insights, /health")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the retail question reports from warm in-memory data")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--source', default=SOURCE_CSV)
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_SECONDS, help="seconds between source checks")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild the cleaned frame instead of mapping it")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, source=args.source, use_cache=not args.no_cache,
+                          poll_seconds=args.poll))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
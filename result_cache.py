@@ -0,0 +1,222 @@
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import pandas as pd
+
+from source_cache import CACHE_DIR
+
+# Stage results are cached under CACHE_DIR/results/<key>/, one directory per entry
+RESULT_CACHE_SUBDIR = 'results'
+
+# Bump when the entry layout changes so old entries stop matching
+RESULT_CACHE_VERSION = 1
+
+# Limits past which the least recently used entries are evicted
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DEFAULT_MAX_ENTRIES = 512
+
+ENTRY_NAME = 'entry.json'
+VALUE_NAME = 'value.pkl'
+LOG_NAME = 'log.txt'
+
+
+def code_version(*modules):
+    """
+    Hash of the source files of the given modules, so a cached result is
+    rebuilt when any code it depends on changes and kept when unrelated
+    modules do
+    """
+    digest = hashlib.sha256()
+    for name in sorted(modules):
+        with open(importlib.util.find_spec(name).origin, 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read())
+    return digest.hexdigest()[:16]
+
+
+def frame_fingerprint(df):
+    """Hash of a frame's columns, dtypes and values (row order included, index ignored)"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(col), str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+class _Tee(io.TextIOBase):
+    """Text stream writing to the console and to a capture buffer"""
+
+    def __init__(self, *streams):
+        self.streams = streams
+
+    def write(self, text):
+        for stream in self.streams:
+            stream.write(text)
+        return len(text)
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of pipeline stage results.
+
+    An entry is keyed on the hash of its stage name and key parts: the
+    input data fingerprint, the stage parameters and the code version of
+    the modules it runs. It holds the stage's return value, the console
+    output it printed (replayed on a hit, so a cached run logs what a fresh
+    one does) and copies of the files it wrote, which are restored in
+    place on a hit. Entries beyond max_bytes or max_entries are evicted
+    least recently used first; stats counts hits and misses per stage.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = os.path.join(cache_dir, RESULT_CACHE_SUBDIR)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.stats = {}
+        self.evictions = 0
+
+    @staticmethod
+    def key(stage, parts):
+        """Content address of a stage result"""
+        text = json.dumps({'stage': stage, 'parts': parts, 'version': RESULT_CACHE_VERSION},
+                          sort_keys=True, default=str)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def _count(self, stage, outcome):
+        self.stats.setdefault(stage, {'hits': 0, 'misses': 0})[outcome] += 1
+
+    def _read_entry(self, directory):
+        """Metadata of an entry, or None when missing or unreadable"""
+        try:
+            with open(os.path.join(directory, ENTRY_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _restore(self, directory, entry):
+        """Copy an entry's files back to their paths and return (value, log)"""
+        with open(os.path.join(directory, VALUE_NAME), 'rb') as f:
+            value = pickle.load(f)
+        with open(os.path.join(directory, LOG_NAME), encoding='utf-8') as f:
+            log = f.read()
+        for position, path in enumerate(entry['files']):
+            shutil.copyfile(os.path.join(directory, f"file.{position}"), path)
+        # The entry file's modification time marks its last use for eviction
+        os.utime(os.path.join(directory, ENTRY_NAME))
+        return value, log
+
+    def get(self, stage, parts):
+        """
+        Look a stage result up: on a hit its files are restored, its console
+        output is replayed and (True, value) is returned; otherwise (False, None)
+        """
+        directory = os.path.join(self.directory, self.key(stage, parts))
+        entry = self._read_entry(directory)
+        if entry is not None:
+            try:
+                value, log = self._restore(directory, entry)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                # A damaged entry is rebuilt like a missing one
+                shutil.rmtree(directory, ignore_errors=True)
+            else:
+                self._count(stage, 'hits')
+                print(log, end='')
+                return True, value
+        self._count(stage, 'misses')
+        return False, None
+
+    def put(self, stage, parts, value=None, files=(), log=''):
+        """Store a stage result with copies of the files it wrote, then evict down to the limits"""
+        self._store(os.path.join(self.directory, self.key(stage, parts)), stage, parts, value, log, files)
+        self._evict()
+
+    def run(self, stage, parts, compute, files=()):
+        """
+        Result of compute() for a stage and its key parts: restored from the
+        cache when an entry exists, otherwise computed (its console output
+        captured as it prints) and stored with the files it wrote. Returns
+        (value, hit).
+        """
+        hit, value = self.get(stage, parts)
+        if hit:
+            return value, True
+        log = io.StringIO()
+        with contextlib.redirect_stdout(_Tee(sys.stdout, log)):
+            value = compute()
+        self.put(stage, parts, value, files, log.getvalue())
+        return value, False
+
+    def _store(self, directory, stage, parts, value, log, files):
+        """Write an entry aside and swap it in whole"""
+        building = f"{directory}.tmp-{os.getpid()}"
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        with open(os.path.join(building, VALUE_NAME), 'wb') as f:
+            pickle.dump(value, f, protocol=5)
+        with open(os.path.join(building, LOG_NAME), 'w', encoding='utf-8') as f:
+            f.write(log)
+        for position, path in enumerate(files):
+            shutil.copyfile(path, os.path.join(building, f"file.{position}"))
+        size = sum(entry.stat().st_size for entry in os.scandir(building))
+        if size > self.max_bytes:
+            shutil.rmtree(building, ignore_errors=True)
+            return
+        with open(os.path.join(building, ENTRY_NAME), 'w') as f:
+            json.dump({'stage': stage, 'parts': parts, 'files': list(files), 'bytes': size,
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S')}, f, indent=2, default=str)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(building, directory)
+
+    def entries(self):
+        """(last used, bytes, directory) of every complete entry, least recently used first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for item in os.scandir(self.directory):
+            entry = self._read_entry(item.path) if item.is_dir() else None
+            if entry is not None:
+                found.append((os.stat(os.path.join(item.path, ENTRY_NAME)).st_mtime, entry['bytes'], item.path))
+        return sorted(found)
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is within its limits"""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            _, size, directory = entries.pop(0)
+            shutil.rmtree(directory, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Remove every entry"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def report(self):
+        """Hits and misses per stage this run, plus the cache's current size"""
+        entries = self.entries()
+        return {
+            'stages': self.stats,
+            'hits': sum(counts['hits'] for counts in self.stats.values()),
+            'misses': sum(counts['misses'] for counts in self.stats.values()),
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'mb': sum(size for _, size, _ in entries) / 1024 ** 2,
+        }
+
+    def print_summary(self):
+        report = self.report()
+        stages = ', '.join(f"{stage} {counts['hits']}/{counts['hits'] + counts['misses']}"
+                           for stage, counts in report['stages'].items())
+        print(f"\nResult cache: {report['hits']} hits, {report['misses']} misses ({stages} hit); "
+              f"{report['entries']} entries, {report['mb']:,.1f} MB, {report['evictions']} evicted")
@@ -1,247 +1,240 @@
+import os
+import io
+import contextlib
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
-# Set matplotlib backend for headless environments
-import matplotlib
-matplotlib.use('Agg')
+from date_parsing import parse_datetimes
+from aggregation_engine import compute_aggregates, exclude_country, DEFAULT_METRICS
+from distinct_sketch import approximate_metrics
+from columnar_storage import write_columnar
+from streaming_ingest import stream_aggregates, csv_chunk_writer, DEFAULT_CHUNK_ROWS
+from source_cache import load_source, source_fingerprint
+from column_cache import open_column_cache, write_column_cache
+from incremental_refresh import refresh_from_source, STATE_DIR
+from memory_schema import to_compact_schema
+from derived_columns import add_date_dimensions, DATE_DIMENSIONS
+from parallel_execution import run_partitioned
+from query_plan import scan, collect_all
+from row_subsets import take_rows
+from top_k import top_k
+from csv_export import export_csv, format_export_stats, compressed_path
+from pipeline_profiler import PipelineProfiler, DEFAULT_PROFILE_PATH
+from result_cache import ResultCache, code_version
+from chart_rendering import (
+    render_charts, chart_path, render_monthly_revenue_trend, render_top_countries,
+    render_top_customers, render_country_demand, DEFAULT_DPI, DEFAULT_FORMAT
+)
 
-# Set style for better visualizations
-try:
-    plt.style.use('seaborn-v0_8')
-except:
-    try:
-        plt.style.use('seaborn')
-    except:
-        plt.style.use('default')
+SOURCE_CSV = 'online_retail_data.csv'
 
-sns.set_palette("husl")
+# Entry of the shared column cache holding the cleaned frame
+COLUMN_CACHE_NAME = 'retail_analysis'
 
-def load_and_clean_data():
-    """Load and clean the retail data according to specifications"""
+# Modules whose code the cleaned frame and its aggregates depend on, for the column and result cache keys
+ANALYSIS_MODULES = [
+    'retail_analysis', 'aggregation_engine', 'date_parsing', 'derived_columns', 'distinct_sketch',
+    'memory_schema', 'row_subsets', 'source_cache', 'column_cache', 'top_k'
+]
+
+# The questions keep YearMonth as a Period so it can be turned back into a date
+QUESTION_DATE_DIMENSIONS = {
+    'Year': DATE_DIMENSIONS['Year'],
+    'Month': DATE_DIMENSIONS['Month'],
+    'YearMonth': lambda days: days.to_period('M'),
+}
+
+def load_and_clean_data(use_cache=True, compact_schema=False, profiler=None, source=SOURCE_CSV):
+    """
+    Load and clean the retail data according to specifications
+
+    With use_cache the cleaned frame is stored in the shared column cache,
+    and later runs memory-map it while the source file and the cleaning code
+    are unchanged.
+    compact_schema=True converts the result to the memory-optimised schema.
+    profiler (a PipelineProfiler) records the load/parse/clean/derive stages.
+    source is the raw CSV to read.
+    """
+    profiler = profiler or PipelineProfiler(enabled=False)
+    
     print("Loading data...")
-    df = pd.read_csv('online_retail_data.csv')
+    if use_cache:
+        # The cleaned columns of an unchanged source are memory-mapped instead of rebuilt
+        with profiler.stage('load:column_cache') as stage:
+            code = code_version(*ANALYSIS_MODULES)
+            fingerprint = source_fingerprint(source)
+            df_clean = open_column_cache(COLUMN_CACHE_NAME, fingerprint, categorical=compact_schema, code=code)
+            stage['rows_out'] = 0 if df_clean is None else len(df_clean)
+        if df_clean is not None:
+            print(f"Using cached columns of {source}")
+            stats = df_clean.attrs['cleaning_stats']
+            print(f"Original data shape: {tuple(stats['raw_shape'])}")
+            print("Cleaning data...")
+            print(f"Removed {stats['removed_quantity']} records with quantity < 1")
+            print(f"Final cleaned data shape: {tuple(stats['clean_shape'])}")
+            return to_compact_schema(df_clean) if compact_schema else df_clean
+    
+    with profiler.stage('load') as stage:
+        df, _ = load_source(source, use_cache=use_cache, parse_dates=['InvoiceDate'])
+        stage['rows_out'] = len(df)
     
     print(f"Original data shape: {df.shape}")
     
     # Convert InvoiceDate to datetime
-    df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    with profiler.stage('parse_dates', rows_in=len(df)) as stage:
+        df['InvoiceDate'] = parse_datetimes(df['InvoiceDate'])
+        stage['rows_out'] = len(df)
     
     # Data cleaning as per requirements
     print("Cleaning data...")
     
-    # Remove records with quantity less than 1
-    df_clean = df[df['Quantity'] >= 1].copy()
-    print(f"Removed {len(df) - len(df_clean)} records with quantity < 1")
-    
-    # Remove records with unit price less than or equal to 0
-    df_clean = df_clean[df_clean['UnitPrice'] > 0].copy()
-    print(f"Final cleaned data shape: {df_clean.shape}")
-    
-    # Calculate revenue
-    df_clean['Revenue'] = df_clean['Quantity'] * df_clean['UnitPrice']
-    
-    # Extract date components
-    df_clean['Year'] = df_clean['InvoiceDate'].dt.year
-    df_clean['Month'] = df_clean['InvoiceDate'].dt.month
-    df_clean['YearMonth'] = df_clean['InvoiceDate'].dt.to_period('M')
+    with profiler.stage('clean', rows_in=len(df)) as stage:
+        # Remove records with quantity less than 1
+        valid_quantity = (df['Quantity'] >= 1).to_numpy()
+        removed_quantity = len(df) - valid_quantity.sum()
+        print(f"Removed {removed_quantity} records with quantity < 1")
+        
+        # Remove records with unit price less than or equal to 0 (one mask, one copy of the kept rows)
+        df_clean = take_rows(df, valid_quantity & (df['UnitPrice'] > 0).to_numpy())
+        print(f"Final cleaned data shape: {df_clean.shape}")
+        clean_shape = df_clean.shape
+        stage['rows_out'] = len(df_clean)
+    
+    with profiler.stage('derive_columns', rows_in=len(df_clean)) as stage:
+        # Calculate revenue
+        df_clean['Revenue'] = df_clean['Quantity'] * df_clean['UnitPrice']
+        
+        df_clean = add_date_components(df_clean)
+        df_clean.attrs['cleaning_stats'] = {'raw_shape': df.shape, 'removed_quantity': int(removed_quantity),
+                                            'clean_shape': clean_shape}
+        if use_cache:
+            write_column_cache(df_clean, COLUMN_CACHE_NAME, fingerprint, code)
+        if compact_schema:
+            df_clean = to_compact_schema(df_clean)
+        stage['rows_out'] = len(df_clean)
     
     return df_clean
 
-def question_1_time_series_2011(df):
-    """Q1: Time series of revenue data for 2011 by month"""
-    print("\n=== Question 1: 2011 Monthly Revenue Time Series ===")
-    
-    # Filter for 2011 data only
-    df_2011 = df[df['Year'] == 2011].copy()
+def add_date_components(df_clean):
+    """Extract the date components used by the questions, once per distinct invoice day"""
+    return add_date_dimensions(df_clean, QUESTION_DATE_DIMENSIONS)
+
+def analysis_plans(source='online_retail_data.csv', metrics=None, use_cache=True):
+    """
+    Lazy plans for the cleaned frame, its summary aggregates and the
+    aggregates behind each question. Collected together they share one load,
+    clean and derive pass; collected alone each reads only its own columns
+    and, for the Year/Country filters, only its own rows.
+    """
+    cleaned = scan(source, use_cache).clean().derive(add_date_components, produces=QUESTION_DATE_DIMENSIONS)
+    outside_uk = cleaned.filter('Country', '!=', 'United Kingdom')
+    return {
+        'cleaned': cleaned,
+        'summary': cleaned.aggregate(['Country'], metrics),
+        'q1': cleaned.filter('Year', '==', 2011).aggregate(['YearMonth'], metrics),
+        'q2': outside_uk.aggregate(['Country'], metrics),
+        'q3': cleaned.aggregate(['CustomerID'], metrics),
+        'q4': outside_uk.aggregate(['Country'], metrics),
+    }
+
+def stream_and_export_data(chunk_rows=DEFAULT_CHUNK_ROWS, memory_limit_mb=None, metrics=None):
+    """Streaming variant of load_and_clean_data + export: cleans and exports chunk by chunk"""
+    print("Streaming data in chunks...")
+    print("\n=== Exporting Cleaned Data ===")
+    writers = [
+        csv_chunk_writer('cleaned_retail_data.csv'),
+        csv_chunk_writer('cleaned_retail_data_2011.csv', lambda chunk: chunk['Year'] == 2011)
+    ]
+    aggregates, stats = stream_aggregates('online_retail_data.csv', derive=add_date_components,
+                                          chunk_rows=chunk_rows, memory_limit_mb=memory_limit_mb,
+                                          on_chunk=writers, metrics=metrics)
+    print(f"Removed {stats['removed_records']} records with quantity < 1 or unit price <= 0")
+    print("Exported: cleaned_retail_data.csv")
+    print("Exported: cleaned_retail_data_2011.csv")
     
-    # Group by month and calculate total revenue
-    monthly_revenue = df_2011.groupby('YearMonth')['Revenue'].sum().reset_index()
+    print_data_summary(stats['clean_records'], stats['first_invoice'], stats['last_invoice'], aggregates)
+    return aggregates
+
+def _country_label(country):
+    """Short name of an excluded country for the report headings"""
+    return 'UK' if country == 'United Kingdom' else country
+
+def question_1_time_series_2011(df, aggregates=None, render=True, year=2011):
+    """Q1: Time series of revenue data for 2011 (or another year) by month"""
+    print(f"\n=== Question 1: {year} Monthly Revenue Time Series ===")
+    
+    if aggregates is None:
+        aggregates = compute_aggregates(df, group_keys=['YearMonth'])
+    
+    # Monthly revenue for the one year, read from the shared aggregates
+    monthly = aggregates['YearMonth']
+    monthly = monthly[monthly['Year'] == year]
+    monthly_revenue = monthly[['YearMonth', 'Total_Revenue']].reset_index(drop=True)
+    monthly_revenue.columns = ['YearMonth', 'Revenue']
     monthly_revenue['Month_Date'] = monthly_revenue['YearMonth'].dt.to_timestamp()
     
-    # Create the visualization
-    plt.figure(figsize=(14, 8))
-    plt.plot(monthly_revenue['Month_Date'], monthly_revenue['Revenue'], 
-             marker='o', linewidth=3, markersize=8, color='#2E86AB')
-    
-    plt.title('Monthly Revenue Trend for 2011\nSeasonal Analysis for CEO Forecasting', 
-              fontsize=16, fontweight='bold', pad=20)
-    plt.xlabel('Month', fontsize=12, fontweight='bold')
-    plt.ylabel('Revenue (£)', fontsize=12, fontweight='bold')
-    
-    # Format y-axis to show values in millions
-    plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
-    
-    # Rotate x-axis labels for better readability
-    plt.xticks(rotation=45)
-    
-    # Add grid for better readability
-    plt.grid(True, alpha=0.3)
-    
-    # Highlight seasonal trends with annotations
-    max_month = monthly_revenue.loc[monthly_revenue['Revenue'].idxmax()]
-    min_month = monthly_revenue.loc[monthly_revenue['Revenue'].idxmin()]
-    
-    plt.annotate(f'Peak: {max_month["YearMonth"]}\n£{max_month["Revenue"]/1e6:.1f}M', 
-                xy=(max_month['Month_Date'], max_month['Revenue']),
-                xytext=(10, 10), textcoords='offset points',
-                bbox=dict(boxstyle='round,pad=0.5', fc='yellow', alpha=0.7),
-                arrowprops=dict(arrowstyle='->', connectionstyle='arc3,rad=0'))
-    
-    plt.tight_layout()
-    plt.savefig('Q1_2011_Monthly_Revenue_Trend.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    if render:
+        render_monthly_revenue_trend(monthly_revenue, chart_path('q1'), year=year)
     
     return monthly_revenue
 
-def question_2_top_countries(df):
-    """Q2: Top 10 countries by revenue (excluding UK) with quantity"""
-    print("\n=== Question 2: Top 10 Countries by Revenue (Excluding UK) ===")
+def question_2_top_countries(df, aggregates=None, render=True, top=10, exclude='United Kingdom'):
+    """Q2: Top 10 (or top) countries by revenue (excluding UK, or exclude) with quantity"""
+    print(f"\n=== Question 2: Top {top} Countries by Revenue (Excluding {_country_label(exclude)}) ===")
     
-    # Exclude United Kingdom
-    df_no_uk = df[df['Country'] != 'United Kingdom'].copy()
+    if aggregates is None:
+        aggregates = compute_aggregates(df, group_keys=['Country'])
     
-    # Group by country and calculate metrics
-    country_metrics = df_no_uk.groupby('Country').agg({
-        'Revenue': 'sum',
-        'Quantity': 'sum'
-    }).reset_index()
+    # Country metrics excluding United Kingdom
+    country_metrics = exclude_country(aggregates['Country'], exclude)
+    country_metrics = country_metrics[['Country', 'Total_Revenue', 'Total_Quantity']]
+    country_metrics.columns = ['Country', 'Revenue', 'Quantity']
     
     # Get top 10 countries by revenue
-    top_10_countries = country_metrics.nlargest(10, 'Revenue')
-    
-    # Create dual-axis visualization
-    fig, ax1 = plt.subplots(figsize=(14, 8))
-    
-    # Revenue bars
-    bars = ax1.bar(range(len(top_10_countries)), top_10_countries['Revenue'], 
-                   color='#A23B72', alpha=0.7, label='Revenue')
-    ax1.set_xlabel('Country', fontsize=12, fontweight='bold')
-    ax1.set_ylabel('Revenue (£)', fontsize=12, fontweight='bold', color='#A23B72')
-    ax1.tick_params(axis='y', labelcolor='#A23B72')
-    ax1.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
-    
-    # Quantity line on secondary axis
-    ax2 = ax1.twinx()
-    line = ax2.plot(range(len(top_10_countries)), top_10_countries['Quantity'], 
-                    color='#F18F01', marker='o', linewidth=3, markersize=8, label='Quantity')
-    ax2.set_ylabel('Quantity Sold', fontsize=12, fontweight='bold', color='#F18F01')
-    ax2.tick_params(axis='y', labelcolor='#F18F01')
-    
-    # Set x-axis labels
-    ax1.set_xticks(range(len(top_10_countries)))
-    ax1.set_xticklabels(top_10_countries['Country'], rotation=45, ha='right')
-    
-    plt.title('Top 10 Countries by Revenue and Quantity Sold\n(Excluding United Kingdom)', 
-              fontsize=16, fontweight='bold', pad=20)
-    
-    # Add legends
-    ax1.legend(loc='upper left')
-    ax2.legend(loc='upper right')
-    
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('Q2_Top_10_Countries_Revenue_Quantity.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    top_10_countries = top_k(country_metrics, top, 'Revenue')
+    
+    if render:
+        render_top_countries(top_10_countries, chart_path('q2'), top=top, exclude=exclude)
     
     return top_10_countries
 
-def question_3_top_customers(df):
-    """Q3: Top 10 customers by revenue"""
-    print("\n=== Question 3: Top 10 Customers by Revenue ===")
+def question_3_top_customers(df, aggregates=None, render=True, top=10):
+    """Q3: Top 10 (or top) customers by revenue"""
+    print(f"\n=== Question 3: Top {top} Customers by Revenue ===")
     
-    # Remove rows with missing CustomerID
-    df_customers = df[df['CustomerID'].notna()].copy()
+    if aggregates is None:
+        aggregates = compute_aggregates(df, group_keys=['CustomerID'])
     
-    # Group by customer and calculate total revenue
-    customer_revenue = df_customers.groupby('CustomerID')['Revenue'].sum().reset_index()
+    # Customer revenue (rows with missing CustomerID are not grouped)
+    customer_revenue = aggregates['CustomerID'][['CustomerID', 'Total_Revenue']]
+    customer_revenue.columns = ['CustomerID', 'Revenue']
     
     # Get top 10 customers
-    top_10_customers = customer_revenue.nlargest(10, 'Revenue')
+    top_10_customers = top_k(customer_revenue, top, 'Revenue')
     top_10_customers['CustomerID'] = top_10_customers['CustomerID'].astype(int)
     top_10_customers = top_10_customers.sort_values('Revenue', ascending=True)  # For horizontal bar chart
     
-    # Create horizontal bar chart
-    plt.figure(figsize=(12, 8))
-    bars = plt.barh(range(len(top_10_customers)), top_10_customers['Revenue'], 
-                    color=sns.color_palette("viridis", len(top_10_customers)))
+    if render:
+        render_top_customers(top_10_customers, chart_path('q3'), top=top)
     
-    # Customize the chart
-    plt.xlabel('Revenue (£)', fontsize=12, fontweight='bold')
-    plt.ylabel('Customer ID', fontsize=12, fontweight='bold')
-    plt.title('Top 10 Revenue Generating Customers\n(Highest to Lowest Revenue)', 
-              fontsize=16, fontweight='bold', pad=20)
-    
-    # Set y-axis labels
-    plt.yticks(range(len(top_10_customers)), 
-               [f'Customer {int(cid)}' for cid in top_10_customers['CustomerID']])
-    
-    # Format x-axis
-    plt.gca().xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'£{x/1e3:.0f}K'))
+    return top_10_customers
+
+def question_4_demand_by_country(df, aggregates=None, render=True, exclude='United Kingdom'):
+    """Q4: Demand analysis by country (excluding UK, or exclude)"""
+    print(f"\n=== Question 4: Product Demand by Country (Excluding {_country_label(exclude)}) ===")
     
-    # Add value labels on bars
-    for i, (idx, row) in enumerate(top_10_customers.iterrows()):
-        plt.text(row['Revenue'] + 1000, i, f'£{row["Revenue"]/1e3:.0f}K', 
-                va='center', fontweight='bold')
+    if aggregates is None:
+        aggregates = compute_aggregates(df, group_keys=['Country'])
     
-    plt.grid(True, alpha=0.3, axis='x')
-    plt.tight_layout()
-    plt.savefig('Q3_Top_10_Customers_Revenue.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    # Demand metrics by country excluding United Kingdom
+    country_demand = exclude_country(aggregates['Country'], exclude)
+    country_demand = country_demand[['Country', 'Total_Quantity', 'Total_Revenue', 'Unique_Orders']]
     
-    return top_10_customers
-
-def question_4_demand_by_country(df):
-    """Q4: Demand analysis by country (excluding UK)"""
-    print("\n=== Question 4: Product Demand by Country (Excluding UK) ===")
-    
-    # Exclude United Kingdom
-    df_no_uk = df[df['Country'] != 'United Kingdom'].copy()
-    
-    # Calculate demand metrics by country
-    country_demand = df_no_uk.groupby('Country').agg({
-        'Quantity': 'sum',
-        'Revenue': 'sum',
-        'InvoiceNo': 'nunique'  # Number of unique orders
-    }).reset_index()
-    
-    country_demand.columns = ['Country', 'Total_Quantity', 'Total_Revenue', 'Unique_Orders']
-    
-    # Create a comprehensive bubble chart
-    plt.figure(figsize=(16, 10))
-    
-    # Use quantity for y-axis, revenue for x-axis, and orders for bubble size
-    scatter = plt.scatter(country_demand['Total_Revenue'], 
-                         country_demand['Total_Quantity'],
-                         s=country_demand['Unique_Orders']/10,  # Scale bubble size
-                         alpha=0.7,
-                         c=range(len(country_demand)),
-                         cmap='tab20')
-    
-    # Add country labels
-    for i, row in country_demand.iterrows():
-        plt.annotate(row['Country'], 
-                    (row['Total_Revenue'], row['Total_Quantity']),
-                    xytext=(5, 5), textcoords='offset points',
-                    fontsize=9, fontweight='bold')
-    
-    plt.xlabel('Total Revenue (£)', fontsize=12, fontweight='bold')
-    plt.ylabel('Total Quantity Demanded', fontsize=12, fontweight='bold')
-    plt.title('Product Demand Analysis by Country\n(Bubble size represents number of unique orders)\nExcluding United Kingdom', 
-              fontsize=16, fontweight='bold', pad=20)
-    
-    # Format axes
-    plt.gca().xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'£{x/1e6:.1f}M'))
-    plt.gca().yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x/1e3:.0f}K'))
-    
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('Q4_Country_Demand_Analysis.png', dpi=300, bbox_inches='tight')
-    plt.close()
+    if render:
+        render_country_demand(country_demand, chart_path('q4'), exclude=exclude)
     
     # Also create a summary table
     country_demand_sorted = country_demand.sort_values('Total_Quantity', ascending=False)
@@ -251,62 +244,234 @@ def question_4_demand_by_country(df):
     
     return country_demand_sorted
 
-def export_cleaned_data(df):
-    """Export cleaned data for Tableau/Power BI"""
+def export_cleaned_data(df, aggregates=None, storage_format='csv', profiler=None, compression=None):
+    """
+    Export cleaned data for Tableau/Power BI
+
+    The full and 2011 CSV files are written in one encoding pass;
+    compression ('gzip' or 'zstd') adds .gz/.zst to their names.
+    """
     print("\n=== Exporting Cleaned Data ===")
-    
-    # Export full cleaned dataset
-    df.to_csv('cleaned_retail_data.csv', index=False)
-    print("Exported: cleaned_retail_data.csv")
-    
-    # Export 2011 data specifically for Question 1
-    df_2011 = df[df['Year'] == 2011]
-    df_2011.to_csv('cleaned_retail_data_2011.csv', index=False)
-    print("Exported: cleaned_retail_data_2011.csv")
+    profiler = profiler or PipelineProfiler(enabled=False)
+    
+    if storage_format == 'parquet':
+        # One typed columnar file; the 2011 subset is read back with a Year filter
+        with profiler.stage('export:cleaned_retail_data.parquet', rows_in=len(df)) as stage:
+            write_columnar(df, 'cleaned_retail_data.parquet')
+            stage['rows_out'] = len(df)
+        print("Exported: cleaned_retail_data.parquet (filter Year == 2011 for Question 1)")
+    else:
+        # Export full cleaned dataset and the 2011 data for Question 1 in one pass
+        targets = {
+            compressed_path('cleaned_retail_data.csv', compression): None,
+            compressed_path('cleaned_retail_data_2011.csv', compression): (df['Year'] == 2011).to_numpy(),
+        }
+        with profiler.stage('export:csv', rows_in=len(df)) as stage:
+            stats = export_csv(df, targets, compression=compression)
+            stage['rows_out'] = sum(file_stats['rows'] for file_stats in stats.values())
+        for path, file_stats in stats.items():
+            print(f"Exported: {format_export_stats(path, file_stats)}")
+    
+    if aggregates is None:
+        aggregates = compute_aggregates(df, group_keys=['Country'])
+    
+    print_data_summary(len(df), df['InvoiceDate'].min(), df['InvoiceDate'].max(), aggregates)
+
+def cleaned_export_paths(storage_format='csv', compression=None):
+    """Files export_cleaned_data writes"""
+    if storage_format == 'parquet':
+        return ['cleaned_retail_data.parquet']
+    return [compressed_path('cleaned_retail_data.csv', compression),
+            compressed_path('cleaned_retail_data_2011.csv', compression)]
+
+def print_data_summary(n_records, first_invoice, last_invoice, aggregates):
+    """Print summary statistics of the cleaned data"""
+    totals = aggregates['totals']
     
     # Create summary statistics
     summary_stats = {
-        'Total Records': len(df),
-        'Date Range': f"{df['InvoiceDate'].min()} to {df['InvoiceDate'].max()}",
-        'Total Revenue': df['Revenue'].sum(),
-        'Unique Countries': df['Country'].nunique(),
-        'Unique Customers': df['CustomerID'].nunique(),
-        'Unique Products': df['StockCode'].nunique()
+        'Total Records': n_records,
+        'Date Range': f"{first_invoice} to {last_invoice}",
+        'Total Revenue': totals['Total_Revenue'],
+        'Unique Countries': len(aggregates['Country']),
+        'Unique Customers': totals['Unique_Customers'],
+        'Unique Products': totals['Unique_Products']
     }
     
     print("\nData Summary:")
     for key, value in summary_stats.items():
         print(f"{key}: {value}")
 
-def main():
-    """Main execution function"""
+def main(storage_format='csv', streaming=False, chunk_rows=DEFAULT_CHUNK_ROWS, memory_limit_mb=None,
+         incremental=False, delta_path=None, compact_schema=False,
+         chart_workers=None, chart_dpi=DEFAULT_DPI, chart_format=DEFAULT_FORMAT,
+         profile=False, profile_path=DEFAULT_PROFILE_PATH, distinct_error=None,
+         parallel_workers=None, partition_by='month', lazy=False, csv_compression=None,
+         result_cache=True):
+    """
+    Main execution function
+
+    streaming=True reads the source in chunks under an optional memory
+    ceiling instead of loading the whole file; it exports CSV only.
+    incremental=True folds only invoice rows not folded before (or the rows in
+    delta_path) into persisted aggregates and rewrites the question outputs;
+    the full cleaned-data export is skipped in that mode. compact_schema=True
+    keeps the cleaned frame in the categorical/downcast schema. Charts are
+    rendered in parallel from the question tables with chart_workers
+    processes (1 renders in-process) at chart_dpi in chart_format.
+    profile=True records per-stage timing and memory, prints a summary table
+    and writes the JSON report to profile_path. distinct_error (e.g. 0.01)
+    switches the unique order/customer/product counts to mergeable
+    HyperLogLog estimates with that relative standard error; exact counts
+    are the default. parallel_workers cleans and aggregates the full load on
+    that many processes, partitioned by partition_by ('month' or 'invoice');
+    the results are identical to the single-process run. lazy=True builds
+    the load/clean/question steps as query plans (see analysis_plans) and
+    runs them together, filtering before aggregating each question.
+    csv_compression ('gzip' or 'zstd') compresses the cleaned CSV exports.
+    result_cache=True (full load only) keeps the aggregates, exports and
+    charts in a result cache keyed on the source's content, the options
+    and the code version: stages whose inputs are unchanged are restored
+    instead of run, and the frame is not even loaded when nothing needs it.
+    """
     print("=== RETAIL DATA ANALYSIS ===")
     print("Creating visualizations for CEO and CMO questions")
     print("=" * 50)
     
-    # Load and clean data
-    df_clean = load_and_clean_data()
-    
-    # Generate all visualizations
-    q1_results = question_1_time_series_2011(df_clean)
-    q2_results = question_2_top_countries(df_clean)
-    q3_results = question_3_top_customers(df_clean)
-    q4_results = question_4_demand_by_country(df_clean)
-    
-    # Export cleaned data
-    export_cleaned_data(df_clean)
+    if streaming and incremental:
+        raise ValueError("Choose either streaming or incremental mode")
+    if csv_compression is not None and (streaming or incremental or storage_format != 'csv'):
+        raise ValueError("CSV compression applies to the full-load CSV export")
+    if parallel_workers is not None and (streaming or incremental):
+        raise ValueError("Parallel mode applies to the full load only")
+    if lazy and (streaming or incremental or parallel_workers is not None):
+        raise ValueError("Lazy mode applies to the single-process full load only")
+    
+    profiler = PipelineProfiler(enabled=profile)
+    metrics = None if distinct_error is None else approximate_metrics(DEFAULT_METRICS, distinct_error)
+    full_load = not (incremental or streaming or lazy or parallel_workers is not None)
+    cache = ResultCache() if result_cache and full_load else None
+    
+    if incremental:
+        df_clean = None
+        with profiler.stage('incremental_refresh'):
+            aggregates, summary = refresh_from_source('online_retail_data.csv', derive=add_date_components,
+                                                      state_dir=os.path.join(STATE_DIR, 'retail_analysis'),
+                                                      delta_path=delta_path, metrics=metrics)
+        print_data_summary(summary['clean_records'], summary['first_invoice'], summary['last_invoice'], aggregates)
+    elif streaming:
+        if storage_format != 'csv':
+            raise ValueError("Streaming mode exports CSV only")
+        df_clean = None
+        with profiler.stage('streaming_ingest_and_export'):
+            aggregates = stream_and_export_data(chunk_rows, memory_limit_mb, metrics)
+    elif parallel_workers is not None:
+        print("Loading data...")
+        with profiler.stage('load') as stage:
+            df, _ = load_source('online_retail_data.csv', parse_dates=['InvoiceDate'])
+            stage['rows_out'] = len(df)
+        print(f"Original data shape: {df.shape}")
+        
+        print(f"Cleaning and aggregating on {parallel_workers} workers...")
+        with profiler.stage('partitioned_clean_and_aggregate', rows_in=len(df)) as stage:
+            df_clean, aggregates, stats = run_partitioned(df, add_date_components, partition_by,
+                                                           parallel_workers, metrics=metrics)
+            if compact_schema:
+                df_clean = to_compact_schema(df_clean)
+            stage['rows_out'] = len(df_clean)
+        print(f"Removed {stats['removed_records']} records with quantity < 1 or unit price <= 0 "
+              f"({stats['partitions']} partitions)")
+        print(f"Final cleaned data shape: {df_clean.shape}")
+    elif lazy:
+        print("Running query plans...")
+        results = collect_all(analysis_plans(metrics=metrics), profiler=profiler)
+        df_clean = results['cleaned']
+        if compact_schema:
+            df_clean = to_compact_schema(df_clean)
+        aggregates = results['summary']
+        question_aggregates = {name: results[name] for name in ['q1', 'q2', 'q3', 'q4']}
+        print(f"Final cleaned data shape: {df_clean.shape}")
+    elif cache is not None:
+        # Clean and aggregate only when the source, the options or the code changed
+        analysis_key = {'source': source_fingerprint(SOURCE_CSV)['sha256'], 'code': code_version(*ANALYSIS_MODULES),
+                        'compact_schema': compact_schema, 'distinct_error': distinct_error}
+        loaded = {}
+        
+        def clean_and_aggregate():
+            loaded['df'] = load_and_clean_data(compact_schema=compact_schema, profiler=profiler)
+            with profiler.stage('aggregate', rows_in=len(loaded['df'])):
+                return compute_aggregates(loaded['df'], metrics=metrics)
+        
+        aggregates, _ = cache.run('aggregate', analysis_key, clean_and_aggregate)
+        df_clean = loaded.get('df')
+    else:
+        # Load and clean data
+        df_clean = load_and_clean_data(compact_schema=compact_schema, profiler=profiler)
+        
+        # Aggregate every metric the questions need in one pass
+        with profiler.stage('aggregate', rows_in=len(df_clean)):
+            aggregates = compute_aggregates(df_clean, metrics=metrics)
+    
+    # Lazy mode aggregated each question on its own filtered rows; the other modes share one set
+    if not lazy:
+        question_aggregates = dict.fromkeys(['q1', 'q2', 'q3', 'q4'], aggregates)
+    
+    # Answer all questions, then render their charts in parallel
+    with profiler.stage('q1_time_series_2011') as stage:
+        q1_results = question_1_time_series_2011(df_clean, question_aggregates['q1'], render=False)
+        stage['rows_out'] = len(q1_results)
+    with profiler.stage('q2_top_countries') as stage:
+        q2_results = question_2_top_countries(df_clean, question_aggregates['q2'], render=False)
+        stage['rows_out'] = len(q2_results)
+    with profiler.stage('q3_top_customers') as stage:
+        q3_results = question_3_top_customers(df_clean, question_aggregates['q3'], render=False)
+        stage['rows_out'] = len(q3_results)
+    with profiler.stage('q4_demand_by_country') as stage:
+        q4_results = question_4_demand_by_country(df_clean, question_aggregates['q4'], render=False)
+        stage['rows_out'] = len(q4_results)
+    
+    print("\n=== Rendering Charts ===")
+    with profiler.stage('render_charts'):
+        chart_files = render_charts({'q1': q1_results, 'q2': q2_results, 'q3': q3_results, 'q4': q4_results},
+                                    workers=chart_workers, dpi=chart_dpi, fmt=chart_format, cache=cache)
+    
+    # Export cleaned data (streaming mode already exported it chunk by chunk)
+    if cache is not None:
+        def export():
+            # The frame is loaded here only when the aggregates came from the cache; its log was replayed then
+            df = df_clean
+            if df is None:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    df = load_and_clean_data(compact_schema=compact_schema, profiler=profiler)
+            export_cleaned_data(df, aggregates, storage_format, profiler=profiler, compression=csv_compression)
+        
+        export_key = dict(analysis_key, code=code_version(*ANALYSIS_MODULES, 'csv_export', 'columnar_storage'),
+                          storage_format=storage_format, compression=csv_compression)
+        cache.run('export', export_key, export, files=cleaned_export_paths(storage_format, csv_compression))
+    elif df_clean is not None:
+        export_cleaned_data(df_clean, aggregates, storage_format, profiler=profiler, compression=csv_compression)
     
     print("\n" + "=" * 50)
     print("ANALYSIS COMPLETE!")
     print("Generated visualizations:")
-    print("- Q1_2011_Monthly_Revenue_Trend.png")
-    print("- Q2_Top_10_Countries_Revenue_Quantity.png")
-    print("- Q3_Top_10_Customers_Revenue.png")
-    print("- Q4_Country_Demand_Analysis.png")
+    for path in chart_files:
+        print(f"- {os.path.basename(path)}")
     print("\nCleaned data files:")
-    print("- cleaned_retail_data.csv")
-    print("- cleaned_retail_data_2011.csv")
+    if incremental:
+        print("- (not re-exported in incremental mode)")
+    elif storage_format == 'parquet':
+        print("- cleaned_retail_data.parquet")
+    else:
+        print(f"- {compressed_path('cleaned_retail_data.csv', csv_compression)}")
+        print(f"- {compressed_path('cleaned_retail_data_2011.csv', csv_compression)}")
     print("\nThese files can be imported into Tableau or Power BI for further analysis.")
+    
+    if cache is not None:
+        cache.print_summary()
+    
+    if profile:
+        profiler.print_summary()
+        print(f"Profile report: {profiler.write_json(profile_path)}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
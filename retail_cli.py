@@ -0,0 +1,167 @@
+import argparse
+import os
+import time
+
+# Only the standard library is imported here: each subcommand imports what it
+# needs, so `--help` and non-chart jobs never pay for the plotting stack
+
+# Subcommands in pipeline order; several given together run in this order on one loaded frame
+COMMANDS = ['clean', 'aggregate', 'charts', 'insights', 'export']
+
+
+class Session:
+    """
+    State shared by the subcommands of one invocation. The cleaned frame,
+    its aggregates and the question tables are built on first use and
+    reused by every later subcommand, so `clean aggregate export` loads and
+    aggregates once.
+    """
+
+    def __init__(self, source=None, use_cache=True, compact_schema=False, profiler=None):
+        from pipeline_profiler import PipelineProfiler
+        from retail_analysis import SOURCE_CSV
+
+        self.source = source or SOURCE_CSV
+        self.use_cache = use_cache
+        self.compact_schema = compact_schema
+        self.profiler = profiler or PipelineProfiler(enabled=False)
+        self._frame = None
+        self._aggregates = None
+        self._tables = None
+
+    @property
+    def frame(self):
+        """Cleaned frame of the source, memory-mapped from the column cache when unchanged"""
+        if self._frame is None:
+            from retail_analysis import load_and_clean_data
+            self._frame = load_and_clean_data(use_cache=self.use_cache, compact_schema=self.compact_schema,
+                                              profiler=self.profiler, source=self.source)
+        return self._frame
+
+    @property
+    def aggregates(self):
+        """Every aggregate the questions and the summary need, from one pass over the frame"""
+        if self._aggregates is None:
+            from aggregation_engine import compute_aggregates
+            with self.profiler.stage('aggregate', rows_in=len(self.frame)):
+                self._aggregates = compute_aggregates(self.frame)
+        return self._aggregates
+
+    @property
+    def tables(self):
+        """Question tables ({'q1': df, ...}) read from the shared aggregates"""
+        if self._tables is None:
+            from retail_analysis import (
+                question_1_time_series_2011, question_2_top_countries,
+                question_3_top_customers, question_4_demand_by_country
+            )
+            questions = {
+                'q1': question_1_time_series_2011,
+                'q2': question_2_top_countries,
+                'q3': question_3_top_customers,
+                'q4': question_4_demand_by_country,
+            }
+            self._tables = {}
+            for name, question in questions.items():
+                with self.profiler.stage(name) as stage:
+                    self._tables[name] = question(self.frame, self.aggregates, render=False)
+                    stage['rows_out'] = len(self._tables[name])
+        return self._tables
+
+
+def run_clean(session, args):
+    """Load and clean the source (or map its cached columns)"""
+    session.frame
+
+
+def run_aggregate(session, args):
+    """Answer the four questions and print their tables and the data summary"""
+    from retail_analysis import print_data_summary
+
+    for name, table in session.tables.items():
+        print(f"\n{name.upper()}:")
+        print(table.to_string(index=False))
+    df = session.frame
+    print_data_summary(len(df), df['InvoiceDate'].min(), df['InvoiceDate'].max(), session.aggregates)
+
+
+def run_charts(session, args):
+    """Render the question charts; the only subcommand that loads matplotlib"""
+    from chart_rendering import render_charts
+
+    tables = session.tables
+    print("\n=== Rendering Charts ===")
+    with session.profiler.stage('render_charts'):
+        paths = render_charts(tables, workers=args.chart_workers, dpi=args.chart_dpi, fmt=args.chart_format)
+    for path in paths:
+        print(f"Rendered: {os.path.basename(path)}")
+
+
+def run_insights(session, args):
+    """Print the CEO/CMO insights report from the loaded frame"""
+    from business_insights import generate_business_insights, insights_frame
+
+    print()
+    with session.profiler.stage('insights', rows_in=len(session.frame)):
+        generate_business_insights(distinct_error=args.distinct_error, df=insights_frame(session.frame))
+
+
+def run_export(session, args):
+    """Export the cleaned data for Tableau/Power BI"""
+    from retail_analysis import export_cleaned_data
+
+    export_cleaned_data(session.frame, session.aggregates, args.format, profiler=session.profiler,
+                        compression=args.compression)
+
+
+RUNNERS = {
+    'clean': run_clean,
+    'aggregate': run_aggregate,
+    'charts': run_charts,
+    'insights': run_insights,
+    'export': run_export,
+}
+
+
+def main(argv=None):
+    started = time.perf_counter()
+    from chart_rendering import DEFAULT_DPI, DEFAULT_FORMAT
+
+    parser = argparse.ArgumentParser(
+        description="Run retail report jobs; several subcommands share one loaded frame",
+        epilog="e.g. `retail_cli.py clean export` or `retail_cli.py aggregate charts insights`")
+    parser.add_argument('commands', nargs='+', choices=COMMANDS, metavar='command',
+                        help=f"one or more of: {', '.join(COMMANDS)}")
+    parser.add_argument('--source', help="raw CSV to read (default: online_retail_data.csv)")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild the cleaned frame instead of mapping it")
+    parser.add_argument('--compact-schema', action='store_true',
+                        help="keep the cleaned frame in the categorical/downcast schema")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help="export storage format")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], help="compress the CSV exports")
+    parser.add_argument('--chart-workers', type=int, help="chart processes (1 renders in-process)")
+    parser.add_argument('--chart-dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--chart-format', default=DEFAULT_FORMAT)
+    parser.add_argument('--distinct-error', type=float, help="HyperLogLog error for the insights' unique counts")
+    parser.add_argument('--profile', action='store_true', help="print per-subcommand timing and memory")
+    args = parser.parse_args(argv)
+    if args.compression is not None and args.format != 'csv':
+        parser.error("--compression applies to the CSV export")
+
+    from pipeline_profiler import PipelineProfiler
+
+    profiler = PipelineProfiler(enabled=args.profile)
+    session = Session(args.source, use_cache=not args.no_cache, compact_schema=args.compact_schema,
+                      profiler=profiler)
+    startup = time.perf_counter() - started
+    # Each subcommand runs once, in pipeline order, whatever order they were given in
+    for command in [name for name in COMMANDS if name in args.commands]:
+        with profiler.stage(f"command:{command}"):
+            RUNNERS[command](session, args)
+
+    if args.profile:
+        print(f"\nStartup (imports and arguments): {startup:.2f} s")
+        profiler.print_summary()
+
+
+if __name__ == "__main__":
+    main()
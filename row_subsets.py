@@ -0,0 +1,56 @@
+import numpy as np
+
+from columnar_storage import filter_mask
+
+# Row subsets the reports aggregate over, as read_columnar-style filters
+QUESTION_SUBSETS = {
+    'year_2011': [('Year', '==', 2011)],
+    'outside_uk': [('Country', '!=', 'United Kingdom')],
+}
+
+
+class RowSubsets:
+    """
+    Boolean masks and row positions of named subsets of one frame, each
+    computed once and shared by every consumer.
+
+    Aggregations take a mask directly (compute_aggregates(df, rows=...)), so
+    no filtered copy of the frame is made; take() materialises a subset only
+    where a frame is really needed, such as writing it out.
+    """
+
+    def __init__(self, df, definitions=None):
+        self.df = df
+        self.definitions = QUESTION_SUBSETS if definitions is None else definitions
+        self._masks = {}
+        self._positions = {}
+
+    def mask(self, name):
+        """Boolean array selecting the subset's rows"""
+        if name not in self._masks:
+            self._masks[name] = filter_mask(self.df, self.definitions[name])
+        return self._masks[name]
+
+    def positions(self, name):
+        """Row positions of the subset, in frame order"""
+        if name not in self._positions:
+            self._positions[name] = np.flatnonzero(self.mask(name))
+        return self._positions[name]
+
+    def count(self, name):
+        """Number of rows in the subset"""
+        return len(self.positions(name))
+
+    def take(self, name, columns=None):
+        """Materialised copy of the subset, optionally of some columns only"""
+        df = self.df if columns is None else self.df[list(columns)]
+        return df.take(self.positions(name))
+
+
+def take_rows(df, mask):
+    """
+    Rows of df selected by a boolean mask as a single new frame; take()
+    never marks the result as a view, so columns can be added to it without
+    a defensive copy.
+    """
+    return df.take(np.flatnonzero(mask))
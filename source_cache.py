@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from date_parsing import parse_datetimes
+
+# Converted copies of the raw sources live here, one pickle + metadata file per source
+CACHE_DIR = '.retail_cache'
+
+# Bump when the cached layout changes so stale entries are rebuilt
+CACHE_FORMAT_VERSION = 1
+
+# Content hashes computed in this process, keyed on (path, size, mtime_ns), so
+# the stages that fingerprint the same unchanged source read it only once
+_CONTENT_HASHES = {}
+
+
+def _content_hash(path, block_size=1 << 20):
+    """SHA-256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path):
+    """
+    Identify a source file by path, size, modification time and content
+    hash; the hash is computed once per process for an unchanged file
+    """
+    stat = os.stat(path)
+    identity = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if identity not in _CONTENT_HASHES:
+        _CONTENT_HASHES[identity] = _content_hash(path)
+    return {
+        'path': identity[0],
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': _CONTENT_HASHES[identity],
+        'format_version': CACHE_FORMAT_VERSION,
+    }
+
+
+def _cache_paths(path, cache_dir):
+    """Data and metadata file locations for a source path"""
+    name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    base = os.path.join(cache_dir, f"{os.path.basename(path)}.{name}")
+    return base + '.pkl', base + '.json'
+
+
+def _read_metadata(meta_path):
+    """Cached metadata, or None when missing or unreadable"""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_metadata(meta_path, metadata):
+    """Write metadata atomically so readers never see a partial file"""
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, indent=2, default=str)
+    os.replace(tmp_path, meta_path)
+
+
+def _read_raw_source(path):
+    """Parse the original CSV or Excel source"""
+    if path.lower().endswith(('.xlsx', '.xlsm', '.xls')):
+        return pd.read_excel(path)
+    return pd.read_csv(path)
+
+
+def _parse_date_columns(df, columns):
+    """Parse the given text columns to datetime64 in place; returns the names parsed"""
+    parsed = [col for col in columns or [] if col in df.columns]
+    for col in parsed:
+        df[col] = parse_datetimes(df[col])
+    return parsed
+
+
+def _write_cached_frame(df, data_path):
+    """Pickle a frame atomically"""
+    df.to_pickle(data_path + '.tmp', protocol=5)
+    os.replace(data_path + '.tmp', data_path)
+
+
+def load_source(path, cache_dir=CACHE_DIR, use_cache=True, parse_dates=None):
+    """
+    Load a raw source file, converting it once to a pickled DataFrame.
+
+    The cached copy is reused while the source's path, size, mtime and
+    content hash are unchanged; pickle keeps the mixed int/str InvoiceNo and
+    StockCode columns exactly as the Excel parser produced them. Returns the
+    raw frame and the cache metadata (which also carries any statistics
+    recorded with record_source_stats).
+
+    parse_dates (e.g. ['InvoiceDate']) parses those text columns with the
+    fast fixed-format parser before caching, so the pickle holds them as
+    datetime64 epoch integers and later loads skip parsing entirely.
+    """
+    if not use_cache:
+        df = _read_raw_source(path)
+        _parse_date_columns(df, parse_dates)
+        return df, {'fingerprint': None, 'stats': {}}
+
+    data_path, meta_path = _cache_paths(path, cache_dir)
+    fingerprint = source_fingerprint(path)
+    metadata = _read_metadata(meta_path)
+
+    if metadata is not None and metadata.get('fingerprint') == fingerprint and os.path.exists(data_path):
+        print(f"Using cached copy of {path}")
+        df = pd.read_pickle(data_path)
+        missing = [col for col in parse_dates or [] if col not in metadata.get('parsed_dates', [])]
+        if _parse_date_columns(df, missing):
+            # Store the parsed columns once, for every later load
+            _write_cached_frame(df, data_path)
+            metadata['parsed_dates'] = metadata.get('parsed_dates', []) + missing
+            _write_metadata(meta_path, metadata)
+        return df, metadata
+
+    print(f"Converting {path} to cached binary format...")
+    df = _read_raw_source(path)
+    parsed = _parse_date_columns(df, parse_dates)
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_cached_frame(df, data_path)
+
+    metadata = {'fingerprint': fingerprint, 'parsed_dates': parsed, 'stats': {'raw_records': len(df)}}
+    _write_metadata(meta_path, metadata)
+    return df, metadata
+
+
+def record_source_stats(path, cache_dir=CACHE_DIR, **stats):
+    """Store cleaning statistics alongside the cached copy of a source"""
+    _, meta_path = _cache_paths(path, cache_dir)
+    metadata = _read_metadata(meta_path)
+    if metadata is None:
+        return
+    metadata.setdefault('stats', {}).update(stats)
+    _write_metadata(meta_path, metadata)
@@ -0,0 +1,180 @@
+import os
+
+import pandas as pd
+
+from date_parsing import parse_datetimes
+from aggregation_engine import (
+    partial_aggregates, merge_partials, finalize_partials, partial_memory_usage
+)
+from row_subsets import take_rows
+
+# Rows per chunk when no memory ceiling is given
+DEFAULT_CHUNK_ROWS = 100_000
+
+# Smallest chunk the memory ceiling is allowed to shrink to
+MIN_CHUNK_ROWS = 5_000
+
+# Working memory per raw row is several times its footprint once cleaning
+# and derived columns are applied
+CHUNK_OVERHEAD_FACTOR = 4
+
+# Chunk partials merged at a time; full batches are merged again a level up,
+# so each group is regrouped about log(chunks) times instead of once per chunk
+MERGE_FANOUT = 8
+
+# Identifier columns are read as text so every chunk agrees on their type
+SOURCE_DTYPES = {'InvoiceNo': str, 'StockCode': str, 'CustomerID': 'float64'}
+
+
+def normalise_identifiers(chunk):
+    """Cast identifier columns to the types every chunk and delta agrees on"""
+    for col, dtype in SOURCE_DTYPES.items():
+        if col not in chunk.columns:
+            continue
+        if dtype is str:
+            chunk[col] = chunk[col].map(str, na_action='ignore')
+        else:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype(dtype)
+    return chunk
+
+
+def _iter_excel_chunks(path, chunk_rows):
+    """Yield DataFrame chunks from the first worksheet without loading the workbook"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows))
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == chunk_rows:
+                yield normalise_identifiers(pd.DataFrame(buffer, columns=header))
+                buffer = []
+        if buffer:
+            yield normalise_identifiers(pd.DataFrame(buffer, columns=header))
+    finally:
+        workbook.close()
+
+
+def iter_raw_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield the raw CSV or XLSX source in fixed-size chunks"""
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        yield from _iter_excel_chunks(path, chunk_rows)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype=SOURCE_DTYPES)
+
+
+def chunk_rows_for_memory(path, memory_limit_mb, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Pick a chunk size whose working set fits in half of the memory ceiling"""
+    if memory_limit_mb is None:
+        return chunk_rows
+    sample = next(iter_raw_chunks(path, 1_000))
+    bytes_per_row = sample.memory_usage(deep=True).sum() / max(len(sample), 1)
+    budget = memory_limit_mb * 1024 ** 2 / 2
+    fitted = int(budget / (bytes_per_row * CHUNK_OVERHEAD_FACTOR))
+    return max(MIN_CHUNK_ROWS, min(chunk_rows, fitted))
+
+
+def clean_chunk(chunk):
+    """Apply the cleaning rules, parse InvoiceDate and calculate Revenue for one chunk"""
+    chunk_clean = take_rows(chunk, ((chunk['Quantity'] >= 1) & (chunk['UnitPrice'] > 0)).to_numpy())
+    chunk_clean['InvoiceDate'] = parse_datetimes(chunk_clean['InvoiceDate'])
+    chunk_clean['Revenue'] = chunk_clean['Quantity'] * chunk_clean['UnitPrice']
+    return chunk_clean
+
+
+def csv_chunk_writer(path, row_filter=None):
+    """Return an on_chunk callback that appends cleaned chunks to a CSV file"""
+    if os.path.exists(path):
+        os.remove(path)
+    written = {'header': True}
+
+    def write(chunk):
+        if row_filter is not None:
+            chunk = chunk[row_filter(chunk)]
+        chunk.to_csv(path, mode='a', header=written['header'], index=False)
+        written['header'] = False
+
+    return write
+
+
+def _push_partial(levels, partial, measure=False, fanout=MERGE_FANOUT):
+    """
+    Add a chunk's partial to a merge tree: levels[i] holds (state, bytes)
+    entries of fanout**i chunks each, oldest first, and a full level is
+    merged into one entry of the next level up. Bytes are only measured
+    when measure is set (a memory ceiling applies), else 0.
+    """
+    level = 0
+    entry = (partial, partial_memory_usage(partial) if measure else 0)
+    while True:
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(entry)
+        if len(levels[level]) < fanout:
+            return
+        merged = merge_partials([state for state, _ in levels[level]])
+        entry, levels[level] = (merged, partial_memory_usage(merged) if measure else 0), []
+        level += 1
+
+
+def _merge_levels(levels):
+    """The whole merge tree as one state; higher levels hold the older chunks"""
+    states = [state for level in reversed(levels) for state, _ in level]
+    return states[0] if len(states) == 1 else merge_partials(states)
+
+
+def stream_aggregates(path, derive=None, chunk_rows=DEFAULT_CHUNK_ROWS, memory_limit_mb=None,
+                      on_chunk=None, group_keys=None, metrics=None, attributes=None):
+    """
+    Clean the source chunk by chunk and fold each chunk into partial
+    aggregates, so only one chunk plus the aggregate state is in memory.
+    Partials are merged in batches of MERGE_FANOUT, then batches of
+    batches, so the merge work grows as chunks * log(chunks) rather than
+    with the square of the number of chunks.
+
+    derive adds the derived columns to a cleaned chunk; on_chunk receives
+    every finished chunk (or a list of callbacks), e.g. to append it to an
+    export file. Returns the finalized aggregates and ingest statistics.
+    """
+    chunk_rows = chunk_rows_for_memory(path, memory_limit_mb, chunk_rows)
+    callbacks = on_chunk if isinstance(on_chunk, (list, tuple)) else [on_chunk] if on_chunk else []
+    stats = {'raw_records': 0, 'clean_records': 0, 'chunks': 0, 'chunk_rows': chunk_rows,
+             'first_invoice': None, 'last_invoice': None}
+
+    levels = []
+    for raw in iter_raw_chunks(path, chunk_rows):
+        chunk = clean_chunk(raw)
+        if derive is not None:
+            chunk = derive(chunk)
+        for callback in callbacks:
+            callback(chunk)
+
+        stats['raw_records'] += len(raw)
+        stats['clean_records'] += len(chunk)
+        stats['chunks'] += 1
+        if len(chunk):
+            first, last = chunk['InvoiceDate'].min(), chunk['InvoiceDate'].max()
+            stats['first_invoice'] = first if stats['first_invoice'] is None else min(first, stats['first_invoice'])
+            stats['last_invoice'] = last if stats['last_invoice'] is None else max(last, stats['last_invoice'])
+
+        _push_partial(levels, partial_aggregates(chunk, group_keys, metrics, attributes),
+                      measure=memory_limit_mb is not None)
+
+        state_bytes = sum(size for level in levels for _, size in level)
+        if memory_limit_mb is not None and state_bytes > memory_limit_mb * 1024 ** 2 / 2:
+            raise MemoryError(
+                f"Aggregate state exceeds half of the {memory_limit_mb} MB memory ceiling; "
+                "raise memory_limit_mb or reduce the requested group keys"
+            )
+
+    if not levels:
+        raise ValueError(f"No records read from {path}")
+    state = _merge_levels(levels)
+
+    stats['removed_records'] = stats['raw_records'] - stats['clean_records']
+    print(f"Streamed {stats['raw_records']:,} records in {stats['chunks']} chunks "
+          f"of up to {chunk_rows:,} rows")
+    return finalize_partials(state), stats
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+# Rows generated (and written) per chunk; 50M-row sources never sit in memory at once
+DEFAULT_CHUNK_ROWS = 1_000_000
+
+# Trading period of the original data set
+START_DATE = '2010-12-01'
+END_DATE = '2011-12-09'
+
+# Share of invoices per country in the original data set (UK-dominant)
+COUNTRY_SHARES = {
+    'United Kingdom': 0.885, 'Germany': 0.023, 'France': 0.021, 'EIRE': 0.015,
+    'Spain': 0.006, 'Netherlands': 0.005, 'Belgium': 0.005, 'Switzerland': 0.004,
+    'Portugal': 0.004, 'Australia': 0.003, 'Norway': 0.003, 'Italy': 0.002,
+    'Channel Islands': 0.002, 'Finland': 0.002, 'Cyprus': 0.002, 'Sweden': 0.002,
+    'Austria': 0.001, 'Denmark': 0.001, 'Japan': 0.001, 'Poland': 0.001,
+    'USA': 0.001, 'Israel': 0.001, 'Unspecified': 0.001, 'Singapore': 0.001,
+    'Iceland': 0.001, 'Canada': 0.001, 'Greece': 0.001, 'Malta': 0.001,
+    'United Arab Emirates': 0.001, 'Lithuania': 0.001, 'Brazil': 0.001,
+}
+
+# Relative trading volume per calendar month; builds to the November peak
+MONTH_WEIGHTS = {
+    1: 0.65, 2: 0.60, 3: 0.80, 4: 0.70, 5: 0.85, 6: 0.80,
+    7: 0.80, 8: 0.85, 9: 1.15, 10: 1.30, 11: 1.60, 12: 0.80,
+}
+
+# Shape of the generated data: invoice sizes, anonymous and cancelled invoices, quantities
+MEAN_LINES_PER_INVOICE = 20
+ROWS_PER_CUSTOMER = 120
+ROWS_PER_PRODUCT = 135
+MISSING_CUSTOMER_RATE = 0.25
+CANCELLATION_RATE = 0.017
+ZERO_PRICE_RATE = 0.002
+BULK_LINE_RATE = 0.08
+
+_COLOURS = ['WHITE', 'RED', 'PINK', 'BLUE', 'GREEN', 'IVORY', 'VINTAGE', 'RETRO', 'SILVER', 'PAPER']
+_STYLES = ['HANGING', 'HEART', 'REGENCY', 'JUMBO', 'PARTY', 'CHRISTMAS', 'LUNCH', 'KNITTED', 'METAL', 'GLASS']
+_ITEMS = ['T-LIGHT HOLDER', 'LANTERN', 'CAKESTAND', 'BAG', 'BUNTING', 'MUG', 'SIGN', 'CANDLE',
+          'DOORMAT', 'NAPKINS', 'BOTTLE', 'ALARM CLOCK', 'BOX', 'CUSHION COVER', 'BOWL']
+
+
+def _trading_days(start=START_DATE, end=END_DATE):
+    """Trading days with the cumulative share of invoices up to each day"""
+    days = pd.date_range(start, end, freq='D')
+    weights = np.array(days.month.map(MONTH_WEIGHTS), dtype=float)
+    # The shop does not trade on Saturdays
+    weights[days.dayofweek == 5] = 0.0
+    return days.to_numpy(), np.cumsum(weights) / weights.sum()
+
+
+def _product_catalog(n_products, rng):
+    """Stock codes, descriptions, list prices and Zipf-like popularity of the catalogue"""
+    numbers = 10002 + rng.choice(90000, size=n_products, replace=False)
+    suffixes = np.where(rng.random(n_products) < 0.15, rng.choice(list('ABCDEFGHL'), n_products), '')
+    codes = np.char.add(numbers.astype(str), suffixes).astype(object)
+    descriptions = np.array([
+        f"{_COLOURS[c]} {_STYLES[s]} {_ITEMS[i]}"
+        for c, s, i in zip(rng.integers(0, len(_COLOURS), n_products),
+                           rng.integers(0, len(_STYLES), n_products),
+                           rng.integers(0, len(_ITEMS), n_products))
+    ], dtype=object)
+    prices = np.round(np.clip(rng.lognormal(np.log(2.5), 0.8, n_products), 0.06, 650.0), 2)
+
+    # Postage and manual adjustments appear in the original data as special codes
+    codes[:3] = ['POST', 'M', 'DOT']
+    descriptions[:3] = ['POSTAGE', 'Manual', 'DOTCOM POSTAGE']
+
+    popularity = 1.0 / np.arange(1, n_products + 1) ** 0.9
+    popularity = rng.permutation(popularity)
+    return codes, descriptions, prices, popularity / popularity.sum()
+
+
+def _customer_base(n_customers, countries, country_p, rng):
+    """Customer IDs, home country and heavy-tailed (Pareto) purchase frequency"""
+    ids = 12346.0 + np.arange(n_customers)
+    home = rng.choice(len(countries), size=n_customers, p=country_p)
+    frequency = rng.pareto(1.2, n_customers) + 1.0
+    return ids, home, frequency / frequency.sum()
+
+
+def iter_synthetic_chunks(n_rows, chunk_rows=DEFAULT_CHUNK_ROWS, seed=0):
+    """
+    Yield synthetic raw transactions in the source schema, chunk by chunk.
+
+    Invoices are generated in chronological order with increasing invoice
+    numbers; each chunk covers the next slice of the trading period, so the
+    concatenation looks like one export of the original system. Volume is
+    UK-dominant with a November peak, customers and products follow heavy
+    tails, and the dirty rows the cleaning step removes (cancellations,
+    zero prices) appear at roughly their original rates. Output is
+    reproducible for the same n_rows, chunk_rows and seed.
+    """
+    rng = np.random.default_rng(seed)
+    countries = np.array(list(COUNTRY_SHARES), dtype=object)
+    country_p = np.array(list(COUNTRY_SHARES.values()))
+    country_p = country_p / country_p.sum()
+
+    days, day_cdf = _trading_days()
+    codes, descriptions, prices, popularity = _product_catalog(max(100, n_rows // ROWS_PER_PRODUCT), rng)
+    customer_ids, customer_home, customer_p = _customer_base(
+        max(50, n_rows // ROWS_PER_CUSTOMER), countries, country_p, rng
+    )
+
+    next_invoice = 536365
+    for chunk_index in range(-(-n_rows // chunk_rows)):
+        rows = min(chunk_rows, n_rows - chunk_index * chunk_rows)
+
+        # Invoice sizes until the chunk is full; the last invoice is truncated
+        lines = rng.geometric(1.0 / MEAN_LINES_PER_INVOICE, rows // MEAN_LINES_PER_INVOICE * 2 + 16)
+        n_invoices = int(np.searchsorted(np.cumsum(lines), rows)) + 1
+        lines = lines[:n_invoices]
+        lines[-1] -= lines.sum() - rows
+
+        # Invoice timestamps within this chunk's slice of the trading period,
+        # spread over opening hours (07:30-20:00) in proportion to the day's volume
+        first_row = chunk_index * chunk_rows
+        quantiles = np.sort(rng.uniform(first_row / n_rows, (first_row + rows) / n_rows, n_invoices))
+        day_index = np.minimum(np.searchsorted(day_cdf, quantiles, side='right'), len(days) - 1)
+        day_start = np.concatenate([[0.0], day_cdf])[day_index]
+        within_day = (quantiles - day_start) / (day_cdf[day_index] - day_start)
+        minutes = (7 * 60 + 30 + np.clip(within_day, 0, 1) * 12.5 * 60).astype('timedelta64[m]')
+        invoice_dates = days[day_index] + minutes
+
+        # Known customers shop from their home country; anonymous invoices draw one
+        known = rng.random(n_invoices) >= MISSING_CUSTOMER_RATE
+        customer = rng.choice(len(customer_ids), size=n_invoices, p=customer_p)
+        invoice_customers = np.where(known, customer_ids[customer], np.nan)
+        invoice_countries = countries[np.where(known, customer_home[customer],
+                                               rng.choice(len(countries), size=n_invoices, p=country_p))]
+
+        invoice_numbers = pd.Series(np.arange(next_invoice, next_invoice + n_invoices)).astype(str)
+        cancelled = rng.random(n_invoices) < CANCELLATION_RATE
+        invoice_numbers = invoice_numbers.where(~cancelled, 'C' + invoice_numbers).to_numpy()
+        next_invoice += n_invoices
+
+        # Line items: popular products dominate, a few lines are bulk orders
+        invoice_of_line = np.repeat(np.arange(n_invoices), lines)
+        product = rng.choice(len(codes), size=rows, p=popularity)
+        quantity = rng.geometric(0.3, rows)
+        bulk = rng.random(rows) < BULK_LINE_RATE
+        quantity[bulk] *= rng.choice([12, 24, 48, 96, 144], bulk.sum())
+        quantity[cancelled[invoice_of_line]] *= -1
+        unit_price = prices[product]
+        unit_price = np.where(rng.random(rows) < ZERO_PRICE_RATE, 0.0, unit_price)
+
+        yield pd.DataFrame({
+            'InvoiceNo': invoice_numbers[invoice_of_line],
+            'StockCode': codes[product],
+            'Description': descriptions[product],
+            'Quantity': quantity,
+            'InvoiceDate': invoice_dates[invoice_of_line],
+            'UnitPrice': unit_price,
+            'CustomerID': invoice_customers[invoice_of_line],
+            'Country': invoice_countries[invoice_of_line],
+        })
+
+
+def generate_synthetic_transactions(n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Synthetic raw transactions as one DataFrame"""
+    return pd.concat(iter_synthetic_chunks(n_rows, chunk_rows, seed), ignore_index=True)
+
+
+def write_synthetic_source(path, n_rows, seed=0, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write a synthetic raw CSV in the source layout chunk by chunk; returns the path"""
+    for i, chunk in enumerate(iter_synthetic_chunks(n_rows, chunk_rows, seed)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    path = sys.argv[2] if len(sys.argv) > 2 else 'synthetic_retail_data.csv'
+    print(f"Writing {n_rows:,} synthetic transactions to {path}...")
+    write_synthetic_source(path, n_rows)
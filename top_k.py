@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+
+def top_k_positions(values, k):
+    """
+    Positions of the k largest values, largest first, ties in position
+    order and NaN never selected (the order DataFrame.nlargest(keep='first')
+    returns). Only the candidates at or above the k-th largest value are
+    sorted; everything else is discarded by a linear-time partition.
+    """
+    values = np.asarray(values)
+    positions = np.flatnonzero(~pd.isna(values))
+    if k <= 0 or not len(positions):
+        return positions[:0]
+    if k < len(positions):
+        valid = values[positions]
+        threshold = np.partition(valid, len(valid) - k)[len(valid) - k]
+        above = positions[valid > threshold]
+        ties = positions[valid == threshold][:k - len(above)]
+        positions = np.sort(np.concatenate([above, ties]))
+    # Candidates are in position order, so a stable sort on the negated values keeps ties in that order
+    return positions[np.argsort(-values[positions], kind='stable')]
+
+
+def top_k(table, k, column):
+    """Rows of table with the k largest values of column; same rows and order as table.nlargest(k, column)"""
+    return table.iloc[top_k_positions(table[column].to_numpy(), k)]
+
+
+def top_k_groups(df, key, value, k, rows=None):
+    """
+    Top k groups of key by the sum of value, straight from the row-level
+    frame: only that one column is summed per group (on the same sorted key
+    codes compute_aggregates groups on, so the sums match its Total_*
+    columns) and only the k winners are ordered. rows (a boolean mask)
+    restricts the scan to a subset. Returns a frame of key, value and Rank.
+    """
+    codes, keys = pd.factorize(df[key], sort=True)
+    if rows is not None:
+        codes = np.where(np.asarray(rows, dtype=bool), codes, -1)
+    grouper = pd.Categorical.from_codes(codes, categories=pd.RangeIndex(len(keys)))
+    sums = df[value].groupby(grouper, observed=False).sum().to_numpy()
+    if rows is not None:
+        # Groups without selected rows have no sum to rank
+        present = np.bincount(codes[codes >= 0], minlength=len(keys)) > 0
+        sums = np.where(present, sums, np.nan)
+    winners = top_k_positions(sums, k)
+    return pd.DataFrame({key: keys.take(winners), value: sums[winners], 'Rank': np.arange(1, len(winners) + 1)})
+
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving summary of heavy hitters over a stream of chunks.
+
+    At most capacity keys are tracked. Each one keeps an overestimate of
+    its total and the largest possible overestimation, so its true total
+    lies in [estimate - error, estimate]; any key not tracked totals at most
+    floor. Summaries of different chunks or partitions merge with merge(),
+    so it works over streaming and partitioned inputs alike.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.estimates = pd.Series(dtype=np.float64)
+        self.errors = pd.Series(dtype=np.float64)
+        self.floor = 0.0
+
+    def update(self, keys, weights):
+        """Fold one chunk in: its keys are summed exactly, then merged like a summary with no error"""
+        # Rows with a missing key are dropped, as groupby does
+        totals = pd.Series(np.asarray(weights, dtype=np.float64)).groupby(np.asarray(keys)).sum()
+        self._combine(totals, pd.Series(0.0, index=totals.index), 0.0)
+        return self
+
+    def merge(self, other):
+        """Fold in the summary of another chunk or partition"""
+        self._combine(other.estimates, other.errors, other.floor)
+        return self
+
+    def _combine(self, estimates, errors, floor):
+        """
+        Union of two summaries. A key missing from one side may still total
+        up to that side's floor there, which is added to its estimate and its
+        error; keys beyond capacity are evicted and raise the floor.
+        """
+        index = self.estimates.index.union(estimates.index)
+        combined = (self.estimates.reindex(index, fill_value=self.floor)
+                    + estimates.reindex(index, fill_value=floor))
+        combined_errors = (self.errors.reindex(index, fill_value=self.floor)
+                           + errors.reindex(index, fill_value=floor))
+        kept = top_k_positions(combined.to_numpy(), self.capacity)
+        evicted = np.delete(combined.to_numpy(), kept)
+        self.floor = max(self.floor + floor, evicted.max() if len(evicted) else 0.0)
+        self.estimates = combined.iloc[kept]
+        self.errors = combined_errors.iloc[kept]
+
+    def top(self, k):
+        """
+        The k keys with the largest estimates, with their bounds. guaranteed
+        marks keys that are certainly among the true top k: their lower
+        bound is at least the estimate of every key ranked below k.
+        """
+        winners = self.estimates.iloc[:k]
+        lower = winners - self.errors.iloc[:k]
+        runner_up = max(self.estimates.iloc[k] if len(self.estimates) > k else 0.0, self.floor)
+        return pd.DataFrame({
+            'Key': winners.index,
+            'Estimate': winners.to_numpy(),
+            'Lower_Bound': lower.to_numpy(),
+            'Guaranteed': (lower >= runner_up).to_numpy(),
+            'Rank': np.arange(1, len(winners) + 1),
+        })
+
+
+def top_k_chunks(chunks, key, value, k, capacity=None):
+    """
+    Top k groups of key by the sum of value over an iterable of frames
+    (streamed chunks or partitions). Without capacity the per-key sums are
+    kept exactly (memory grows with the number of keys) and the result is
+    exact; with capacity a SpaceSaving summary of that many keys is kept
+    and the result carries error bounds. Returns a frame of key, value and
+    Rank (plus Lower_Bound and Guaranteed when approximate).
+    """
+    if capacity is not None:
+        summary = SpaceSaving(capacity)
+        for chunk in chunks:
+            summary.update(chunk[key], chunk[value])
+        return summary.top(k).rename(columns={'Key': key, 'Estimate': value})
+
+    totals = None
+    for chunk in chunks:
+        sums = chunk[value].groupby(chunk[key], sort=False, observed=True).sum()
+        totals = sums if totals is None else totals.add(sums, fill_value=0)
+    if totals is None:
+        return pd.DataFrame({key: [], value: [], 'Rank': []})
+    totals = totals.sort_index()
+    winners = top_k_positions(totals.to_numpy(), k)
+    return pd.DataFrame({key: totals.index.take(winners), value: totals.to_numpy()[winners],
+                         'Rank': np.arange(1, len(winners) + 1)})